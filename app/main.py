@@ -1,27 +1,120 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, BackgroundTasks, WebSocket, WebSocketDisconnect, Request
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Header, Query, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from app.services.ai_service import ai_service
 from app.services.email_processor import email_processor
+from app.services.http_client import http_client
+from app.services.job_store import job_store
+from app.services.job_events import job_events
+from app.utils.file_utils import MAX_UPLOAD_BYTES, SpooledUpload, UploadTooLargeError, UploadLimitMiddleware, spool_upload
+from app.services.job_queue import job_scheduler, QueueFullError, FAST_LANE, BULK_LANE
+from app.services.rate_limiter import rate_limiter
+from app.services.keyword_rules import keyword_rules
+from app.utils.metrics import metrics, STAGE_SECONDS, JOBS_FINISHED
+from app.utils.tracing import start_trace, end_trace, span, annotate
+from app.utils.deadline import start_deadline, end_deadline, current_deadline
+from app.utils.profiler import sampling_profiler, loop_lag_monitor
+from contextlib import asynccontextmanager
 import logging
 import io
+import hmac
 import inspect
+import math
 import uuid
 import asyncio
-from typing import Dict, Optional
+from typing import List, Optional, Union
 from enum import Enum
 import uvicorn
-import time
-import asyncio
+import json
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-request_timestamps = {}
-app = FastAPI(title="Email Classifier API", version="1.0.0")
+RATE_LIMIT_TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+FEEDBACK_TOKEN = os.getenv('FEEDBACK_TOKEN')
+PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', '60'))
+INTERNAL_JOB_FIELDS = ("trace", "created_at", "deadline_seconds")
+BATCH_CONCURRENCY = int(os.getenv('CLASSIFY_BATCH_CONCURRENCY', '8'))
+BATCH_MAX_LINE_BYTES = int(os.getenv('CLASSIFY_BATCH_MAX_LINE_BYTES', '1000000'))
+FAST_LANE_MAX_BYTES = int(os.getenv('FAST_LANE_MAX_BYTES', '65536'))
+SYNC_MAX_CHARS = int(os.getenv('SYNC_MAX_CHARS', '4000'))
+SYNC_DEADLINE_SECONDS = float(os.getenv('SYNC_DEADLINE_SECONDS', '5'))
+SYNC_MAX_INFLIGHT = int(os.getenv('SYNC_MAX_INFLIGHT', str(job_scheduler.workers)))
+JOB_DEADLINE_SECONDS = float(os.getenv('JOB_DEADLINE_SECONDS', '30'))
+JOB_DEADLINE_MAX_SECONDS = float(os.getenv('JOB_DEADLINE_MAX_SECONDS', '120'))
+JOB_EVENTS_POLL_SECONDS = float(os.getenv('JOB_EVENTS_POLL_SECONDS', '2'))
+JOB_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('JOB_EVENTS_HEARTBEAT_SECONDS', '15'))
+JOB_EVENTS_IDLE_TIMEOUT = float(os.getenv('JOB_EVENTS_IDLE_TIMEOUT', '300'))
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'false').lower() == 'true'
+PDF_POOL_WARMUP = os.getenv('PDF_POOL_WARMUP', 'true').lower() == 'true'
+STARTUP_STATS = {"import_seconds": time.perf_counter() - _IMPORT_STARTED}
+
+def _memory_usage() -> dict:
+    """RSS, PSS e páginas compartilhadas/privadas do processo atual, em MB"""
+    try:
+        # smaps_rollup conta também as páginas anônimas compartilhadas via copy-on-write
+        fields = {}
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+        return {
+            "rss_mb": round(fields["Rss"], 1),
+            "pss_mb": round(fields["Pss"], 1),
+            "shared_mb": round(fields["Shared_Clean"] + fields["Shared_Dirty"], 1),
+            "private_mb": round(fields["Private_Clean"] + fields["Private_Dirty"], 1)
+        }
+    except (OSError, KeyError, ValueError):
+        import resource
+        return {"rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+if PRELOAD_MODELS:
+    # Com preload do gunicorn o modelo é carregado uma vez no master e compartilhado pelos workers
+    STARTUP_STATS["preload"] = ai_service.warmup()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    STARTUP_STATS["warmup"] = ai_service.warmup()
+    if PDF_POOL_WARMUP:
+        try:
+            STARTUP_STATS["pdf_workers"] = await email_processor.warm_pdf_pool()
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao aquecer o pool de PDF: {e}")
+    STARTUP_STATS["warmup_seconds"] = time.perf_counter() - started
+    STARTUP_STATS.update(_memory_usage())
+    logger.info(
+        f"🔥 Worker {os.getpid()} pronto: import {STARTUP_STATS['import_seconds']:.2f}s, "
+        f"warmup {STARTUP_STATS['warmup_seconds']:.2f}s, RSS {STARTUP_STATS['rss_mb']} MB"
+    )
+    job_scheduler.start()
+    loop_lag_monitor.start()
+    if ai_service.classifier.ml_backend == "online":
+        # Treina (se for o dono do lock) ou recarrega as versões publicadas por outro worker
+        ai_service.classifier.online_learner.start()
+    yield
+    await ai_service.classifier.online_learner.stop()
+    await loop_lag_monitor.stop()
+    await job_scheduler.stop()
+    email_processor.shutdown()
+    await http_client.close()
+    job_store.close()
+    if rate_limiter:
+        rate_limiter.close()
+
+app = FastAPI(title="Email Classifier API", version="1.0.0", lifespan=lifespan)
 
+# Folga para os cabeçalhos do multipart, como na checagem do Content-Length
+# (registrado antes do CORS para que o 413 também leve os cabeçalhos de CORS)
+app.add_middleware(UploadLimitMiddleware, paths=("/classify-email",), max_bytes=MAX_UPLOAD_BYTES + 64 * 1024)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[os.getenv('FRONTEND_URL')],
@@ -58,35 +151,143 @@ class JobStatusResponse(BaseModel):
     result: Optional[dict] = None
     error: Optional[str] = None
 
+class FeedbackRequest(BaseModel):
+    text: str
+    category: str
+
+class RollbackRequest(BaseModel):
+    version: int
+
 class EmailResponse(BaseModel):
     category: str
     suggested_response: str
     confidence: float
     processed_text: str
     original_length: int
+    degradations: List[dict] = []
+
+def _public_job(job: dict) -> dict:
+    """Estado do job sem campos internos (trace de debug, timestamps)"""
+    return {key: value for key, value in job.items() if key not in INTERNAL_JOB_FIELDS}
 
-jobs_storage: Dict[str, dict] = {}
-
-async def update_job_status(job_id: str, status: JobStatus, progress: int, message: str, result: dict = None, error: str = None):
-    if job_id in jobs_storage:
-        jobs_storage[job_id].update({
-            "status": status,
-            "progress": progress,
-            "current_step": message,
-            "message": message,
-            "result": result,
-            "error": error
-        })
+async def update_job_status(job_id: str, status: JobStatus, progress: int, message: str, result: dict = None, error: str = None,
+                            trace: dict = None):
+    fields = {
+        "status": status,
+        "progress": progress,
+        "current_step": message,
+        "message": message,
+        "result": result,
+        "error": error
+    }
+    if trace is not None:
+        fields["trace"] = trace
+    job = job_store.update(job_id, fields)
+    if job is not None:
+        job_events.publish(job_id, _public_job(job))
         logger.info(f"📊 Job {job_id[:8]}: {status} - {message} ({progress}%)")
 
-async def process_email_job(job_id: str, file_content: bytes = None, file_info: dict = None, text_content: str = None):
+def publish_partial_response(job_id: str, text: str):
+    """Grava o texto parcial da resposta no job e notifica os assinantes (WS/SSE enviam o delta)"""
+    job = job_store.update(job_id, {"partial_response": text})
+    if job is not None:
+        job_events.publish(job_id, _public_job(job))
+
+async def _maybe_call(func, *args, **kwargs):
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    else:
+        result = func(*args, **kwargs)
+        if inspect.isawaitable(result):
+            return await result
+        return result
+
+def _unpack_classification(classification):
+    if isinstance(classification, tuple) and len(classification) == 2:
+        return classification
+    elif isinstance(classification, dict):
+        return classification.get("category"), classification.get("confidence")
+    else:
+        return classification, None
+
+def _build_result(category: str, suggested_response: str, confidence, clean_text: str, original_length: int = None) -> dict:
+    deadline = current_deadline()
+    return {
+        "category": category,
+        "suggested_response": suggested_response,
+        "confidence": confidence,
+        "processed_text": clean_text[:100] + "..." if len(clean_text) > 100 else clean_text,
+        "original_length": original_length if original_length is not None else len(clean_text),
+        "degradations": list(deadline.degradations) if deadline else []
+    }
+
+async def _run_pipeline(clean_text: str, report=None, on_delta=None, deadline_seconds: float = None) -> dict:
+    """Classifica e gera a resposta; report(status, progress, message) recebe o progresso
+    e on_delta(trecho) os trechos da resposta gerada em streaming"""
+    if current_deadline() is not None:
+        return await _run_stages(clean_text, report, on_delta)
+    
+    # Modo síncrono e lotes não passam por process_email_job: o prazo começa aqui
+    start_deadline(deadline_seconds or JOB_DEADLINE_SECONDS)
+    try:
+        return await _run_stages(clean_text, report, on_delta)
+    finally:
+        end_deadline()
+
+async def _run_stages(clean_text: str, report=None, on_delta=None) -> dict:
+    async def _report(status: JobStatus, progress: int, message: str):
+        if report is not None:
+            await report(status, progress, message)
+    
+    if not clean_text or len(clean_text.strip()) < 5:
+        raise ValueError("Texto muito curto ou vazio")
+    
+    # Remove citações, assinaturas e avisos antes de enviar aos modelos
+    original_length = len(clean_text)
+    started = time.perf_counter()
+    with span("preprocessing", chars=original_length):
+        clean_text = email_processor.clean_text(clean_text)
+        annotate(output_chars=len(clean_text))
+    STAGE_SECONDS.observe(time.perf_counter() - started, "preprocessing", "rules")
+    
+    await _report(JobStatus.CLASSIFYING, 50, "Classificando email com IA...")
+    
+    await _report(JobStatus.CLASSIFYING, 60, "Processando com modelo de IA...")
+    
+    with span("classification", chars=len(clean_text)):
+        classification = await _maybe_call(ai_service.classify_email, clean_text)
+        category, confidence = _unpack_classification(classification)
+        annotate(category=category, confidence=confidence)
+    
+    await _report(JobStatus.CLASSIFYING, 70, "Classificação concluída!")
+    
+    await _report(JobStatus.GENERATING_RESPONSE, 80, "Gerando resposta sugerida...")
+    
+    with span("generation", category=category):
+        if on_delta is not None:
+            suggested_response = await _maybe_call(ai_service.generate_response, category, clean_text, on_delta=on_delta)
+        else:
+            suggested_response = await _maybe_call(ai_service.generate_response, category, clean_text)
+        annotate(response_chars=len(suggested_response or ""))
+    
+    await _report(JobStatus.GENERATING_RESPONSE, 95, "Finalizando processamento...")
+    
+    return _build_result(category, suggested_response, confidence, clean_text, original_length)
+
+async def process_email_job(job_id: str, upload: SpooledUpload = None, file_info: dict = None, text_content: str = None):
+    job = job_store.get(job_id) or {}
+    trace = start_trace(job_id, job.get("created_at"))
+    if job.get("created_at"):
+        trace.add_span("queue", 0.0, trace.to_dict()["total_ms"])
+    # O tempo na fila já conta contra o prazo
+    start_deadline(job.get("deadline_seconds") or JOB_DEADLINE_SECONDS, job.get("created_at"))
     try:
         logger.info(f"🚀 Iniciando job {job_id[:8]}")
         await update_job_status(job_id, JobStatus.PROCESSING, 10, "Iniciando processamento...")
         
         clean_text = ""
         
-        if file_content is not None:
+        if upload is not None:
             await update_job_status(job_id, JobStatus.EXTRACTING_TEXT, 20, f"Extraindo texto do arquivo...")
             
             content_type = file_info.get("content_type", "").lower()
@@ -98,106 +299,145 @@ async def process_email_job(job_id: str, file_content: bytes = None, file_info:
             if not (is_pdf or is_txt):
                 raise Exception("Apenas arquivos .txt ou .pdf são permitidos")
             
-            await asyncio.sleep(0.2)
-            
             if is_pdf:
                 extractor = getattr(email_processor, "extract_text_from_pdf")
             else:
                 extractor = getattr(email_processor, "extract_text_from_txt")
             
-            result = extractor(file_content)
-            if inspect.isawaitable(result):
-                clean_text = await result
-            else:
-                clean_text = result
+            started = time.perf_counter()
+            with span("extraction", backend="pdf" if is_pdf else "txt", bytes=upload.size):
+                result = extractor(upload)
+                if inspect.isawaitable(result):
+                    clean_text = await result
+                else:
+                    clean_text = result
+                annotate(chars=len(clean_text))
+            STAGE_SECONDS.observe(time.perf_counter() - started, "extraction", "pdf" if is_pdf else "txt")
                 
             await update_job_status(job_id, JobStatus.EXTRACTING_TEXT, 40, f"Texto extraído: {len(clean_text)} caracteres")
         else:
             clean_text = text_content
             await update_job_status(job_id, JobStatus.PROCESSING, 30, f"Texto recebido: {len(clean_text)} caracteres")
         
-        if not clean_text or len(clean_text.strip()) < 5:
-            raise Exception("Texto muito curto ou vazio")
-        
-        await asyncio.sleep(0.2)
-        
-        await update_job_status(job_id, JobStatus.CLASSIFYING, 50, "Classificando email com IA...")
+        async def report(status: JobStatus, progress: int, message: str):
+            await update_job_status(job_id, status, progress, message)
         
-        async def _maybe_call(func, *args, **kwargs):
-            if inspect.iscoroutinefunction(func):
-                return await func(*args, **kwargs)
-            else:
-                await asyncio.sleep(0.1)
-                result = func(*args, **kwargs)
-                if inspect.isawaitable(result):
-                    return await result
-                return result
-        
-        await update_job_status(job_id, JobStatus.CLASSIFYING, 60, "Processando com modelo de IA...")
-        
-        classification = await _maybe_call(ai_service.classify_email, clean_text)
+        streamed = []
+        def on_delta(delta: str, reset: bool = False):
+            # reset: o texto substitui o parcial (WS/SSE enviam um delta com "reset": true)
+            if reset:
+                streamed.clear()
+            streamed.append(delta)
+            publish_partial_response(job_id, "".join(streamed))
         
-        await update_job_status(job_id, JobStatus.CLASSIFYING, 70, "Classificação concluída!")
+        result = await _run_pipeline(clean_text, report, on_delta)
         
-        if isinstance(classification, tuple) and len(classification) == 2:
-            category, confidence = classification
-        elif isinstance(classification, dict):
-            category = classification.get("category")
-            confidence = classification.get("confidence")
-        else:
-            category = classification
-            confidence = None
-        
-        await update_job_status(job_id, JobStatus.GENERATING_RESPONSE, 80, "Gerando resposta sugerida...")
-        
-        await asyncio.sleep(0.1)
-        
-        suggested_response = await _maybe_call(ai_service.generate_response, category, clean_text)
-        
-        await update_job_status(job_id, JobStatus.GENERATING_RESPONSE, 95, "Finalizando processamento...")
-        
-        result = {
-            "category": category,
-            "suggested_response": suggested_response,
-            "confidence": confidence,
-            "processed_text": clean_text[:100] + "..." if len(clean_text) > 100 else clean_text,
-            "original_length": len(clean_text)
-        }
-        
-        await update_job_status(job_id, JobStatus.COMPLETED, 100, "Processamento concluído!", result=result)
+        await update_job_status(job_id, JobStatus.COMPLETED, 100, "Processamento concluído!", result=result,
+                                trace=trace.to_dict())
+        JOBS_FINISHED.inc("completed")
         logger.info(f"✅ Job {job_id[:8]} concluído com sucesso!")
         
     except Exception as e:
         error_msg = str(e)
+        JOBS_FINISHED.inc("failed")
         logger.exception(f"💥 Erro no job {job_id[:8]}: {error_msg}")
-        await update_job_status(job_id, JobStatus.FAILED, 0, "Erro no processamento", error=error_msg)
+        await update_job_status(job_id, JobStatus.FAILED, 0, "Erro no processamento", error=error_msg,
+                                trace=trace.to_dict())
+    finally:
+        end_trace()
+        end_deadline()
+        if upload is not None:
+            upload.close()
 
-@app.post("/classify-email", response_model=JobResponse)
+def _select_lane(upload: SpooledUpload, file_info: dict, text_content: str) -> str:
+    """Textos curtos vão para a lane rápida; PDFs e arquivos grandes para a pesada"""
+    if upload is None:
+        return FAST_LANE if len(text_content) <= FAST_LANE_MAX_BYTES else BULK_LANE
+    
+    is_pdf = "pdf" in (file_info.get("content_type") or "").lower() or (file_info.get("filename") or "").lower().endswith(".pdf")
+    return BULK_LANE if is_pdf or upload.size > FAST_LANE_MAX_BYTES else FAST_LANE
+
+_adopted_tasks = set()
+
+def _wants_sync(mode: Optional[str], prefer: Optional[str]) -> bool:
+    if mode:
+        return mode.lower() == "sync"
+    return bool(prefer) and "wait" in prefer.lower()
+
+def _new_job(job_id: str, status: JobStatus = JobStatus.PENDING, message: str = "Processamento iniciado") -> dict:
+    return {
+        "job_id": job_id,
+        "status": status,
+        "progress": 0,
+        "current_step": "Job criado",
+        "message": message,
+        "result": None,
+        "error": None,
+        "created_at": time.time()
+    }
+
+# Processamentos síncronos simultâneos; com todos ocupados, o pedido vira job no scheduler
+_sync_slots = asyncio.Semaphore(SYNC_MAX_INFLIGHT)
+
+async def _classify_sync(text_content: str, deadline_seconds: float = None):
+    """Processa inline; se passar do prazo, o trabalho segue como job assíncrono"""
+    await _sync_slots.acquire()
+    task = asyncio.create_task(_run_pipeline(text_content, deadline_seconds=deadline_seconds))
+    # O slot fica ocupado até o pipeline terminar, mesmo se ele seguir em segundo plano
+    task.add_done_callback(lambda _: _sync_slots.release())
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task), SYNC_DEADLINE_SECONDS)
+        return EmailResponse(**result)
+    except asyncio.TimeoutError:
+        pass
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.exception("Erro no processamento síncrono")
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+    
+    job_id = str(uuid.uuid4())
+    job_store.create(job_id, _new_job(job_id, JobStatus.CLASSIFYING, "Prazo síncrono excedido, processamento continua em segundo plano"))
+    
+    async def _finish():
+        try:
+            result = await task
+            await update_job_status(job_id, JobStatus.COMPLETED, 100, "Processamento concluído!", result=result)
+        except Exception as e:
+            logger.exception(f"💥 Erro no job {job_id[:8]}: {e}")
+            await update_job_status(job_id, JobStatus.FAILED, 0, "Erro no processamento", error=str(e))
+    
+    finisher = asyncio.create_task(_finish())
+    _adopted_tasks.add(finisher)
+    finisher.add_done_callback(_adopted_tasks.discard)
+    
+    logger.info(f"⏳ Modo síncrono excedeu {SYNC_DEADLINE_SECONDS}s, job {job_id[:8]} criado")
+    return JSONResponse(
+        status_code=202,
+        content=JobResponse(
+            job_id=job_id,
+            status=JobStatus.CLASSIFYING,
+            message="Prazo síncrono excedido. Use o job_id para verificar o status."
+        ).model_dump(mode="json")
+    )
+
+@app.post("/classify-email", response_model=Union[EmailResponse, JobResponse])
 async def classify_email(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(None),
     text: str = Form(None),
-    request: EmailRequest = Body(None)
+    request: EmailRequest = Body(None),
+    mode: Optional[str] = Query(None, description="sync para resposta imediata em textos curtos"),
+    prefer: Optional[str] = Header(None),
+    deadline_ms: Optional[int] = Query(None, gt=0, description="prazo do job em ms; ao se aproximar, usa backends mais rápidos")
 ):
+    upload = None
     try:
-        job_id = str(uuid.uuid4())
-        
-        jobs_storage[job_id] = {
-            "job_id": job_id,
-            "status": JobStatus.PENDING,
-            "progress": 0,
-            "current_step": "Job criado",
-            "message": "Processamento iniciado",
-            "result": None,
-            "error": None
-        }
-        
-        file_content = None
+        deadline_seconds = min(deadline_ms / 1000, JOB_DEADLINE_MAX_SECONDS) if deadline_ms else None
         file_info = None
         text_content = None
         
         if file is not None:
-            file_content = await file.read()
+            upload = await spool_upload(file, MAX_UPLOAD_BYTES)
             file_info = {
                 "filename": file.filename,
                 "content_type": file.content_type
@@ -209,15 +449,39 @@ async def classify_email(
         else:
             raise HTTPException(status_code=400, detail="Forneça um arquivo ou texto para classificação")
         
-        background_tasks.add_task(
-            process_email_job,
-            job_id=job_id,
-            file_content=file_content,
-            file_info=file_info,
-            text_content=text_content
-        )
+        if text_content is not None and len(text_content) <= SYNC_MAX_CHARS and _wants_sync(mode, prefer):
+            if not _sync_slots.locked():
+                return await _classify_sync(text_content, deadline_seconds)
+            logger.info("⏳ Modo síncrono no limite de concorrência, processando como job")
+        
+        job_id = str(uuid.uuid4())
         
-        logger.info(f"🎯 Job {job_id[:8]} criado e adicionado à fila")
+        job = _new_job(job_id)
+        if deadline_seconds:
+            job["deadline_seconds"] = deadline_seconds
+        job_store.create(job_id, job)
+        
+        lane = _select_lane(upload, file_info, text_content)
+        try:
+            await job_scheduler.submit(
+                lane,
+                process_email_job,
+                job_id=job_id,
+                upload=upload,
+                file_info=file_info,
+                text_content=text_content
+            )
+        except QueueFullError as e:
+            job_store.delete(job_id)
+            logger.warning(f"⚠️ Fila {e.lane} cheia, job recusado")
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor ocupado, tente novamente mais tarde",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        
+        upload = None
+        logger.info(f"🎯 Job {job_id[:8]} criado e adicionado à fila {lane}")
         
         return JobResponse(
             job_id=job_id,
@@ -225,41 +489,175 @@ async def classify_email(
             message="Job criado com sucesso. Use o job_id para verificar o status."
         )
         
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("Erro ao criar job")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+    finally:
+        # Se o job não foi enfileirado, o arquivo temporário é descartado aqui
+        if upload is not None:
+            upload.close()
 
-@app.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
-    client_ip = request.client.host
-    endpoint = request.url.path
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse que não consome o receive() enquanto o corpo da requisição ainda está sendo lido"""
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _iter_ndjson_lines(request: Request):
+    """Lê o corpo em streaming e produz (número da linha, bytes) sem acumular o lote inteiro"""
+    buffer = b""
+    line_no = 0
+    skipping = False
     
-    if "/job-status/" in endpoint:
-        current_time = time.time()
-        key = f"{client_ip}:{endpoint}"
+    async for chunk in request.stream():
+        buffer += chunk
+        while True:
+            newline = buffer.find(b"\n")
+            if newline < 0:
+                break
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+            if skipping:
+                # Fim de uma linha grande demais, já contada (e reportada) ao estourar o limite
+                skipping = False
+                continue
+            line_no += 1
+            if line.strip():
+                yield line_no, line
         
-        if key in request_timestamps:
-            last_request = request_timestamps[key]
-            if current_time - last_request < 0.5:
-                logger.warning(f"⚠️  Rate limit exceeded for {client_ip} on {endpoint}")
-                
-        request_timestamps[key] = current_time
+        if len(buffer) > BATCH_MAX_LINE_BYTES and not skipping:
+            line_no += 1
+            yield line_no, None
+            skipping = True
+        if skipping:
+            buffer = b""
     
-    response = await call_next(request)
-    return response
+    if buffer.strip() and not skipping:
+        yield line_no + 1, buffer
+
+def _item_text(item: dict) -> str:
+    if item.get("text"):
+        return str(item["text"]).strip()
+    
+    subject = item.get("subject") or item.get("title")
+    parts = [str(part).strip() for part in (subject, item.get("body")) if part]
+    return "\n\n".join(parts)
+
+async def _process_batch_item(line_no: int, raw: bytes) -> dict:
+    item_id = line_no
+    try:
+        if raw is None:
+            raise ValueError(f"Linha excede o limite de {BATCH_MAX_LINE_BYTES} bytes")
+        
+        item = json.loads(raw)
+        if not isinstance(item, dict):
+            raise ValueError("Cada linha deve ser um objeto JSON")
+        
+        item_id = item.get("id", item.get("request_id", line_no))
+        result = await _run_pipeline(_item_text(item))
+        
+        return {"id": item_id, "status": JobStatus.COMPLETED.value, "result": result}
+    except Exception as e:
+        logger.warning(f"⚠️ Item {item_id} do lote falhou: {e}")
+        return {"id": item_id, "status": JobStatus.FAILED.value, "error": str(e)}
+
+def _encode_ndjson(payload: dict) -> bytes:
+    return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def _stream_batch_results(request: Request, concurrency: int):
+    """Processa itens com concorrência limitada e emite resultados na ordem de conclusão"""
+    results = asyncio.Queue(maxsize=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+    started = time.perf_counter()
+    
+    async def run_item(line_no: int, raw: bytes):
+        try:
+            await results.put(await _process_batch_item(line_no, raw))
+        finally:
+            slots.release()
+    
+    async def feed():
+        total = 0
+        try:
+            async for line_no, raw in _iter_ndjson_lines(request):
+                await slots.acquire()
+                task = asyncio.create_task(run_item(line_no, raw))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                total += 1
+            await asyncio.gather(*list(tasks))
+            logger.info(f"📦 Lote concluído: {total} itens em {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"❌ Erro ao ler lote: {e}")
+            await results.put({"id": None, "status": JobStatus.FAILED.value, "error": f"Erro ao ler lote: {e}"})
+        finally:
+            await results.put(None)
+    
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            payload = await results.get()
+            if payload is None:
+                break
+            yield _encode_ndjson(payload)
+    finally:
+        feeder.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+@app.post("/classify-batch")
+async def classify_batch(request: Request, concurrency: int = BATCH_CONCURRENCY):
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY))
+    return NDJSONStreamingResponse(_stream_batch_results(request, concurrency))
+
+def _rate_limit_group(request: Request) -> Optional[str]:
+    path = request.url.path
+    if request.method == "POST" and path in ("/classify-email", "/classify-batch"):
+        return "classify"
+    if request.method == "GET" and path.startswith("/job-status/"):
+        return "job_status"
+    return None
+
+def _client_id(request: Request) -> str:
+    # Atrás de proxy (Railway) o IP do socket é o do proxy
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+@app.middleware("http")
+async def rate_limit_middleware(request: Request, call_next):
+    group = _rate_limit_group(request) if rate_limiter else None
+    if group:
+        client = _client_id(request)
+        retry_after = rate_limiter.acquire(group, client)
+        if retry_after:
+            logger.warning(f"⚠️  Rate limit excedido para {client} em {group}")
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Muitas requisições. Tente novamente em instantes."},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+    
+    return await call_next(request)
 
 @app.get("/job-status/{job_id}", response_model=JobStatusResponse)
-async def get_job_status(job_id: str):
-    if job_id not in jobs_storage:
+async def get_job_status(job_id: str, debug: bool = Query(False, description="Inclui o trace por etapa do job")):
+    job_data = job_store.get(job_id)
+    if job_data is None:
         raise HTTPException(status_code=404, detail="Job não encontrado")
     
-    job_data = jobs_storage[job_id]
-    
     logger.info(f"📋 Status requisitado para job {job_id[:8]}: {job_data['status']} ({job_data['progress']}%)")
     
-    return JobStatusResponse(
+    response = JobStatusResponse(
         job_id=job_id,
         status=job_data["status"],
         progress=job_data["progress"],
@@ -268,46 +666,155 @@ async def get_job_status(job_id: str):
         result=job_data["result"],
         error=job_data["error"]
     )
+    if debug:
+        return JSONResponse({**response.model_dump(mode="json"), "trace": job_data.get("trace")})
+    return response
 
-from fastapi import WebSocket, WebSocketDisconnect
-import asyncio
+async def _job_updates(job_id: str):
+    """Emite ("status", job) quando o estado muda e ("delta", trecho) quando a resposta
+    parcial cresce; None sinaliza um tick sem mudanças.
+
+    Mudanças deste worker chegam pelo job_events na hora; as de outros workers
+    (job store compartilhado) são percebidas relendo o store a cada poll. Como
+    só o último estado é guardado, o delta é calculado contra o texto já enviado.
+    """
+    loop = asyncio.get_running_loop()
+    subscription = job_events.subscribe(job_id)
+    try:
+        last_sent = None
+        sent_partial = ""
+        last_change = loop.time()
+        job_data = job_store.get(job_id)
+        
+        while True:
+            changed = False
+            if job_data is not None:
+                job_data = _public_job(job_data)
+                partial = job_data.pop("partial_response", None) or ""
+                if partial != sent_partial:
+                    if partial.startswith(sent_partial):
+                        delta = {"job_id": job_id, "delta": partial[len(sent_partial):], "offset": len(sent_partial)}
+                    else:
+                        delta = {"job_id": job_id, "delta": partial, "offset": 0, "reset": True}
+                    sent_partial = partial
+                    changed = True
+                    yield "delta", delta
+            if job_data is not None and job_data != last_sent:
+                last_sent = job_data
+                changed = True
+                yield "status", last_sent
+                
+                if last_sent["status"] in ["completed", "failed"]:
+                    return
+            if changed:
+                last_change = loop.time()
+            elif loop.time() - last_change > JOB_EVENTS_IDLE_TIMEOUT:
+                logger.info(f"⏱️ Assinatura do job {job_id[:8]} encerrada por inatividade")
+                return
+            else:
+                yield None
+            
+            job_data = await subscription.wait(JOB_EVENTS_POLL_SECONDS)
+            if job_data is None:
+                job_data = job_store.get(job_id)
+    finally:
+        subscription.close()
 
 @app.websocket("/ws/job-status/{job_id}")
 async def websocket_job_status(websocket: WebSocket, job_id: str):
     await websocket.accept()
+    updates = _job_updates(job_id)
+    # Lê o socket em paralelo para detectar desconexão enquanto aguardamos eventos
+    receiver = asyncio.create_task(websocket.receive())
+    next_update = None
     try:
         while True:
-            job_data = jobs_storage.get(job_id)
-
-            if job_data:
+            next_update = asyncio.ensure_future(updates.__anext__())
+            done = set()
+            while next_update not in done:
+                done, _ = await asyncio.wait({next_update, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if receiver in done:
+                    if receiver.result().get("type") == "websocket.disconnect":
+                        raise WebSocketDisconnect()
+                    receiver = asyncio.create_task(websocket.receive())
+            
+            try:
+                update = next_update.result()
+            except StopAsyncIteration:
+                break
+            
+            if update is None:
+                continue
+            kind, job_data = update
+            if kind == "delta":
+                await websocket.send_json({"type": "delta", **job_data})
+            else:
                 await websocket.send_json(job_data)
-
+                
                 # Se o job terminou, encerrar a conexão
                 if job_data["status"] in ["completed", "failed"]:
                     logger.info(f"🔌 Encerrando WS do job {job_id[:8]} - status final: {job_data['status']}")
                     break
 
-            await asyncio.sleep(1)
-
     except WebSocketDisconnect:
         logger.info(f"⚠️ Cliente desconectado do job {job_id[:8]}")
     except Exception as e:
         logger.error(f"❌ Erro no WS do job {job_id[:8]}: {e}")
     finally:
-        await websocket.close()
+        receiver.cancel()
+        if next_update is not None and not next_update.done():
+            next_update.cancel()
+            await asyncio.gather(next_update, return_exceptions=True)
+        elif next_update is not None and not next_update.cancelled():
+            # Já concluída (p.ex. StopAsyncIteration) antes da desconexão: consome a exceção
+            next_update.exception()
+        await updates.aclose()
+        try:
+            await websocket.close()
+        except Exception:
+            pass
         logger.info(f"✅ WebSocket fechado para job {job_id[:8]}")
 
+async def _sse_job_events(job_id: str):
+    loop = asyncio.get_running_loop()
+    last_write = loop.time()
+    
+    async for update in _job_updates(job_id):
+        if update is not None:
+            kind, job_data = update
+            last_write = loop.time()
+            yield f"event: {kind}\ndata: {json.dumps(job_data, ensure_ascii=False)}\n\n"
+        elif loop.time() - last_write >= JOB_EVENTS_HEARTBEAT_SECONDS:
+            last_write = loop.time()
+            yield ": heartbeat\n\n"
+
+@app.get("/job-status/{job_id}/events")
+async def job_status_events(job_id: str):
+    return StreamingResponse(
+        _sse_job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @app.delete("/job/{job_id}")
 async def cleanup_job(job_id: str):
-    if job_id in jobs_storage:
-        del jobs_storage[job_id]
+    if job_store.delete(job_id):
         logger.info(f"🧹 Job {job_id[:8]} removido da memória")
         return {"message": "Job removido com sucesso"}
     else:
         logger.warning(f"❌ Job {job_id[:8]} não encontrado para remoção")
         raise HTTPException(status_code=404, detail="Job não encontrado")
 
+@app.delete("/cache")
+async def invalidate_cache(namespace: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    _check_admin_token(x_admin_token)
+    if namespace not in (None, "classify", "response"):
+        raise HTTPException(status_code=400, detail="Namespace inválido (use classify ou response)")
+    
+    removed = ai_service.invalidate_cache(namespace)
+    return {"message": "Cache invalidado", "namespace": namespace or "all", "removed": removed}
+
 @app.options("/{rest_of_path:path}")
 async def preflight_handler(rest_of_path: str):
     return JSONResponse(
@@ -333,15 +840,125 @@ async def add_cors_headers(request, call_next):
     
     return response
 
+def _job_store_counts():
+    """Total e ativos no job store (no SQLite faz flush + COUNT(*): rodar fora do event loop)"""
+    return job_store.count(), job_store.count(active_only=True)
+
 @app.get("/health")
 async def health_check():
+    loop = asyncio.get_running_loop()
+    (stored_jobs, active_jobs), recent_ids = await asyncio.gather(
+        loop.run_in_executor(None, _job_store_counts),
+        loop.run_in_executor(None, job_store.recent_ids)
+    )
     return {
         "status": "healthy", 
         "version": "1.0.0",
-        "active_jobs": len(jobs_storage),
-        "jobs": [f"{k[:8]}..." for k in jobs_storage.keys()]
+        "active_jobs": active_jobs,
+        "stored_jobs": stored_jobs,
+        "jobs": [f"{k[:8]}..." for k in recent_ids],
+        "ml_batching": ai_service.classifier.ml_batcher.stats(),
+        "online_model": {k: v for k, v in ai_service.classifier.online_learner.stats().items() if k != "versions"}
+                        if ai_service.classifier.ml_backend == "online" else None,
+        "hf_circuit": ai_service.classifier.hf_breaker.stats(),
+        "classification_cascade": ai_service.classifier.router.stats(),
+        "gemini_batching": ai_service.response_generator.batcher.stats() if ai_service.response_generator.batcher else None,
+        "result_cache": ai_service.cache.stats(),
+        "near_duplicates": ai_service.near_duplicates.stats() if ai_service.near_duplicates_enabled else None,
+        "keyword_rules": keyword_rules.stats(),
+        "job_queue": job_scheduler.stats(),
+        "job_subscribers": job_events.subscriber_count(),
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        "pdf_extraction": email_processor.pdf_stats(),
+        "preprocessing": email_processor.preprocessor.stats(),
+        "event_loop": loop_lag_monitor.stats(),
+        "startup": STARTUP_STATS,
+        "worker": {"pid": os.getpid(), "preloaded": PRELOAD_MODELS, **_memory_usage()}
     }
 
+def _check_admin_token(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Endpoints administrativos desabilitados")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token administrativo inválido")
+
+def _check_feedback_token(token: Optional[str]):
+    """Feedback vem de operadores: aceita o token de feedback ou o administrativo"""
+    tokens = [value for value in (FEEDBACK_TOKEN, ADMIN_TOKEN) if value]
+    if not tokens:
+        raise HTTPException(status_code=404, detail="Feedback desabilitado (configure FEEDBACK_TOKEN ou ADMIN_TOKEN)")
+    if not token or not any(hmac.compare_digest(token, value) for value in tokens):
+        raise HTTPException(status_code=403, detail="Token de feedback inválido")
+
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Amostra as pilhas de todas as threads por N segundos (formato collapsed para flamegraph)"""
+    _check_admin_token(x_admin_token)
+    seconds = min(seconds, PROFILER_MAX_SECONDS)
+    loop = asyncio.get_running_loop()
+    try:
+        collapsed = await loop.run_in_executor(None, sampling_profiler.profile, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="profile-{os.getpid()}-{int(time.time())}.collapsed"'}
+    )
+
+def _online_learner():
+    classifier = ai_service.classifier
+    if classifier.ml_backend != "online":
+        raise HTTPException(status_code=409, detail="Aprendizado online desabilitado (use ML_BACKEND=online)")
+    return classifier.online_learner
+
+@app.post("/feedback", status_code=202)
+async def submit_feedback(feedback: FeedbackRequest, x_feedback_token: Optional[str] = Header(None)):
+    """Recebe a categoria correta de um email para o treino incremental"""
+    _check_feedback_token(x_feedback_token)
+    learner = _online_learner()
+    # Mesmo pré-processamento da inferência: o modelo aprende com o texto que vai classificar
+    text = email_processor.clean_text(feedback.text or "")
+    if len(text) < 5:
+        raise HTTPException(status_code=422, detail="Texto muito curto ou vazio")
+    try:
+        pending = await learner.submit_feedback(text, feedback.category)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return {"accepted": True, "pending": pending, "active_version": learner.active.number if learner.active else None}
+
+@app.get("/model/versions")
+async def model_versions(x_feedback_token: Optional[str] = Header(None)):
+    _check_feedback_token(x_feedback_token)
+    return _online_learner().stats()
+
+@app.post("/model/rollback")
+async def model_rollback(request: RollbackRequest, x_admin_token: Optional[str] = Header(None)):
+    _check_admin_token(x_admin_token)
+    learner = _online_learner()
+    try:
+        version = learner.rollback(request.version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Versão {request.version} não está no histórico")
+    return {"active_version": version.number, "version": version.to_dict()}
+
+metrics.gauge("email_jobs_inflight", "Jobs em execução no scheduler deste worker", callback=job_scheduler.inflight)
+metrics.gauge("email_job_queue_depth", "Jobs aguardando na fila deste worker", callback=job_scheduler.depth)
+# Atualizados pelo /metrics a partir de uma thread, sem consultar o SQLite no event loop
+JOB_STORE_SIZE = metrics.gauge("email_job_store_size", "Jobs guardados no job store")
+JOB_STORE_ACTIVE = metrics.gauge("email_job_store_active", "Jobs ainda não finalizados no job store")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    stored_jobs, active_jobs = await asyncio.get_running_loop().run_in_executor(None, _job_store_counts)
+    JOB_STORE_SIZE.set(stored_jobs)
+    JOB_STORE_ACTIVE.set(active_jobs)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 async def root():
     return {
@@ -349,8 +966,14 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "classify": "POST /classify-email",
+            "classify_batch": "POST /classify-batch (NDJSON)",
             "job_status": "GET /job-status/{job_id}",
-            "health": "GET /health"
+            "job_events": "GET /job-status/{job_id}/events (SSE)",
+            "job_ws": "WS /ws/job-status/{job_id}",
+            "feedback": "POST /feedback",
+            "model_versions": "GET /model/versions",
+            "health": "GET /health",
+            "metrics": "GET /metrics (Prometheus)"
         }
     }
 
@@ -0,0 +1,43 @@
+"""Gera o artefato versionado do modelo local.
+
+Uso (build da imagem): python -m app.models.build
+"""
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from app.models.ml_model import MLModel, MODEL_DIR, MODEL_VERSION, model_artifact_path
+
+logger = logging.getLogger(__name__)
+
+
+def build(model_dir: Path = MODEL_DIR, version: str = MODEL_VERSION) -> dict:
+    """Treina, salva o pickle e o artefato compilado, e escreve o manifest"""
+    import sklearn
+
+    pkl_path = model_artifact_path(".pkl", model_dir, version)
+    npz_path = model_artifact_path(".npz", model_dir, version)
+
+    model = MLModel(model_path=str(pkl_path))
+    accuracy = model.train()
+    model.save()
+    model.export_compiled(npz_path)
+
+    manifest = {
+        "version": version,
+        "built_at": datetime.now().isoformat(),
+        "accuracy": accuracy,
+        "sklearn_version": sklearn.__version__,
+        "pickle": pkl_path.name,
+        "compiled": npz_path.name,
+    }
+    with open(model_artifact_path(".json", model_dir, version), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"Artefato do modelo v{version} gerado em {model_dir}")
+    return manifest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(build(), indent=2))
@@ -0,0 +1,149 @@
+import hashlib
+import re
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_term(term: str) -> int:
+    """Hash estável (64 bits) de um termo do vocabulário"""
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CompiledLinearScorer:
+    """Scorer TF-IDF + regressão logística em NumPy puro, sem scikit-learn"""
+
+    def __init__(self, hashes, idf, weights, intercept, classes, ngram_range=(1, 1),
+                 token_pattern=r"(?u)\b\w\w+\b", lowercase=True):
+        order = np.argsort(hashes)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)[order]
+        self.idf = np.asarray(idf, dtype=np.float64)[order]
+        self.weights = np.asarray(weights, dtype=np.float64)[:, order]
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes = [str(c) for c in classes]
+        self.ngram_range = tuple(int(n) for n in ngram_range)
+        self.token_pattern = token_pattern
+        self.lowercase = bool(lowercase)
+        self._token_re = re.compile(token_pattern)
+        self.is_trained = True
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """Compila um Pipeline(TfidfVectorizer, LogisticRegression) treinado"""
+        tfidf = pipeline.named_steps['tfidf']
+        clf = pipeline.named_steps['clf']
+
+        if (tfidf.analyzer != 'word' or tfidf.norm != 'l2' or tfidf.sublinear_tf
+                or tfidf.strip_accents or tfidf.stop_words or tfidf.preprocessor or tfidf.tokenizer):
+            raise ValueError("Configuração do TfidfVectorizer não suportada pelo scorer compilado")
+
+        terms = [None] * len(tfidf.vocabulary_)
+        for term, idx in tfidf.vocabulary_.items():
+            terms[idx] = term
+
+        hashes = np.array([_hash_term(term) for term in terms], dtype=np.uint64)
+        if len(np.unique(hashes)) != len(hashes):
+            raise ValueError("Colisão de hash no vocabulário")
+
+        idf = tfidf.idf_
+        return cls(
+            hashes=hashes,
+            idf=idf,
+            weights=clf.coef_ * idf,
+            intercept=clf.intercept_,
+            classes=clf.classes_,
+            ngram_range=tfidf.ngram_range,
+            token_pattern=tfidf.token_pattern,
+            lowercase=tfidf.lowercase,
+        )
+
+    def _terms(self, text: str):
+        if self.lowercase:
+            text = text.lower()
+        tokens = self._token_re.findall(text)
+
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            if n == 1:
+                yield from tokens
+            else:
+                for i in range(len(tokens) - n + 1):
+                    yield " ".join(tokens[i:i + n])
+
+    def decision_function(self, text: str) -> np.ndarray:
+        counts = Counter(self._terms(text))
+        if not counts:
+            return self.intercept.copy()
+
+        keys = np.fromiter((_hash_term(term) for term in counts), dtype=np.uint64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+
+        pos = np.searchsorted(self.hashes, keys)
+        pos[pos == len(self.hashes)] = 0
+        found = self.hashes[pos] == keys
+        if not found.any():
+            return self.intercept.copy()
+
+        idx = pos[found]
+        tf = tf[found]
+        norm = np.sqrt(np.sum((tf * self.idf[idx]) ** 2))
+
+        return self.weights[:, idx] @ tf / norm + self.intercept
+
+    def predict_proba_one(self, text: str) -> np.ndarray:
+        scores = self.decision_function(text)
+        if len(scores) == 1:
+            positive = 1.0 / (1.0 + np.exp(-scores[0]))
+            return np.array([1.0 - positive, positive])
+
+        exp = np.exp(scores - scores.max())
+        return exp / exp.sum()
+
+    def predict(self, text: str):
+        """Faz predição (mesma interface do MLModel)"""
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        """Faz predição para vários textos"""
+        results = []
+        for text in texts:
+            probabilities = self.predict_proba_one(text)
+            idx = int(np.argmax(probabilities))
+            results.append((self.classes[idx], float(probabilities[idx])))
+        return results
+
+    def save(self, path):
+        """Salva o artefato compilado (.npz, sem pickle)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                hashes=self.hashes,
+                idf=self.idf,
+                weights=self.weights,
+                intercept=self.intercept,
+                classes=np.array(self.classes),
+                ngram_range=np.array(self.ngram_range),
+                token_pattern=np.array(self.token_pattern),
+                lowercase=np.array(self.lowercase),
+            )
+        logger.info(f"Modelo compilado salvo em {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Carrega artefato compilado"""
+        with np.load(Path(path), allow_pickle=False) as data:
+            return cls(
+                hashes=data['hashes'],
+                idf=data['idf'],
+                weights=data['weights'],
+                intercept=data['intercept'],
+                classes=data['classes'].tolist(),
+                ngram_range=data['ngram_range'].tolist(),
+                token_pattern=str(data['token_pattern']),
+                lowercase=bool(data['lowercase']),
+            )
@@ -1,19 +1,24 @@
 import pickle
 from pathlib import Path
 from datetime import datetime
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
 import numpy as np
+import asyncio
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+MODEL_DIR = Path(os.getenv('MODEL_DIR') or Path(__file__).resolve().parents[2] / "models")
+MODEL_VERSION = os.getenv('MODEL_VERSION', '1')
+
+def model_artifact_path(suffix: str, model_dir: Path = MODEL_DIR, version: str = MODEL_VERSION) -> Path:
+    """Caminho absoluto de um artefato versionado do modelo"""
+    return Path(model_dir) / f"classifier-v{version}{suffix}"
+
 class MLModel:
-    def __init__(self, model_path: str = "models/classifier_model.pkl"):
-        self.model_path = Path(model_path)
+    def __init__(self, model_path: str = None):
+        self.model_path = Path(model_path) if model_path else model_artifact_path(".pkl")
         self.model = None
         self.vectorizer = None
         self.is_trained = False
@@ -69,6 +74,12 @@ class MLModel:
     
     def train(self):
         """Treina o modelo de Machine Learning"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import Pipeline
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import accuracy_score
+        
         try:
             texts, labels = self._prepare_training_data()
             X_train, X_test, y_train, y_test = train_test_split(
@@ -96,19 +107,26 @@ class MLModel:
     
     def predict(self, text: str):
         """Faz predição com o modelo treinado"""
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(self, texts):
+        """Faz predição vetorizada para vários textos com um único predict_proba"""
         if not self.is_trained:
             self.train()
         
-        prediction = self.model.predict([text])[0]
-        probabilities = self.model.predict_proba([text])[0]
-        confidence = max(probabilities)
+        probabilities = self.model.predict_proba(texts)
+        best = np.argmax(probabilities, axis=1)
+        classes = self.model.classes_
         
-        return prediction, float(confidence)
+        return [
+            (str(classes[idx]), float(probabilities[row, idx]))
+            for row, idx in enumerate(best)
+        ]
     
     def save(self):
         """Salva o modelo treinado"""
         try:
-            self.model_path.parent.mkdir(exist_ok=True)
+            self.model_path.parent.mkdir(parents=True, exist_ok=True)
             with open(self.model_path, 'wb') as f:
                 pickle.dump({
                     'model': self.model,
@@ -134,6 +152,17 @@ class MLModel:
             logger.error(f"Erro ao carregar modelo: {e}")
             return False
     
+    def export_compiled(self, path: str):
+        """Compila o pipeline treinado em um artefato NumPy sem scikit-learn"""
+        from app.models.linear_scorer import CompiledLinearScorer
+        
+        if not self.is_trained:
+            self.train()
+        
+        scorer = CompiledLinearScorer.from_pipeline(self.model)
+        scorer.save(path)
+        return scorer
+    
     def _prepare_training_data(self):
         """Prepara dados para treinamento"""
         texts = []
@@ -147,6 +176,9 @@ class MLModel:
     
     def _get_accuracy(self):
         """Calcula acurácia do modelo"""
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import accuracy_score
+        
         if not self.is_trained:
             return 0.0
         
@@ -156,4 +188,118 @@ class MLModel:
         )
         
         y_pred = self.model.predict(X_test)
-        return accuracy_score(y_test, y_pred)
\ No newline at end of file
+        return accuracy_score(y_test, y_pred)
+
+
+class BatchPredictor:
+    """Agrupa predições concorrentes em lotes para o modelo local"""
+
+    def __init__(self, model, max_batch_size: int = None, max_wait_ms: float = None):
+        self.model = model
+        self.max_batch_size = max_batch_size or int(os.getenv('ML_BATCH_MAX_SIZE', '32'))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv('ML_BATCH_MAX_WAIT_MS', '5'))) / 1000
+        self._queue = None
+        self._worker = None
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "max_batch_size": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+        }
+
+    async def predict(self, text: str):
+        """Enfileira o texto e aguarda o resultado do lote"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._worker.get_loop() is loop:
+            return
+        
+        old_queue, self._queue = self._queue, asyncio.Queue()
+        # Itens deixados pelo worker anterior: seguem para o novo se são deste loop, senão falham
+        while old_queue is not None and not old_queue.empty():
+            item = old_queue.get_nowait()
+            future = item[1]
+            if future.get_loop() is loop:
+                if not future.done():
+                    self._queue.put_nowait(item)
+            elif not future.get_loop().is_closed():
+                future.get_loop().call_soon_threadsafe(self._fail, future, RuntimeError("Loop de predição substituído"))
+        self._worker = loop.create_task(self._run())
+
+    @staticmethod
+    def _fail(future, error: BaseException):
+        if not future.done():
+            future.set_exception(error)
+
+    async def _run(self):
+        """Loop que coleta itens pendentes e executa um lote por vez"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                
+                await self._process(batch)
+        except BaseException as e:
+            # Worker encerrado (cancelado ou erro inesperado): o lote em mãos não fica sem resposta
+            error = e if isinstance(e, Exception) else RuntimeError("Worker de predição encerrado")
+            for _, future, _ in batch:
+                self._fail(future, error)
+            raise
+
+    async def _process(self, batch):
+        texts = [text for text, _, _ in batch]
+        started = time.perf_counter()
+        
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.model.predict_batch, texts)
+        except Exception as e:
+            logger.error(f"Erro no lote de predição: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future, enqueued), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+            self._record_wait(started - enqueued)
+        
+        self._stats["batches"] += 1
+        self._stats["items"] += len(batch)
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+
+    def _record_wait(self, wait: float):
+        self._stats["total_wait"] += wait
+        self._stats["max_wait"] = max(self._stats["max_wait"], wait)
+
+    def stats(self) -> dict:
+        """Estatísticas de tamanho de lote e tempo de espera"""
+        batches = self._stats["batches"]
+        items = self._stats["items"]
+        return {
+            "max_batch_size_config": self.max_batch_size,
+            "max_wait_ms_config": self.max_wait * 1000,
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": items / batches if batches else 0.0,
+            "max_batch_size": self._stats["max_batch_size"],
+            "avg_wait_ms": (self._stats["total_wait"] / items * 1000) if items else 0.0,
+            "max_wait_ms": self._stats["max_wait"] * 1000,
+        }
@@ -0,0 +1,412 @@
+import asyncio
+import copy
+import fcntl
+import json
+import logging
+import os
+import pickle
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("Improdutivo", "Produtivo")
+
+
+class OnlineModel:
+    """HashingVectorizer + SGDClassifier (log_loss), atualizável com partial_fit.
+
+    O vetorizador por hashing não tem vocabulário, então textos com palavras
+    novas podem ser aprendidos sem retreinar do zero.
+    """
+
+    def __init__(self, n_features: int = 2 ** 18):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm='l2'
+        )
+        self.classifier = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=42)
+        self.samples_seen = 0
+
+    def partial_fit(self, texts: List[str], labels: List[str]):
+        features = self.vectorizer.transform(texts)
+        self.classifier.partial_fit(features, labels, classes=list(CATEGORIES))
+        self.samples_seen += len(texts)
+
+    def predict(self, text: str):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        probabilities = self.classifier.predict_proba(self.vectorizer.transform(texts))
+        best = np.argmax(probabilities, axis=1)
+        classes = self.classifier.classes_
+        return [
+            (str(classes[idx]), float(probabilities[row, idx]))
+            for row, idx in enumerate(best)
+        ]
+
+
+class ModelVersion:
+    """Versão imutável publicada; nunca é alterada depois de ativa"""
+
+    def __init__(self, number: int, model: OnlineModel, source: str, feedback_samples: int = 0,
+                 train_seconds: float = 0.0):
+        self.number = number
+        self.model = model
+        self.source = source
+        self.feedback_samples = feedback_samples
+        self.train_seconds = train_seconds
+        self.created_at = datetime.now().isoformat()
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.number,
+            "source": self.source,
+            "created_at": self.created_at,
+            "samples_seen": self.model.samples_seen,
+            "feedback_samples": self.feedback_samples,
+            "train_ms": self.train_seconds * 1000,
+        }
+
+
+class OnlineLearner:
+    """Recebe feedback, treina cópias do modelo em background e publica versões.
+
+    A predição lê `self.active` uma única vez por lote; a publicação troca essa
+    referência de uma vez (atribuição atômica), então predições em andamento
+    nunca veem um modelo parcialmente atualizado.
+
+    Com ML_FEEDBACK_LOG configurado, o log é a fila compartilhada pelos workers:
+    qualquer worker grava o feedback, só o dono do lock em `shared_dir` treina e
+    grava cada versão lá, e os demais recarregam a versão ativa de lá.
+    """
+
+    def __init__(self, batch_size: int = None, max_delay_seconds: float = None, max_versions: int = None,
+                 feedback_log: Optional[str] = None, shared_dir: Optional[str] = None):
+        self.batch_size = batch_size or int(os.getenv('ML_ONLINE_BATCH_SIZE', '16'))
+        self.max_delay = max_delay_seconds or float(os.getenv('ML_ONLINE_MAX_DELAY_SECONDS', '5'))
+        self.bootstrap_epochs = int(os.getenv('ML_ONLINE_BOOTSTRAP_EPOCHS', '10'))
+        self.versions = deque(maxlen=max_versions or int(os.getenv('ML_ONLINE_MAX_VERSIONS', '10')))
+        self.feedback_log = Path(feedback_log) if feedback_log else None
+        if shared_dir is None and self.feedback_log is not None:
+            shared_dir = os.getenv('ML_ONLINE_SHARED_DIR') or self.feedback_log.parent / "online-model"
+        self.shared_dir = Path(shared_dir) if shared_dir else None
+        self.active: Optional[ModelVersion] = None
+        self._pending: List[tuple] = []
+        self._wakeup = None
+        self._updater = None
+        self._listeners: List[Callable[[ModelVersion], None]] = []
+        self._next_version = 1
+        # Posição no log já incorporada ao modelo ativo (modo compartilhado)
+        self._log_offset = 0
+        self._lock_file = None
+        self._stats = {"feedback": 0, "updates": 0, "trained_samples": 0, "train_seconds": 0.0, "rollbacks": 0,
+                       "reloads": 0}
+
+    def on_publish(self, listener: Callable[[ModelVersion], None]):
+        self._listeners.append(listener)
+
+    def ensure_ready(self):
+        """Treina a versão inicial (dados base + feedback já registrado em disco)"""
+        if self.active is not None:
+            return
+        if self.shared_dir is not None and self._sync_from_store():
+            return
+        from app.models.ml_model import MLModel
+
+        texts, labels = MLModel()._prepare_training_data()
+        replayed, self._log_offset = self._read_feedback_log()
+        started = time.perf_counter()
+        model = OnlineModel()
+        for epoch in range(self.bootstrap_epochs):
+            order = np.random.RandomState(epoch).permutation(len(texts))
+            model.partial_fit([texts[i] for i in order], [labels[i] for i in order])
+        if replayed:
+            model.partial_fit([text for text, _ in replayed], [label for _, label in replayed])
+
+        version = self._publish(model, "bootstrap", len(replayed), time.perf_counter() - started)
+        if self.shared_dir is not None and self._read_state() is None:
+            # Bootstrap é determinístico: qualquer worker pode gravar a primeira versão
+            self._save_to_store(version, self._log_offset)
+        logger.info(f"Modelo online inicial pronto ({len(texts)} exemplos base, {len(replayed)} feedbacks do log)")
+
+    def predict_batch(self, texts):
+        version = self.active
+        if version is None:
+            self.ensure_ready()
+            version = self.active
+        return version.model.predict_batch(texts)
+
+    def predict(self, text: str):
+        return self.predict_batch([text])[0]
+
+    async def submit_feedback(self, text: str, label: str) -> Optional[int]:
+        """Registra um rótulo corrigido; retorna quantos aguardam o próximo treino neste worker"""
+        if label not in CATEGORIES:
+            raise ValueError(f"Categoria inválida: {label}")
+        self._stats["feedback"] += 1
+        if self.shared_dir is not None:
+            # O log é a fila: o worker dono do treino lê dali no próximo ciclo
+            if not self._append_feedback_log(text, label):
+                raise ValueError("Não foi possível registrar o feedback")
+            self.start()
+            return None
+
+        self._pending.append((text, label))
+        self._append_feedback_log(text, label)
+        self.start()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return len(self._pending)
+
+    def start(self):
+        """Inicia a task de treino/sincronização no event loop atual (idempotente)"""
+        if self._updater is None or self._updater.done():
+            self._wakeup = asyncio.Event()
+            self._updater = asyncio.create_task(self._update_loop())
+
+    async def stop(self):
+        if self._updater is not None:
+            self._updater.cancel()
+            try:
+                await self._updater
+            except asyncio.CancelledError:
+                pass
+            self._updater = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _update_loop(self):
+        # Uma única task de treino por processo: atualizações são serializadas e nunca concorrem entre si
+        while self._pending or self.shared_dir is not None:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self.shared_dir is not None:
+                await self._shared_cycle()
+                continue
+
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            await self._train_and_publish(batch)
+
+    async def _shared_cycle(self):
+        loop = asyncio.get_running_loop()
+        try:
+            # Todos seguem a versão ativa do diretório compartilhado (publicação ou rollback)
+            version = await loop.run_in_executor(None, self._store_version)
+            if version is not None:
+                self._reload(version)
+            if not self._is_trainer():
+                return
+            if self.active is None:
+                self.ensure_ready()
+            batch, offset = await loop.run_in_executor(None, self._read_feedback_log, self._log_offset)
+        except Exception as e:
+            logger.error(f"Erro ao sincronizar o modelo online: {e}")
+            return
+        if batch:
+            await self._train_and_publish(batch, offset)
+
+    async def _train_and_publish(self, batch: List[tuple], log_offset: int = None):
+        if self.active is None:
+            self.ensure_ready()
+        base = self.active
+        loop = asyncio.get_running_loop()
+        try:
+            model, elapsed = await loop.run_in_executor(None, self._train_copy, base, batch)
+        except Exception as e:
+            logger.error(f"Erro no treino online: {e}")
+            if log_offset is None:
+                self._pending = batch + self._pending
+            return
+
+        self._stats["updates"] += 1
+        self._stats["trained_samples"] += len(batch)
+        self._stats["train_seconds"] += elapsed
+        # Publicação no event loop: listeners (cache, versão) não rodam em threads
+        version = self._publish(model, "feedback", len(batch), elapsed)
+        if log_offset is not None:
+            self._log_offset = log_offset
+            try:
+                await loop.run_in_executor(None, self._save_to_store, version, log_offset)
+            except OSError as e:
+                logger.error(f"Erro ao gravar o modelo online em {self.shared_dir}: {e}")
+
+    @staticmethod
+    def _train_copy(base: ModelVersion, batch: List[tuple]):
+        # Treina uma cópia; a versão ativa continua atendendo predições
+        started = time.perf_counter()
+        model = copy.deepcopy(base.model)
+        model.partial_fit([text for text, _ in batch], [label for _, label in batch])
+        return model, time.perf_counter() - started
+
+    def _publish(self, model: OnlineModel, source: str, feedback_samples: int, train_seconds: float) -> ModelVersion:
+        version = ModelVersion(self._next_version, model, source, feedback_samples, train_seconds)
+        self._next_version += 1
+        self.versions.append(version)
+        self._activate(version)
+        logger.info(f"🧠 Modelo online v{version.number} publicado ({source}, {feedback_samples} amostras)")
+        return version
+
+    def _activate(self, version: ModelVersion):
+        self.active = version
+        for listener in self._listeners:
+            try:
+                listener(version)
+            except Exception as e:
+                logger.warning(f"Erro ao notificar nova versão do modelo: {e}")
+
+    def rollback(self, number: int) -> ModelVersion:
+        """Reativa uma versão anterior mantida no histórico"""
+        version = next((version for version in self.versions if version.number == number), None)
+        if version is None and self.shared_dir is not None:
+            version = self._load_version(number)
+        if version is None:
+            raise KeyError(number)
+        self._activate(version)
+        if self.shared_dir is not None:
+            # Os demais workers (inclusive o dono do treino) seguem a versão reativada
+            self._write_state(number)
+        self._stats["rollbacks"] += 1
+        logger.info(f"↩️ Rollback do modelo online para v{number}")
+        return version
+
+    def _is_trainer(self) -> bool:
+        """Só o processo que detém o lock treina; se ele morrer, outro assume no próximo ciclo"""
+        if self._lock_file is not None:
+            return True
+        self.shared_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.shared_dir / "trainer.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"🧠 Worker {os.getpid()} é o dono do treino online")
+        return True
+
+    def _read_state(self) -> Optional[dict]:
+        try:
+            with open(self.shared_dir / "active.json", encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, active: int, log_offset: int = None):
+        state = self._read_state() or {}
+        state = {
+            "active": active,
+            "latest": max(state.get("latest", 0), self._next_version - 1),
+            "log_offset": log_offset if log_offset is not None else state.get("log_offset", 0),
+        }
+        tmp = self.shared_dir / f"active.json.{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.shared_dir / "active.json")
+
+    def _save_to_store(self, version: ModelVersion, log_offset: int):
+        self.shared_dir.mkdir(parents=True, exist_ok=True)
+        path = self.shared_dir / f"v{version.number}.pkl"
+        tmp = self.shared_dir / f"v{version.number}.pkl.{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            pickle.dump(version, f)
+        os.replace(tmp, path)
+        self._write_state(version.number, log_offset)
+
+    def _load_version(self, number: int) -> Optional[ModelVersion]:
+        try:
+            with open(self.shared_dir / f"v{number}.pkl", 'rb') as f:
+                version = pickle.load(f)
+        except OSError:
+            return None
+        self.versions.append(version)
+        return version
+
+    def _store_version(self) -> Optional[ModelVersion]:
+        """Versão ativa no diretório compartilhado, se difere da local (lê e carrega fora do event loop)"""
+        state = self._read_state()
+        if state is None:
+            return None
+        self._next_version = max(self._next_version, state["latest"] + 1)
+        if self._lock_file is None:
+            # Quem não treina acompanha a posição do dono; vale se assumir o treino depois
+            self._log_offset = state["log_offset"]
+        if self.active is not None and self.active.number == state["active"]:
+            return None
+        version = next((version for version in self.versions if version.number == state["active"]), None)
+        return version or self._load_version(state["active"])
+
+    def _sync_from_store(self) -> bool:
+        """Ativa a versão do diretório compartilhado; retorna se há versão ativa"""
+        version = self._store_version()
+        if version is not None:
+            self._reload(version)
+        return self.active is not None
+
+    def _reload(self, version: ModelVersion):
+        self._activate(version)
+        self._stats["reloads"] += 1
+        logger.info(f"🔄 Modelo online v{version.number} recarregado de {self.shared_dir}")
+
+    def _append_feedback_log(self, text: str, label: str) -> bool:
+        if self.feedback_log is None:
+            return False
+        try:
+            self.feedback_log.parent.mkdir(parents=True, exist_ok=True)
+            # Uma única escrita em modo append: linhas de workers diferentes não se misturam
+            line = json.dumps({"text": text, "category": label, "at": time.time()}, ensure_ascii=False) + "\n"
+            with open(self.feedback_log, 'a', encoding='utf-8') as f:
+                f.write(line)
+            return True
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o feedback em disco: {e}")
+            return False
+
+    def _read_feedback_log(self, offset: int = 0):
+        """Feedbacks completos gravados a partir de `offset` (bytes) e a posição final lida"""
+        if self.feedback_log is None or not self.feedback_log.exists():
+            return [], offset
+        entries = []
+        with open(self.feedback_log, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Linha ainda sendo escrita: fica para o próximo ciclo
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("category") in CATEGORIES and entry.get("text"):
+                    entries.append((entry["text"], entry["category"]))
+        return entries, offset
+
+    def stats(self) -> Dict:
+        stats = self._stats
+        return {
+            "active_version": self.active.number if self.active else None,
+            "shared_dir": str(self.shared_dir) if self.shared_dir else None,
+            "trainer": self._lock_file is not None if self.shared_dir else True,
+            "pending_feedback": len(self._pending),
+            "feedback_received": stats["feedback"],
+            "updates": stats["updates"],
+            "rollbacks": stats["rollbacks"],
+            "reloads": stats["reloads"],
+            "train_samples_per_second": stats["trained_samples"] / stats["train_seconds"] if stats["train_seconds"] else 0.0,
+            "versions": [version.to_dict() for version in self.versions],
+        }
@@ -1,22 +1,145 @@
 import logging
-from typing import Tuple
+import os
+import time
+from typing import Optional, Tuple
 from app.services.classifier import EmailClassifier
 from app.services.response_generator import ResponseGenerator
+from app.services.result_cache import ResultCache
+from app.services.near_duplicate import NearDuplicateIndex
+from app.models.ml_model import MODEL_VERSION
+from app.utils.deadline import degradation_count
+from app.utils.tracing import annotate
 
 logger = logging.getLogger(__name__)
 
+PROMPT_VERSION = "1"
+
 class AIService:
     def __init__(self):
         self.classifier = EmailClassifier()
         self.response_generator = ResponseGenerator()
-    
+        self.cache_enabled = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+        self.model_version = MODEL_VERSION
+        self.prompt_version = f"{PROMPT_VERSION}:{os.getenv('GEMINI_MODEL', '')}"
+        self.cache = ResultCache(
+            max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '10000')),
+            max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', '50000000')),
+            ttl_seconds=float(os.getenv('RESULT_CACHE_TTL_SECONDS', '3600')),
+            db_path=os.getenv('RESULT_CACHE_DB') or None,
+            epoch_check_interval=float(os.getenv('RESULT_CACHE_EPOCH_CHECK_SECONDS', '1'))
+        )
+        self._cache_epochs = None
+        self.near_duplicates_enabled = os.getenv('NEAR_DUP_ENABLED', 'true').lower() == 'true'
+        # Respostas do Gemini podem citar nomes, pedidos e valores do outro remetente: só a categoria
+        # é reaproveitada por padrão; a resposta fica com o cache por hash exato
+        self.near_duplicate_responses = os.getenv('NEAR_DUP_REUSE_RESPONSES', 'false').lower() == 'true'
+        self.near_duplicates = NearDuplicateIndex(
+            threshold=float(os.getenv('NEAR_DUP_THRESHOLD', '0.8')),
+            max_entries=int(os.getenv('NEAR_DUP_MAX_ENTRIES', '20000')),
+            ttl_seconds=float(os.getenv('RESULT_CACHE_TTL_SECONDS', '3600')),
+            min_tokens=int(os.getenv('NEAR_DUP_MIN_TOKENS', '8'))
+        )
+        self.classifier.online_learner.on_publish(self._on_model_published)
+
     async def classify_email(self, text: str) -> Tuple[str, float]:
         """Classifica email (interface principal)"""
-        return await self.classifier.classify(text)
-    
-    async def generate_response(self, category: str, original_text: str) -> str:
-        """Gera resposta (interface principal)"""
-        return await self.response_generator.generate_response(category, original_text)
+        if not self.cache_enabled:
+            return await self.classifier.classify(text)
+
+        key = ResultCache.make_key("classify", self.model_version, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            annotate(backend="cache")
+            return cached[0], cached[1]
+
+        if self.near_duplicates_enabled:
+            self._sync_invalidations()
+            match = self.near_duplicates.lookup(text)
+            if match is not None and match.category is not None:
+                self.near_duplicates.record_hit("classify", match)
+                annotate(backend="near_duplicate")
+                return match.category, match.confidence
+
+        started = time.perf_counter()
+        degradations = degradation_count()
+        category, confidence, fell_back = await self.classifier.classify_with_status(text)
+        if fell_back or degradation_count() > degradations:
+            # Resultado de fallback (backend falhou ou faltou prazo): não deve ser reaproveitado
+            return category, confidence
+        self.cache.set(key, [category, confidence])
+
+        if self.near_duplicates_enabled:
+            entry = self.near_duplicates.add(text)
+            if entry is not None:
+                entry.category, entry.confidence = category, confidence
+                entry.classify_seconds = time.perf_counter() - started
+        return category, confidence
+
+    async def generate_response(self, category: str, original_text: str, on_delta=None) -> str:
+        """Gera resposta (interface principal); on_delta recebe os trechos se a geração for em streaming"""
+        if not self.cache_enabled:
+            return await self.response_generator.generate_response(category, original_text, on_delta=on_delta)
+
+        key = ResultCache.make_key("response", self.prompt_version, category, original_text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            annotate(backend="cache")
+            return cached
+
+        reuse = self.near_duplicates_enabled and self.near_duplicate_responses
+        if reuse:
+            self._sync_invalidations()
+            match = self.near_duplicates.lookup(original_text)
+            if match is not None and match.response is not None and match.response_category == category:
+                self.near_duplicates.record_hit("response", match)
+                annotate(backend="near_duplicate")
+                return match.response
+
+        started = time.perf_counter()
+        degradations = degradation_count()
+        response, fell_back = await self.response_generator.generate_with_status(category, original_text, on_delta=on_delta)
+        if fell_back or degradation_count() > degradations:
+            return response
+        self.cache.set(key, response)
+
+        if reuse:
+            entry = self.near_duplicates.add(original_text)
+            if entry is not None:
+                entry.response, entry.response_category = response, category
+                entry.generate_seconds = time.perf_counter() - started
+        return response
+
+    def warmup(self) -> dict:
+        """Carrega e aquece os backends antes do worker receber tráfego"""
+        started = time.perf_counter()
+        self.classifier.warmup()
+        classifier_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        self.response_generator.warmup()
+        return {
+            "classifier_seconds": classifier_seconds,
+            "generator_seconds": time.perf_counter() - started
+        }
+
+    def _on_model_published(self, version):
+        """Nova versão do modelo online: classificações antigas deixam de valer"""
+        self.invalidate_cache("classify", model_version=f"{MODEL_VERSION}-online{version.number}")
+
+    def invalidate_cache(self, namespace: Optional[str] = None, model_version: Optional[str] = None) -> int:
+        """Invalida o cache (p.ex. após retreinar o modelo ou mudar prompts)"""
+        if model_version:
+            self.model_version = model_version
+        self.near_duplicates.clear()
+        return self.cache.invalidate(namespace)
+
+    def _sync_invalidations(self):
+        """Invalidações feitas por outros workers (épocas do cache em disco) também limpam o índice local"""
+        epochs = self.cache.epochs()
+        if epochs != self._cache_epochs:
+            if self._cache_epochs is not None:
+                self.near_duplicates.clear()
+            self._cache_epochs = dict(epochs)
 
 # Instância global
-ai_service = AIService()
\ No newline at end of file
+ai_service = AIService()
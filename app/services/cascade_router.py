@@ -0,0 +1,210 @@
+"""Roteamento em cascata entre backends de classificação.
+
+Cada email passa primeiro pelo backend mais barato; só é escalado para o
+próximo quando a confiança fica abaixo do limite do estágio. Backends remotos
+podem ter orçamento de latência (timeout) e de custo (chamadas por minuto);
+sem orçamento, a cascata para e fica com a melhor resposta até ali. Estágios
+com min_budget > 0 também respeitam o prazo do job: são pulados quando resta
+menos que isso e o timeout nunca passa do que resta.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.services.rate_limiter import RateLimitRule
+from app.utils.deadline import has_budget, record_degradation, remaining_budget
+from app.utils.metrics import STAGE_SECONDS, BACKEND_ERRORS, FALLBACKS, metrics
+from app.utils.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+CASCADE_ROUTE_SECONDS = metrics.histogram(
+    "email_cascade_route_seconds", "Latência da classificação por rota da cascata", ("route",)
+)
+CASCADE_ESCALATIONS = metrics.counter(
+    "email_cascade_escalations_total", "Escalonamentos por baixa confiança", ("from_backend",)
+)
+CASCADE_SKIPS = metrics.counter(
+    "email_cascade_skips_total", "Estágios pulados por orçamento de custo esgotado", ("backend",)
+)
+
+# Faixas de confiança do primeiro estágio usadas para comparar com o backend escalado
+CONFIDENCE_BANDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+class CascadeStage:
+    def __init__(self, name: str, call: Callable[[str], Awaitable[Optional[Tuple[str, float]]]],
+                 min_confidence: float = 0.0, timeout: Optional[float] = None,
+                 calls_per_minute: Optional[float] = None, cost_per_call: float = 0.0,
+                 min_budget: float = 0.0, available: Callable[[], bool] = lambda: True):
+        self.name = name
+        self.call = call
+        self.min_confidence = min_confidence
+        self.timeout = timeout
+        self.cost_per_call = cost_per_call
+        self.min_budget = min_budget
+        self.available = available
+        self.budget = RateLimitRule(calls_per_minute / 60, calls_per_minute) if calls_per_minute else None
+        self._tokens = calls_per_minute or 0.0
+        self._refilled_at = time.monotonic()
+
+    def take_budget(self) -> bool:
+        """Consome uma chamada do orçamento de custo (sempre liberado sem orçamento)"""
+        if self.budget is None:
+            return True
+        now = time.monotonic()
+        self._tokens, retry_after = self.budget.consume(self._tokens, now - self._refilled_at)
+        self._refilled_at = now
+        return retry_after == 0.0
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "min_confidence": self.min_confidence,
+            "timeout_seconds": self.timeout,
+            "calls_per_minute": self.budget.burst if self.budget else None,
+            "cost_per_call": self.cost_per_call,
+            "min_budget_seconds": self.min_budget,
+        }
+
+
+class CascadeRouter:
+    """Executa os estágios em ordem até uma resposta confiante.
+
+    Uma resposta abaixo do limite é guardada e o próximo estágio é consultado;
+    se ele responder, a resposta dele prevalece (é o backend mais caro e mais
+    preciso). Se ele falhar, a resposta guardada é usada. Retorna None só quando
+    nenhum estágio respondeu.
+    """
+
+    def __init__(self, stages: List[CascadeStage]):
+        self.stages = stages
+        self._routes: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+        self._stats = {"requests": 0, "escalated": 0, "unanswered": 0, "cost": 0.0}
+        self._backend = defaultdict(lambda: {"calls": 0, "errors": 0, "timeouts": 0, "skipped_budget": 0,
+                                             "skipped_deadline": 0, "escalated_from": 0})
+        # Por faixa de confiança do estágio inicial: quantas escalações mudaram a categoria
+        self._agreement = {band: {"escalated": 0, "changed": 0} for band in CONFIDENCE_BANDS}
+
+    async def route(self, text: str) -> Tuple[Optional[Tuple[str, float]], bool]:
+        """Melhor resposta e se ela é provisória: algum estágio que deveria ser consultado
+        falhou ou foi pulado (custo, prazo) e nenhuma resposta atingiu a confiança exigida"""
+        started = time.perf_counter()
+        tried: List[str] = []
+        best: Optional[Tuple[str, float]] = None
+        best_backend = None
+        first_confidence = None
+        escalated = False
+        settled = missed = False
+        out_of_time = []
+
+        for stage in self.stages:
+            if not stage.available():
+                continue
+            stats = self._backend[stage.name]
+            if stage.min_budget and not has_budget(stage.min_budget):
+                stats["skipped_deadline"] += 1
+                out_of_time.append(stage.name)
+                missed = True
+                continue
+            if not stage.take_budget():
+                stats["skipped_budget"] += 1
+                CASCADE_SKIPS.inc(stage.name)
+                missed = True
+                continue
+
+            if best is not None:
+                # Já existe resposta, mas abaixo do limite: isto é um escalonamento
+                escalated = True
+                self._backend[best_backend]["escalated_from"] += 1
+                CASCADE_ESCALATIONS.inc(best_backend)
+            tried.append(stage.name)
+            stats["calls"] += 1
+            self._stats["cost"] += stage.cost_per_call
+            result, deadline_hit = await self._call(stage, text)
+            if deadline_hit:
+                out_of_time.append(stage.name)
+            if result is None:
+                missed = True
+                continue
+
+            if best is not None:
+                self._record_agreement(first_confidence, best[0], result[0])
+            else:
+                first_confidence = result[1]
+            best, best_backend = result, stage.name
+            annotate(backend=stage.name, confidence=round(result[1], 4))
+            if result[1] >= stage.min_confidence:
+                settled = True
+                break
+
+        for backend in out_of_time:
+            record_degradation("classification", backend, best_backend or "keywords")
+
+        route = ">".join(tried) or "none"
+        elapsed = time.perf_counter() - started
+        self._stats["requests"] += 1
+        self._stats["escalated"] += escalated
+        self._stats["unanswered"] += best is None
+        self._routes[route][0] += 1
+        self._routes[route][1] += elapsed
+        CASCADE_ROUTE_SECONDS.observe(elapsed, route)
+        annotate(route=route)
+        return best, missed and not settled
+
+    async def _call(self, stage: CascadeStage, text: str) -> Tuple[Optional[Tuple[str, float]], bool]:
+        """Resultado do estágio (None se falhou) e se ele estourou por causa do prazo do job"""
+        stats = self._backend[stage.name]
+        timeout = remaining_budget(stage.timeout) if stage.min_budget else stage.timeout
+        deadline_bound = bool(timeout) and timeout != stage.timeout
+        timed_out = False
+        started = time.perf_counter()
+        try:
+            if timeout:
+                result = await asyncio.wait_for(stage.call(text), timeout=timeout)
+            else:
+                result = await stage.call(text)
+        except asyncio.TimeoutError:
+            timed_out = True
+            stats["timeouts"] += 1
+            logger.warning(f"⏱️ {stage.name} excedeu o orçamento de {timeout * 1000:.0f} ms")
+            result = None
+        except Exception as e:
+            stats["errors"] += 1
+            BACKEND_ERRORS.inc(stage.name)
+            logger.error(f"Erro no backend {stage.name}: {e}")
+            result = None
+        STAGE_SECONDS.observe(time.perf_counter() - started, "classification", stage.name)
+        if result is None:
+            annotate(**{f"{stage.name}_failed": True})
+        return result, timed_out and deadline_bound
+
+    def _record_agreement(self, confidence: float, first_category: str, final_category: str):
+        band = max((band for band in CONFIDENCE_BANDS if confidence >= band), default=CONFIDENCE_BANDS[0])
+        self._agreement[band]["escalated"] += 1
+        self._agreement[band]["changed"] += first_category != final_category
+
+    def record_fallback(self, to_backend: str):
+        """Registra a saída da cascata sem resposta para o fallback final"""
+        last = next((stage.name for stage in reversed(self.stages) if stage.available()), "none")
+        FALLBACKS.inc("classification", last, to_backend)
+
+    def stats(self) -> dict:
+        requests = self._stats["requests"]
+        return {
+            "stages": [stage.describe() for stage in self.stages if stage.available()],
+            "requests": requests,
+            "escalation_rate": self._stats["escalated"] / requests if requests else 0.0,
+            "unanswered": self._stats["unanswered"],
+            "estimated_cost": round(self._stats["cost"], 6),
+            "routes": {
+                route: {"count": count, "avg_ms": total / count * 1000}
+                for route, (count, total) in self._routes.items()
+            },
+            "backends": dict(self._backend),
+            "escalation_changed_category": {
+                f">={band}": values for band, values in self._agreement.items() if values["escalated"]
+            },
+        }
@@ -1,7 +1,16 @@
+import asyncio
 import logging
+import time
 from typing import Tuple
-import requests
-from app.models.ml_model import MLModel
+from pathlib import Path
+from app.models.ml_model import MLModel, BatchPredictor, model_artifact_path
+from app.models.linear_scorer import CompiledLinearScorer
+from app.models.online_model import OnlineLearner
+from app.services.http_client import CircuitBreaker, http_client
+from app.services.keyword_rules import keyword_rules
+from app.services.cascade_router import CascadeRouter, CascadeStage
+from app.utils.metrics import STAGE_SECONDS, BACKEND_ERRORS
+from app.utils.tracing import annotate
 from dotenv import load_dotenv
 import os
 
@@ -11,66 +20,149 @@ logger = logging.getLogger(__name__)
 class EmailClassifier:
     def __init__(self):
         self.ml_model = MLModel()
+        self.ml_backend = os.getenv('ML_BACKEND', 'sklearn').lower()
+        self.compiled_model_path = Path(os.getenv('ML_COMPILED_MODEL_PATH') or model_artifact_path(".npz"))
+        self.ml_batcher = BatchPredictor(self.ml_model)
+        self.online_learner = OnlineLearner(feedback_log=os.getenv('ML_FEEDBACK_LOG') or None)
+        self._ml_ready = False
         self.hf_api_key = os.getenv('HF_API_KEY')
-        self.hf_api_url = "https://api-inference.huggingface.co/models/cardiffnlp/twitter-roberta-base-sentiment"
+        self.hf_api_url = os.getenv(
+            'HF_API_URL',
+            "https://api-inference.huggingface.co/models/cardiffnlp/twitter-roberta-base-sentiment"
+        )
+        self.http_client = http_client
+        self.hf_breaker = CircuitBreaker(
+            "huggingface",
+            failure_threshold=int(os.getenv('HF_BREAKER_FAILURES', '5')),
+            recovery_timeout=float(os.getenv('HF_BREAKER_RECOVERY_SECONDS', '30'))
+        )
+        self.router = CascadeRouter(self._build_cascade(os.getenv('CLASSIFIER_CASCADE', 'ml,hf')))
+
+    def _build_cascade(self, order: str):
+        """Estágios da cascata na ordem configurada; o fallback por palavras-chave fica sempre por último"""
+        # (chamada, disponível, confiança mínima, orçamento mínimo do prazo do job)
+        # O modelo local dá probabilidades comprimidas (0.50-0.64 mesmo no treino): abaixo de 0.55
+        # ele está perto do acaso e vale escalar; acima disso acertou todos os emails de teste
+        backends = {
+            "ml": (self._classify_with_ml, lambda: True, '0.55', '0'),
+            "hf": (self._classify_with_hf, lambda: bool(self.hf_api_key), '0', '0.5'),
+        }
+        stages = []
+        for name in (item.strip().lower() for item in order.split(',')):
+            if name not in backends:
+                raise ValueError(f"Backend de classificação desconhecido em CLASSIFIER_CASCADE: {name}")
+            call, available, min_confidence, min_budget = backends[name]
+            prefix = f"CASCADE_{name.upper()}"
+            timeout = float(os.getenv(f'{prefix}_TIMEOUT_SECONDS', '0'))
+            calls_per_minute = float(os.getenv(f'{prefix}_CALLS_PER_MINUTE', '0'))
+            stages.append(CascadeStage(
+                name, call,
+                min_confidence=float(os.getenv(f'{prefix}_MIN_CONFIDENCE', min_confidence)),
+                timeout=timeout or None,
+                calls_per_minute=calls_per_minute or None,
+                cost_per_call=float(os.getenv(f'{prefix}_COST_PER_CALL', '0')),
+                min_budget=float(os.getenv(f'{prefix}_MIN_BUDGET_SECONDS', min_budget)),
+                available=available
+            ))
+        return stages
     
     async def classify(self, text: str) -> Tuple[str, float]:
-        """Classifica email usando estratégia hierárquica"""
-        try:
-            # 1. Tentar Hugging Face API
-            if self.hf_api_key:
-                result = await self._classify_with_hf(text)
-                if result:
-                    return result
-            
-            # 2. Usar modelo ML local
-            return await self._classify_with_ml(text)
-            
-        except Exception as e:
-            logger.error(f"Erro na classificação: {e}")
-            return await self._fallback_classification(text), 0.6
+        """Classifica email pela cascata (backend mais barato primeiro, escalando por confiança)"""
+        category, confidence, _ = await self.classify_with_status(text)
+        return category, confidence
+    
+    async def classify_with_status(self, text: str) -> Tuple[str, float, bool]:
+        """Categoria, confiança e se o resultado veio de um fallback (não deve ir para cache)"""
+        result, fell_back = await self.router.route(text)
+        if result:
+            return result[0], result[1], fell_back
+
+        # Nenhum backend respondeu: heurística por palavras-chave
+        self.router.record_fallback("keywords")
+        started = time.perf_counter()
+        category = await self._fallback_classification(text)
+        STAGE_SECONDS.observe(time.perf_counter() - started, "classification", "keywords")
+        annotate(backend="keywords")
+        return category, 0.6, True
     
     async def _classify_with_hf(self, text: str):
         """Classificação com Hugging Face API"""
+        if not self.hf_breaker.allow_request():
+            return None
+        
         try:
             headers = {"Authorization": f"Bearer {self.hf_api_key}"}
             payload = {"inputs": text[:512], "parameters": {"wait_for_model": True}}
             
-            response = requests.post(self.hf_api_url, headers=headers, json=payload, timeout=30)
+            status, data = await self.http_client.post_json(self.hf_api_url, payload, headers=headers)
             
-            if response.status_code == 200:
-                result = response.json()[0]
+            if status == 200 and data:
+                result = data[0]
+                if isinstance(result, list):
+                    result = max(result, key=lambda item: item['score'])
+                self.hf_breaker.record_success()
                 if result['label'] in ['LABEL_0', 'LABEL_1']:
                     return "Produtivo", result['score']
                 else:
                     return "Improdutivo", result['score']
+            
+            logger.warning(f"HF API retornou status {status}")
+        except asyncio.CancelledError:
+            # Cancelada pelo timeout da cascata ou pelo cliente: não diz nada sobre a saúde do HF,
+            # mas a sonda do circuito meio-aberto precisa ser liberada
+            self.hf_breaker.release_probe()
+            raise
         except Exception as e:
             logger.warning(f"HF API falhou: {e}")
+        
+        self.hf_breaker.record_failure()
+        BACKEND_ERRORS.inc("hf")
         return None
     
     async def _classify_with_ml(self, text: str) -> Tuple[str, float]:
         """Classificação com modelo ML local"""
         try:
-            # Tenta carregar modelo salvo primeiro
-            if not self.ml_model.is_trained:
-                if not self.ml_model.load():
-                    self.ml_model.train()
-                    self.ml_model.save()
+            if not self._ml_ready:
+                self._load_ml_backend()
             
-            return self.ml_model.predict(text)
+            return await self.ml_batcher.predict(text)
             
         except Exception as e:
             logger.error(f"Erro ML local: {e}")
             raise
     
-    async def _fallback_classification(self, text: str) -> str:
-        """Classificação fallback heurística"""
-        text_lower = text.lower()
-        
-        productive_words = ['problema', 'erro', 'solicitação', 'pedido', 'status', 'suporte', 'urgente']
-        unproductive_words = ['obrigado', 'agradeço', 'parabéns', 'feliz', 'natal', 'cumprimentos']
-        
-        productive_count = sum(1 for word in productive_words if word in text_lower)
-        unproductive_count = sum(1 for word in unproductive_words if word in text_lower)
+    def _load_ml_backend(self):
+        """Carrega o backend local configurado (sklearn, compilado ou online)"""
+        if self.ml_backend == "online":
+            self.online_learner.ensure_ready()
+            self.ml_batcher.model = self.online_learner
+        elif self.ml_backend == "compiled":
+            if self.compiled_model_path.exists():
+                scorer = CompiledLinearScorer.load(self.compiled_model_path)
+                logger.info("Modelo compilado carregado do cache")
+            else:
+                self._load_sklearn_model()
+                scorer = self.ml_model.export_compiled(self.compiled_model_path)
+            self.ml_batcher.model = scorer
+        else:
+            self._load_sklearn_model()
+            self.ml_batcher.model = self.ml_model
         
-        return "Produtivo" if productive_count > unproductive_count else "Improdutivo"
\ No newline at end of file
+        self._ml_ready = True
+    
+    def warmup(self):
+        """Carrega o backend local e executa uma predição de aquecimento"""
+        if not self._ml_ready:
+            self._load_ml_backend()
+        self.ml_batcher.model.predict_batch(["Aquecimento do modelo de classificação"])
+    
+    def _load_sklearn_model(self):
+        # Tenta carregar modelo salvo primeiro
+        if not self.ml_model.is_trained:
+            if not self.ml_model.load():
+                self.ml_model.train()
+                self.ml_model.save()
+    
+    async def _fallback_classification(self, text: str) -> str:
+        """Classificação fallback heurística (regras em KEYWORD_RULES_PATH)"""
+        return keyword_rules.classify(text)
@@ -1,60 +1,368 @@
-import pdfplumber
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import PorterStemmer
-import string
-import io
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import asyncio
+import codecs
+import os
 import re
+import time
 import logging
+from pathlib import Path
+from typing import Set
+from app.services.pdf_extraction import extract_page_range, warm_up
+from app.utils.deadline import record_degradation, remaining_budget
+from app.utils.file_utils import SpooledUpload
+from app.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-# Download recursos NLTK
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt', quiet=True)
+# Listas de stopwords (NLTK) versionadas no repositório: nada é baixado em tempo de execução
+STOPWORDS_DIR = Path(__file__).resolve().parents[1] / "resources" / "stopwords"
 
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords', quiet=True)
+def load_stopwords(*languages: str) -> Set[str]:
+    """Carrega as stopwords vendorizadas dos idiomas informados"""
+    words = set()
+    for language in languages:
+        with open(STOPWORDS_DIR / language, encoding='utf-8') as f:
+            words.update(line.strip() for line in f if line.strip())
+    return words
+
+PREPROCESS_CHARS_REMOVED = metrics.counter(
+    "email_preprocess_chars_removed_total", "Caracteres removidos pelo pré-processamento por etapa", ("stage",)
+)
+
+class EmailPreprocessor:
+    """Reduz o email ao conteúdo novo antes da inferência, em uma única passada pelas linhas.
+
+    Remove histórico citado (respostas e encaminhamentos), linhas com ">",
+    assinaturas, rodapés de celular e avisos legais, e normaliza espaços.
+    """
+
+    STAGES = ("quoted", "history", "signature", "disclaimer", "whitespace")
+    MIN_BODY_CHARS = 15
+
+    REPLY_HEADER = re.compile(
+        r"^\s*(?:Em\s.{0,200}?\bescreveu\s*:|On\s.{0,200}?\bwrote\s*:)\s*$", re.IGNORECASE
+    )
+    FORWARD_MARKER = re.compile(
+        r"^\s*-{2,}\s*(?:forwarded message|mensagem encaminhada|original message|mensagem original)\s*-*\s*$",
+        re.IGNORECASE
+    )
+    HEADER_FIELD = re.compile(
+        r"^\s*\*?(?:de|from|enviad[oa](?: em)?|sent|para|to|cc|assunto|subject|data|date)\*?\s*:", re.IGNORECASE
+    )
+    HEADER_START = re.compile(r"^\s*\*?(?:de|from)\*?\s*:", re.IGNORECASE)
+    QUOTED = re.compile(r"^\s*>")
+    SIGNATURE_DELIMITER = re.compile(r"^\s*(?:--|_{5,}|-{5,})\s*$")
+    SIGN_OFF = re.compile(
+        r"^\s*(?:atenciosamente|att\.?|at\.te|abra[çc]os?|um abra[çc]o|cordialmente|sauda[çc][õo]es|"
+        r"best regards|kind regards|regards|best|cheers)[\s,.!]*$",
+        re.IGNORECASE
+    )
+    # Agradecimentos também fecham emails, mas são sinal para a classificação: ficam no texto
+    GRATITUDE = re.compile(
+        r"^\s*(?:muito )?(?:grat[oa]|obrigad[oa]|thanks|thank you)(?: (?:desde já|de novo|again))?[\s,.!]*$",
+        re.IGNORECASE
+    )
+    # Uma despedida só marca a assinatura se depois dela vierem poucas linhas curtas (nome, cargo, telefone)
+    SIGNATURE_MAX_LINES = 4
+    SIGNATURE_MAX_LINE_CHARS = 60
+    MOBILE_FOOTER = re.compile(r"^\s*(?:enviado do meu|enviado a partir do|sent from my|get outlook for)\b", re.IGNORECASE)
+    DISCLAIMER = re.compile(
+        r"(?:esta (?:mensagem|e-?mail).{0,120}?(?:confidencia|destinat[áa]rio)|"
+        r"this (?:e-?mail|message).{0,120}?(?:confidential|intended (?:solely|only))|"
+        r"aviso legal|disclaimer|antes de imprimir|please consider the environment)",
+        re.IGNORECASE
+    )
+    INLINE_SPACE = re.compile(r"[ \t\u00a0\u200b\u200c\u200d\ufeff]+")
+    BLANK_LINES = re.compile(r"\n{3,}")
+
+    def __init__(self):
+        self._stats = {"documents": 0, "input_chars": 0, "output_chars": 0, "seconds": 0.0,
+                       **{stage: 0 for stage in self.STAGES}}
+
+    def process(self, text: str) -> str:
+        if not text:
+            return ""
+        started = time.perf_counter()
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        removed = dict.fromkeys(self.STAGES, 0)
+        body = []
+        body_chars = 0
+        skipping_headers = False
+
+        for index, line in enumerate(lines):
+            # Email só com um encaminhamento: descarta o cabeçalho e mantém o conteúdo encaminhado
+            if skipping_headers:
+                if self.HEADER_FIELD.match(line) or not line.strip():
+                    removed["history"] += len(line) + 1
+                    continue
+                skipping_headers = False
+
+            if self.QUOTED.match(line):
+                removed["quoted"] += len(line) + 1
+                continue
+
+            has_body = body_chars >= self.MIN_BODY_CHARS
+            if self.REPLY_HEADER.match(line) or self.FORWARD_MARKER.match(line) or self._header_block_at(lines, index):
+                if has_body:
+                    removed["history"] += self._remaining(lines, index)
+                    break
+                removed["history"] += len(line) + 1
+                skipping_headers = True
+                continue
+
+            signature_follows = False
+            if has_body:
+                stage = None
+                if self.SIGNATURE_DELIMITER.match(line) or self.MOBILE_FOOTER.match(line):
+                    stage = "signature"
+                elif self.SIGN_OFF.match(line) and self._signature_tail(lines, index):
+                    stage = "signature"
+                elif self.GRATITUDE.match(line) and self._signature_tail(lines, index):
+                    signature_follows = True
+                elif self.DISCLAIMER.search(line):
+                    stage = "disclaimer"
+                if stage:
+                    removed[stage] += self._remaining(lines, index)
+                    break
+
+            line = self.INLINE_SPACE.sub(" ", line).strip()
+            body.append(line)
+            body_chars += len(line)
+            if signature_follows:
+                removed["signature"] += self._remaining(lines, index + 1)
+                break
+
+        before_whitespace = sum(len(line) + 1 for line in lines) - sum(removed.values())
+        result = self.BLANK_LINES.sub("\n\n", "\n".join(body)).strip()
+        if len(result) < 5:
+            # Nada relevante sobrou (p.ex. o email inteiro era uma citação): usa o original normalizado
+            removed = dict.fromkeys(self.STAGES, 0)
+            result = self.BLANK_LINES.sub("\n\n", "\n".join(self.INLINE_SPACE.sub(" ", line).strip() for line in lines)).strip()
+            before_whitespace = len(text)
+        removed["whitespace"] = max(0, before_whitespace - len(result))
+
+        self._record(len(text), len(result), removed, time.perf_counter() - started)
+        return result
+
+    def _header_block_at(self, lines, index: int) -> bool:
+        # Cabeçalho do Outlook ("De: ... / Enviado: ... / Para: ...") marca o início do histórico
+        if not self.HEADER_START.match(lines[index]):
+            return False
+        following = [line for line in lines[index + 1:index + 5] if line.strip()]
+        return sum(1 for line in following if self.HEADER_FIELD.match(line)) >= 2
+
+    def _signature_tail(self, lines, index: int) -> bool:
+        """Se o que vem depois da linha cabe em uma assinatura (ou é rodapé/aviso legal)"""
+        count = 0
+        for line in lines[index + 1:]:
+            if self.SIGNATURE_DELIMITER.match(line) or self.MOBILE_FOOTER.match(line) or self.DISCLAIMER.search(line):
+                return True
+            line = line.strip()
+            if not line:
+                continue
+            count += 1
+            if count > self.SIGNATURE_MAX_LINES or len(line) > self.SIGNATURE_MAX_LINE_CHARS:
+                return False
+        return True
+
+    @staticmethod
+    def _remaining(lines, index: int) -> int:
+        return sum(len(line) + 1 for line in lines[index:])
+
+    def _record(self, input_chars: int, output_chars: int, removed: dict, elapsed: float):
+        stats = self._stats
+        stats["documents"] += 1
+        stats["input_chars"] += input_chars
+        stats["output_chars"] += output_chars
+        stats["seconds"] += elapsed
+        for stage, chars in removed.items():
+            if chars:
+                stats[stage] += chars
+                PREPROCESS_CHARS_REMOVED.inc(stage, amount=chars)
+
+    def stats(self) -> dict:
+        stats = self._stats
+        return {
+            "documents": stats["documents"],
+            "input_chars": stats["input_chars"],
+            "output_chars": stats["output_chars"],
+            "reduction": 1 - stats["output_chars"] / stats["input_chars"] if stats["input_chars"] else 0.0,
+            "avg_us": stats["seconds"] / stats["documents"] * 1e6 if stats["documents"] else 0.0,
+            "removed_chars": {stage: stats[stage] for stage in self.STAGES},
+        }
 
 class EmailProcessor:
     def __init__(self):
-        self.stemmer = PorterStemmer()
-        self.stop_words = set(stopwords.words('portuguese') + stopwords.words('english'))
+        self.preprocessor = EmailPreprocessor()
+        self.preprocessing_enabled = os.getenv('EMAIL_PREPROCESSING_ENABLED', 'true').lower() == 'true'
+        self._stemmer = None
+        self._stop_words = None
+        self.pdf_pool_size = int(os.getenv('PDF_POOL_SIZE', str(min(4, os.cpu_count() or 1))))
+        self.pdf_pages_per_task = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+        self.pdf_max_pages = int(os.getenv('PDF_MAX_PAGES', '50'))
+        self.pdf_char_budget = int(os.getenv('PDF_CHAR_BUDGET', '5000'))
+        # Texto bruto lido de .txt antes do pré-processamento (que ainda remove citações e assinaturas)
+        self.txt_char_budget = int(os.getenv('TXT_CHAR_BUDGET', '20000'))
+        self.pdf_timeout = float(os.getenv('PDF_TIMEOUT_SECONDS', '20'))
+        # Mesmo com o prazo do job esgotado (ex.: espera longa na fila), a extração tem esse tempo
+        self.pdf_min_budget = min(float(os.getenv('PDF_MIN_BUDGET_SECONDS', '2')), self.pdf_timeout)
+        self._pdf_pool = None
+        self._pdf_pool_pid = None
+        self._pdf_stats = {"documents": 0, "pages": 0, "seconds": 0.0, "tasks": 0,
+                           "total_queue": 0.0, "max_queue": 0.0, "timeouts": 0, "early_stops": 0}
+
+    @property
+    def stemmer(self):
+        if self._stemmer is None:
+            from nltk.stem import PorterStemmer
+            self._stemmer = PorterStemmer()
+        return self._stemmer
+
+    @property
+    def stop_words(self) -> Set[str]:
+        if self._stop_words is None:
+            self._stop_words = load_stopwords('portuguese', 'english')
+        return self._stop_words
 
-    def extract_text_from_pdf(self, content: bytes) -> str:
-        """Extrai texto de PDF"""
+    def _get_pdf_pool(self) -> ProcessPoolExecutor:
+        # Pool criado sob demanda em cada processo (seguro após fork do gunicorn)
+        if self._pdf_pool is None or self._pdf_pool_pid != os.getpid():
+            context = multiprocessing.get_context(os.getenv('PDF_POOL_START_METHOD', 'spawn'))
+            self._pdf_pool = ProcessPoolExecutor(max_workers=self.pdf_pool_size, mp_context=context)
+            self._pdf_pool_pid = os.getpid()
+        return self._pdf_pool
+
+    async def warm_pdf_pool(self) -> int:
+        """Inicia os processos do pool e pré-importa o pdfplumber em cada um"""
+        pool = self._get_pdf_pool()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[
+            loop.run_in_executor(pool, warm_up) for _ in range(self.pdf_pool_size)
+        ])
+        return len(set(pids))
+
+    async def extract_text_from_pdf(self, content) -> str:
+        """Extrai texto de PDF em um pool de processos, parando no orçamento de caracteres"""
+        if isinstance(content, SpooledUpload):
+            # Uploads grandes seguem para o pool apenas como caminho do arquivo
+            content = content.source()
+        
+        started = time.perf_counter()
+        collected = {}
+        progress = {"pages": 0}
+        # O prazo do job, se menor, também limita a extração (sem descer do mínimo)
+        timeout = max(remaining_budget(self.pdf_timeout), self.pdf_min_budget)
+        
         try:
-            with pdfplumber.open(io.BytesIO(content)) as pdf:
-                text_parts = []
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text and page_text.strip():
-                        text_parts.append(page_text.strip())
-                
-                return "\n".join(text_parts) if text_parts else ""
-                
+            await asyncio.wait_for(self._extract_pdf_ranges(content, collected, progress), timeout)
+        except asyncio.TimeoutError:
+            self._pdf_stats["timeouts"] += 1
+            if not collected:
+                raise ValueError(f"Erro ao processar PDF: tempo limite de {timeout:.1f}s excedido")
+            logger.warning(f"⏱️ Extração de PDF interrompida após {timeout:.1f}s, usando texto parcial")
+            if timeout != self.pdf_timeout:
+                record_degradation("extraction", "pdf", "pdf_partial")
+        except ValueError:
+            raise
         except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pdf_pool = None
             logger.error(f"Erro na extração de PDF: {e}")
             raise ValueError(f"Erro ao processar PDF: {str(e)}")
+        finally:
+            self._pdf_stats["documents"] += 1
+            self._pdf_stats["pages"] += progress["pages"]
+            self._pdf_stats["seconds"] += time.perf_counter() - started
+        
+        text_parts = [part for start in sorted(collected) for part in collected[start]]
+        return "\n".join(text_parts) if text_parts else ""
 
-    def extract_text_from_txt(self, content: bytes) -> str:
-        """Extrai texto de arquivo TXT"""
+    async def _extract_pdf_ranges(self, content: bytes, collected: dict, progress: dict):
+        loop = asyncio.get_running_loop()
+        pool = self._get_pdf_pool()
+        chunk = self.pdf_pages_per_task
+        
+        async def run_range(start: int, end: int, budget: int):
+            submitted = time.time()
+            parts, pages_read, total_pages, worker_started = await loop.run_in_executor(
+                pool, extract_page_range, content, start, end, budget
+            )
+            queue_time = max(0.0, worker_started - submitted)
+            self._pdf_stats["tasks"] += 1
+            self._pdf_stats["total_queue"] += queue_time
+            self._pdf_stats["max_queue"] = max(self._pdf_stats["max_queue"], queue_time)
+            progress["pages"] += pages_read
+            collected[start] = parts
+            return total_pages
+        
+        # Primeiro bloco também descobre o total de páginas
+        total_pages = await run_range(0, chunk, self.pdf_char_budget)
+        last_page = min(total_pages, self.pdf_max_pages)
+        chars = sum(len(part) for part in collected[0])
+        
+        next_start = chunk
+        while next_start < last_page and chars < self.pdf_char_budget:
+            # Blocos seguintes em paralelo, no máximo um por processo do pool
+            starts = list(range(next_start, last_page, chunk))[:self.pdf_pool_size]
+            budget = self.pdf_char_budget - chars
+            await asyncio.gather(*(run_range(start, min(start + chunk, last_page), budget) for start in starts))
+            next_start = starts[-1] + chunk
+            chars = sum(len(part) for parts in collected.values() for part in parts)
+        
+        if progress["pages"] < total_pages:
+            self._pdf_stats["early_stops"] += 1
+
+    def pdf_stats(self) -> dict:
+        stats = self._pdf_stats
+        return {
+            "pool_size": self.pdf_pool_size,
+            "documents": stats["documents"],
+            "pages": stats["pages"],
+            "pages_per_second": stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0,
+            "avg_queue_ms": stats["total_queue"] / stats["tasks"] * 1000 if stats["tasks"] else 0.0,
+            "max_queue_ms": stats["max_queue"] * 1000,
+            "timeouts": stats["timeouts"],
+            "early_stops": stats["early_stops"],
+        }
+
+    def shutdown(self):
+        if self._pdf_pool is not None and self._pdf_pool_pid == os.getpid():
+            self._pdf_pool.shutdown(wait=False, cancel_futures=True)
+        self._pdf_pool = None
+
+    def extract_text_from_txt(self, content) -> str:
+        """Extrai texto de arquivo TXT, lendo só até TXT_CHAR_BUDGET caracteres"""
         try:
-            return content.decode('utf-8', errors='ignore').strip()
+            budget = self.txt_char_budget
+            # Cada caractere ocupa no máximo 4 bytes em UTF-8
+            if not isinstance(content, SpooledUpload):
+                return content[:budget * 4].decode('utf-8', errors='ignore')[:budget].strip()
+            
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+            parts, chars = [], 0
+            with content.open() as reader:
+                while chars < budget:
+                    chunk = reader.read(64 * 1024)
+                    part = decoder.decode(chunk, final=not chunk)
+                    parts.append(part)
+                    chars += len(part)
+                    if not chunk:
+                        break
+            return "".join(parts)[:budget].strip()
         except Exception as e:
             logger.error(f"Erro na leitura de TXT: {e}")
             raise ValueError(f"Erro ao ler arquivo texto: {str(e)}")
 
     def clean_text(self, text: str) -> str:
-        """Limpeza básica de texto"""
+        """Reduz o email ao conteúdo relevante (sem citações, assinaturas e avisos)"""
         if not text:
             return ""
         
+        if self.preprocessing_enabled:
+            return self.preprocessor.process(text)
+        
         # Remover múltiplos espaços
         text = re.sub(r'\s+', ' ', text)
         return text.strip()
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Circuit breaker simples: fechado -> aberto após falhas -> meio-aberto com uma sonda"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow_request(self) -> bool:
+        """Indica se a chamada pode seguir para o backend remoto"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            logger.info(f"🔌 Circuito {self.name} meio-aberto, enviando sonda")
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self._stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self._stats["successes"] += 1
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info(f"✅ Circuito {self.name} fechado novamente")
+        self.state = self.CLOSED
+
+    def release_probe(self):
+        """Libera a sonda sem contar falha (chamada cancelada pelo cliente ou pelo timeout da cascata)"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._stats["failures"] += 1
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self._stats["opened"] += 1
+                logger.warning(f"⚠️ Circuito {self.name} aberto após {self.consecutive_failures} falhas")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self._stats}
+
+
+class AsyncHTTPClient:
+    """Cliente HTTP assíncrono com pool de conexões keep-alive compartilhado"""
+
+    def __init__(self, limit: int = None, limit_per_host: int = None,
+                 connect_timeout: float = None, read_timeout: float = None,
+                 keepalive_timeout: float = None):
+        self.limit = limit or int(os.getenv('HTTP_POOL_SIZE', '100'))
+        self.limit_per_host = limit_per_host or int(os.getenv('HTTP_LIMIT_PER_HOST', '20'))
+        self.connect_timeout = connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', '3'))
+        self.read_timeout = read_timeout or float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+        self.keepalive_timeout = keepalive_timeout or float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._loop is not loop:
+            self._discard_session()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    def _discard_session(self):
+        """Fecha a sessão criada em outro event loop (p.ex. após fork ou entre asyncio.run)"""
+        session, old_loop = self._session, self._loop
+        self._session = None
+        if session.closed:
+            return
+        if old_loop is not None and old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), old_loop)
+            return
+        # O loop antigo não roda mais, então session.close() não pode ser aguardado: desanexa
+        # a sessão (sem aviso de sessão não fechada) e aborta cada conexão de forma síncrona
+        connector = session.connector
+        session.detach()
+        for connections in list(getattr(connector, "_conns", {}).values()):
+            for protocol, _ in list(connections):
+                transport = protocol.transport
+                if transport is None:
+                    continue
+                try:
+                    transport.abort()
+                except RuntimeError:
+                    # abort() agenda connection_lost com call_soon, que falha no loop fechado
+                    transport._call_connection_lost(None)
+        try:
+            # Parte síncrona de connector.close(); no loop fechado pode falhar no meio
+            connector._close()
+        except RuntimeError as e:
+            logger.debug(f"Connector do loop anterior fechado parcialmente: {e}")
+
+    async def post_json(self, url: str, payload: dict, headers: dict = None, timeout: float = None):
+        """POST JSON; retorna (status, corpo decodificado ou None)"""
+        kwargs = {}
+        if timeout:
+            kwargs["timeout"] = aiohttp.ClientTimeout(
+                total=timeout, sock_connect=self.connect_timeout, sock_read=self.read_timeout
+            )
+        async with self._get_session().post(url, json=payload, headers=headers, **kwargs) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, data
+
+    async def post_sse(self, url: str, payload: dict, headers: dict = None):
+        """POST JSON com resposta em Server-Sent Events; gera o JSON de cada linha `data:`"""
+        async with self._get_session().post(url, json=payload, headers=headers) as response:
+            if response.status != 200:
+                raise RuntimeError(f"{url} retornou status {response.status}")
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                yield json.loads(data)
+
+    async def close(self):
+        if self._session is not None and self._loop is not asyncio.get_running_loop():
+            self._discard_session()
+        elif self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+        }
+
+
+# Instância global
+http_client = AsyncHTTPClient()
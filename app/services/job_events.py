@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class JobSubscription:
+    """Assinatura de um cliente nas mudanças de um job (guarda só o último estado)"""
+
+    def __init__(self, bus: "JobEventBus", job_id: str):
+        self.bus = bus
+        self.job_id = job_id
+        self.latest: Optional[dict] = None
+        self._event = asyncio.Event()
+
+    def _notify(self, job: dict):
+        self.latest = job
+        self._event.set()
+
+    async def wait(self, timeout: float) -> Optional[dict]:
+        """Aguarda a próxima mudança; retorna None se o timeout expirar"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        return self.latest
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+
+class JobEventBus:
+    """Pub/sub em memória: update_job_status publica, WebSocket/SSE aguardam"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[JobSubscription]] = {}
+
+    def subscribe(self, job_id: str) -> JobSubscription:
+        subscription = JobSubscription(self, job_id)
+        self._subscribers.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: JobSubscription):
+        subscribers = self._subscribers.get(subscription.job_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.job_id]
+
+    def publish(self, job_id: str, job: dict):
+        subscribers = self._subscribers.get(job_id)
+        if not subscribers:
+            return
+        snapshot = dict(job)
+        for subscription in subscribers:
+            subscription._notify(snapshot)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+# Instância global
+job_events = JobEventBus()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Dict
+from app.utils.metrics import QUEUE_WAIT_SECONDS, JOB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FAST_LANE = "fast"
+BULK_LANE = "bulk"
+
+
+class QueueFullError(Exception):
+    """Fila da lane está cheia; retry_after em segundos"""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Fila {lane} cheia")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """Fila limitada com lanes de prioridade e pool fixo de workers.
+
+    A lane rápida (textos curtos) é atendida com peso maior, e a lane pesada
+    (PDFs e arquivos grandes) tem um limite de jobs simultâneos para que
+    sempre sobre worker para os textos.
+    """
+
+    def __init__(self, workers: int = None, fast_max: int = None, bulk_max: int = None,
+                 fast_weight: int = None, bulk_max_inflight: int = None):
+        self.workers = workers or int(os.getenv('JOB_WORKERS', '4'))
+        self.capacity = {
+            FAST_LANE: fast_max or int(os.getenv('JOB_QUEUE_FAST_MAX', '1000')),
+            BULK_LANE: bulk_max or int(os.getenv('JOB_QUEUE_BULK_MAX', '100')),
+        }
+        self.fast_weight = fast_weight or int(os.getenv('JOB_QUEUE_FAST_WEIGHT', '3'))
+        self.bulk_max_inflight = bulk_max_inflight or int(
+            os.getenv('JOB_BULK_MAX_INFLIGHT', str(max(1, self.workers - 1)))
+        )
+        self._queues: Dict[str, deque] = {FAST_LANE: deque(), BULK_LANE: deque()}
+        self._inflight = {FAST_LANE: 0, BULK_LANE: 0}
+        self._fast_streak = 0
+        self._cond = None
+        self._tasks = []
+        self._stats = {
+            lane: {"submitted": 0, "started": 0, "completed": 0, "failed": 0, "rejected": 0,
+                   "total_wait": 0.0, "max_wait": 0.0, "avg_service": 0.0, "recent": deque(maxlen=10000)}
+            for lane in self._queues
+        }
+
+    def start(self):
+        if self._tasks:
+            return
+        self._cond = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"🧵 Scheduler iniciado com {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, lane: str, func, *args, **kwargs):
+        """Enfileira um job; levanta QueueFullError quando a lane está cheia"""
+        self.start()
+        queue = self._queues[lane]
+        if len(queue) >= self.capacity[lane]:
+            self._stats[lane]["rejected"] += 1
+            raise QueueFullError(lane, self._retry_after(lane))
+
+        async with self._cond:
+            queue.append((func, args, kwargs, time.monotonic()))
+            self._stats[lane]["submitted"] += 1
+            self._cond.notify()
+
+    def _retry_after(self, lane: str) -> int:
+        service = self._stats[lane]["avg_service"] or 1.0
+        workers = self.bulk_max_inflight if lane == BULK_LANE else self.workers
+        return max(1, math.ceil(len(self._queues[lane]) * service / max(1, workers)))
+
+    def _bulk_runnable(self) -> bool:
+        return bool(self._queues[BULK_LANE]) and self._inflight[BULK_LANE] < self.bulk_max_inflight
+
+    def _has_runnable(self) -> bool:
+        return bool(self._queues[FAST_LANE]) or self._bulk_runnable()
+
+    def _next_lane(self) -> str:
+        fast_ready = bool(self._queues[FAST_LANE])
+        if fast_ready and (not self._bulk_runnable() or self._fast_streak < self.fast_weight):
+            self._fast_streak += 1
+            return FAST_LANE
+        self._fast_streak = 0
+        return BULK_LANE
+
+    async def _worker(self, number: int):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(self._has_runnable)
+                lane = self._next_lane()
+                func, args, kwargs, enqueued = self._queues[lane].popleft()
+                self._inflight[lane] += 1
+
+            stats = self._stats[lane]
+            wait = time.monotonic() - enqueued
+            stats["started"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            QUEUE_WAIT_SECONDS.observe(wait, lane)
+            started = time.monotonic()
+
+            try:
+                await func(*args, **kwargs)
+                stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats["failed"] += 1
+                logger.exception(f"💥 Erro no worker {number} ({lane}): {e}")
+            finally:
+                JOB_SECONDS.observe(time.monotonic() - enqueued, lane)
+                elapsed = time.monotonic() - started
+                stats["avg_service"] = elapsed if not stats["avg_service"] else 0.8 * stats["avg_service"] + 0.2 * elapsed
+                stats["recent"].append(time.monotonic())
+                async with self._cond:
+                    self._inflight[lane] -= 1
+                    self._cond.notify_all()
+
+    def inflight(self) -> int:
+        return sum(self._inflight.values())
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        lanes = {}
+        for lane, stats in self._stats.items():
+            started = stats["started"]
+            lanes[lane] = {
+                "depth": len(self._queues[lane]),
+                "capacity": self.capacity[lane],
+                "inflight": self._inflight[lane],
+                "submitted": stats["submitted"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "rejected": stats["rejected"],
+                "avg_wait_ms": stats["total_wait"] / started * 1000 if started else 0.0,
+                "max_wait_ms": stats["max_wait"] * 1000,
+                "avg_service_ms": stats["avg_service"] * 1000,
+                "throughput_per_min": sum(1 for ts in stats["recent"] if now - ts <= 60),
+            }
+        return {"workers": self.workers, "bulk_max_inflight": self.bulk_max_inflight, "lanes": lanes}
+
+
+# Instância global
+job_scheduler = JobScheduler()
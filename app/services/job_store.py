@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _status_value(status) -> str:
+    return getattr(status, "value", status) or ""
+
+
+class JobStore:
+    """Interface de armazenamento de jobs"""
+
+    def create(self, job_id: str, data: dict):
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, fields: dict) -> Optional[dict]:
+        """Atualiza campos do job; retorna o job atualizado ou None se não existir"""
+        raise NotImplementedError
+
+    def delete(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def count(self, active_only: bool = False) -> int:
+        raise NotImplementedError
+
+    def recent_ids(self, limit: int = 20) -> List[str]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InMemoryJobStore(JobStore):
+    """Armazenamento em dicionário, local ao processo"""
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+
+    def create(self, job_id: str, data: dict):
+        self._jobs[job_id] = dict(data)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    def update(self, job_id: str, fields: dict) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        return job
+
+    def delete(self, job_id: str) -> bool:
+        return self._jobs.pop(job_id, None) is not None
+
+    def count(self, active_only: bool = False) -> int:
+        if not active_only:
+            return len(self._jobs)
+        return sum(1 for job in self._jobs.values() if job.get("status") not in TERMINAL_STATUSES)
+
+    def recent_ids(self, limit: int = 20) -> List[str]:
+        return list(self._jobs)[-limit:]
+
+
+class SQLiteJobStore(JobStore):
+    """Armazenamento em SQLite (WAL) compartilhado pelos workers do mesmo host.
+
+    Escritas ficam em um buffer local e são gravadas em lote por uma thread de
+    flush; leituras consultam o buffer primeiro e depois a chave primária.
+    """
+
+    _DELETED = object()
+
+    def __init__(self, path: str, flush_interval_ms: float = 50, retention_seconds: float = 0):
+        self.path = Path(path)
+        self.flush_interval = flush_interval_ms / 1000
+        self.retention = retention_seconds
+        self._pending: Dict[str, object] = {}
+        self._inflight: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._db = None
+        self._pid = None
+        self._flusher = None
+        self._closed = False
+        self._last_purge = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Abre conexão e thread de flush por processo (seguro após fork do gunicorn)
+        if self._db is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs(updated_at)")
+            self._pid = os.getpid()
+            self._pending = {}
+            self._inflight = {}
+            self._flusher = threading.Thread(target=self._flush_loop, name="job-store-flush", daemon=True)
+            self._flusher.start()
+            logger.info(f"Job store SQLite em {self.path}")
+        return self._db
+
+    def create(self, job_id: str, data: dict):
+        self._connection()
+        self._write(job_id, dict(data))
+        # Grava na hora para que o job já seja visível aos outros workers
+        self.flush()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        db = self._connection()
+        with self._lock:
+            pending = self._pending.get(job_id, self._inflight.get(job_id))
+        if pending is self._DELETED:
+            return None
+        if pending is not None:
+            return dict(pending)
+
+        with self._db_lock:
+            row = db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id: str, fields: dict) -> Optional[dict]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        self._write(job_id, job)
+        return job
+
+    def delete(self, job_id: str) -> bool:
+        exists = self.get(job_id) is not None
+        if exists:
+            with self._lock:
+                self._pending[job_id] = self._DELETED
+            self._wakeup.set()
+        return exists
+
+    def count(self, active_only: bool = False) -> int:
+        db = self._connection()
+        self.flush()
+        with self._db_lock:
+            if active_only:
+                placeholders = ",".join("?" for _ in TERMINAL_STATUSES)
+                row = db.execute(f"SELECT COUNT(*) FROM jobs WHERE status NOT IN ({placeholders})", TERMINAL_STATUSES).fetchone()
+            else:
+                row = db.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return row[0]
+
+    def recent_ids(self, limit: int = 20) -> List[str]:
+        db = self._connection()
+        self.flush()
+        with self._db_lock:
+            rows = db.execute("SELECT job_id FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in rows]
+
+    def _write(self, job_id: str, job: dict):
+        with self._lock:
+            self._pending[job_id] = job
+        if _status_value(job.get("status")) in TERMINAL_STATUSES:
+            self._wakeup.set()
+
+    def flush(self):
+        """Grava o buffer pendente em uma única transação"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._inflight.update(pending)
+        if not pending or self._db is None:
+            return
+
+        now = time.time()
+        upserts = []
+        deletes = []
+        for job_id, job in pending.items():
+            if job is self._DELETED:
+                deletes.append((job_id,))
+            else:
+                upserts.append((job_id, _status_value(job.get("status")), json.dumps(job, ensure_ascii=False, default=str), now))
+
+        try:
+            with self._db_lock:
+                self._db.execute("BEGIN")
+                if upserts:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO jobs (job_id, status, data, updated_at) VALUES (?, ?, ?, ?)", upserts
+                    )
+                if deletes:
+                    self._db.executemany("DELETE FROM jobs WHERE job_id = ?", deletes)
+                self._db.execute("COMMIT")
+            with self._lock:
+                for job_id, job in pending.items():
+                    if self._inflight.get(job_id) is job:
+                        del self._inflight[job_id]
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao gravar jobs: {e}")
+            with self._db_lock:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+            with self._lock:
+                # Mantém atualizações mais novas que chegaram durante a falha
+                for job_id, job in pending.items():
+                    self._pending.setdefault(job_id, job)
+                    if self._inflight.get(job_id) is job:
+                        del self._inflight[job_id]
+
+    def _purge_expired(self):
+        if not self.retention or time.time() - self._last_purge < 60:
+            return
+        self._last_purge = time.time()
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.retention,))
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao expurgar jobs antigos: {e}")
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while not self._closed and self._pid == pid:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            self._purge_expired()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._db is not None and self._pid == os.getpid():
+            self.flush()
+            self._db.close()
+        self._db = None
+
+
+def create_job_store() -> JobStore:
+    """Cria o job store configurado via JOB_STORE (memory ou sqlite)"""
+    backend = os.getenv('JOB_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteJobStore(
+            os.getenv('JOB_STORE_PATH', 'data/jobs.db'),
+            flush_interval_ms=float(os.getenv('JOB_STORE_FLUSH_MS', '50')),
+            retention_seconds=float(os.getenv('JOB_STORE_RETENTION_SECONDS', '0'))
+        )
+    return InMemoryJobStore()
+
+
+# Instância global
+job_store = create_job_store()
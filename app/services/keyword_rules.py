@@ -0,0 +1,198 @@
+"""Motor de regras por palavra-chave usado no fallback de classificação e nos templates.
+
+Todas as palavras-chave das regras viram uma única regex (em forma de trie, com
+limites de palavra), então um email é varrido uma vez só, independente da
+quantidade de regras. As regras ficam em JSON e são recarregadas quando o
+arquivo muda.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parents[1] / "resources" / "keyword_rules.json"
+
+
+def _normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.casefold().split())
+
+
+def _trie_pattern(keywords: List[str]) -> str:
+    """Alternação em forma de trie: o regex decide pelo primeiro caractere em vez de testar cada palavra.
+
+    'erro*' casa erro/erros/errou; espaços casam qualquer sequência de espaços.
+    As continuações mais longas são tentadas primeiro ('ano novo' antes de 'ano*');
+    palavras-chave mais curtas contidas no trecho casado são contadas em _scan.
+    """
+    root: dict = {}
+    for keyword in keywords:
+        node = root
+        for char in keyword.rstrip("*"):
+            node = node.setdefault(char, {})
+        node["*" if keyword.endswith("*") else ""] = {}
+
+    def build(node: dict) -> str:
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char not in ("", "*")
+        ]
+        if "*" in node:
+            # Por último: a alternação é ordenada e \w* também casa vazio
+            branches.append(r"\w*")
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node and "*" not in node else body
+
+    return build(root)
+
+
+class CompiledRules:
+    """Conjunto de regras imutável; trocado por inteiro a cada recarga"""
+
+    def __init__(self, config: dict, scan_cache_size: int = 32):
+        classification = config.get("classification", {})
+        self.default_category = classification.get("default", "Improdutivo")
+        self.categories: Dict[str, Set[int]] = {}
+        self.templates: Dict[str, List[tuple]] = {}
+        self.template_defaults: Dict[str, str] = {}
+        self.keywords: List[str] = []
+        ids: Dict[str, int] = {}
+
+        def keyword_id(keyword: str) -> int:
+            keyword = _normalize_keyword(keyword)
+            if not keyword.rstrip("*"):
+                raise ValueError("Palavra-chave vazia nas regras")
+            if keyword not in ids:
+                ids[keyword] = len(self.keywords)
+                self.keywords.append(keyword)
+            return ids[keyword]
+
+        for category, keywords in classification.get("categories", {}).items():
+            self.categories[category] = {keyword_id(keyword) for keyword in keywords}
+
+        for category, section in config.get("templates", {}).items():
+            self.templates[category] = [
+                (rule.get("name", str(index)), {keyword_id(keyword) for keyword in rule["keywords"]}, rule["response"])
+                for index, rule in enumerate(section.get("rules", []))
+            ]
+            self.template_defaults[category] = section["default"]
+
+        self._exact = {keyword: i for i, keyword in enumerate(self.keywords) if not keyword.endswith("*")}
+        self._prefixes = {keyword[:-1]: i for i, keyword in enumerate(self.keywords) if keyword.endswith("*")}
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixes}, reverse=True)
+        # O texto é prefixado com um espaço, então \W marca o início de palavra sem lookbehind
+        # (um caractere fixo no início permite ao regex pular direto para os candidatos).
+        # O trecho fica num lookahead para que casamentos sobrepostos ('erro grave' e 'grave') contem
+        self.pattern = re.compile(rf"\W(?=({_trie_pattern(self.keywords)})(?!\w))") if self.keywords else None
+        # Fallback de classificação e template costumam varrer o mesmo texto em seguida
+        self.scan = lru_cache(maxsize=scan_cache_size)(self._scan)
+
+    def _scan(self, text: str) -> FrozenSet[int]:
+        """Ids das palavras-chave presentes no texto (uma única passada)"""
+        if self.pattern is None:
+            return frozenset()
+        hits = set()
+        for found in set(self.pattern.findall(" " + text.lower())):
+            found = _normalize_keyword(found)
+            if not found:
+                continue
+            # O regex captura a palavra-chave mais longa; as mais curtas que terminam
+            # em fim de palavra dentro dela ('erro' em 'erro grave') também contam
+            for end in [index for index, char in enumerate(found) if char == " "] + [len(found)]:
+                exact_id = self._exact.get(found[:end])
+                if exact_id is not None:
+                    hits.add(exact_id)
+            for length in self._prefix_lengths:
+                prefix_id = self._prefixes.get(found[:length]) if length <= len(found) else None
+                if prefix_id is not None:
+                    hits.add(prefix_id)
+        return frozenset(hits)
+
+    def classify(self, text: str) -> str:
+        """Categoria com mais palavras-chave distintas; empate fica com a categoria padrão"""
+        hits = self.scan(text)
+        counts = {category: len(hits & keywords) for category, keywords in self.categories.items()}
+        best = max(counts.values(), default=0)
+        winners = [category for category, count in counts.items() if count == best]
+        return winners[0] if best > 0 and len(winners) == 1 else self.default_category
+
+    def template(self, category: str, text: str) -> str:
+        """Resposta da primeira regra do template da categoria com alguma palavra-chave presente"""
+        hits = self.scan(text)
+        for _, keywords, response in self.templates[category]:
+            if hits & keywords:
+                return response
+        return self.template_defaults[category]
+
+
+class KeywordRuleEngine:
+    """Carrega as regras sob demanda e recarrega quando o arquivo é modificado"""
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 2.0):
+        self.path = Path(path) if path else DEFAULT_RULES_PATH
+        self.reload_interval = reload_interval
+        self._rules: Optional[CompiledRules] = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"reloads": 0, "reload_errors": 0, "last_error": None}
+
+    @property
+    def rules(self) -> CompiledRules:
+        now = time.monotonic()
+        if self._rules is None or (self.reload_interval and now - self._checked_at >= self.reload_interval):
+            self._checked_at = now
+            self._reload_if_changed()
+        return self._rules
+
+    def _reload_if_changed(self):
+        with self._lock:
+            try:
+                mtime = self.path.stat().st_mtime_ns
+                if self._rules is not None and mtime == self._mtime:
+                    return
+                with open(self.path, encoding='utf-8') as f:
+                    rules = CompiledRules(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+                if self._rules is None:
+                    raise
+                # Arquivo inválido durante edição: mantém as regras anteriores
+                self._stats["reload_errors"] += 1
+                self._stats["last_error"] = str(e)
+                logger.warning(f"⚠️ Regras de palavras-chave inválidas, mantendo versão anterior: {e}")
+                return
+
+            reloaded = self._rules is not None
+            self._rules, self._mtime = rules, mtime
+            self._stats["last_error"] = None
+            if reloaded:
+                self._stats["reloads"] += 1
+                logger.info(f"🔁 Regras de palavras-chave recarregadas ({len(rules.keywords)} palavras-chave)")
+
+    def classify(self, text: str) -> str:
+        return self.rules.classify(text)
+
+    def template(self, category: str, text: str) -> str:
+        return self.rules.template(category, text)
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "keywords": len(self._rules.keywords) if self._rules else None,
+            **self._stats,
+        }
+
+
+# Instância global
+keyword_rules = KeywordRuleEngine(
+    os.getenv('KEYWORD_RULES_PATH') or None,
+    reload_interval=float(os.getenv('KEYWORD_RULES_RELOAD_SECONDS', '2'))
+)
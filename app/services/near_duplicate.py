@@ -0,0 +1,210 @@
+"""Índice de emails quase idênticos (MinHash + LSH) para reaproveitar resultados.
+
+Emails gerados por template (mesmo texto, outro nome/pedido/data) caem quase
+no mesmo conjunto de shingles depois da normalização. O MinHash com bandas
+(LSH) encontra candidatos sem comparar com todo o índice; a decisão final usa
+a similaridade de Jaccard exata, então colisões do LSH nunca viram
+reaproveitamento indevido.
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_HITS = metrics.counter(
+    "email_near_duplicate_hits_total", "Resultados reaproveitados de emails quase idênticos", ("stage",)
+)
+NEAR_DUPLICATE_SAVED_SECONDS = metrics.counter(
+    "email_near_duplicate_saved_seconds_total", "Tempo de backend economizado com reaproveitamento", ("stage",)
+)
+
+# Trechos que variam entre cópias de um mesmo template viram marcadores fixos
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,:/-]\d+)*")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    """Palavras e bigramas do texto normalizado (minúsculas, números/URLs/emails genéricos)"""
+    text = text.casefold()
+    text = URL_PATTERN.sub(" url ", text)
+    text = EMAIL_PATTERN.sub(" email ", text)
+    text = NUMBER_PATTERN.sub(" 0 ", text)
+    tokens = TOKEN_PATTERN.findall(text)
+    return frozenset(tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])])
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class MinHasher:
+    """Assinaturas MinHash vetorizadas com hashing multiply-shift (todas as permutações de uma vez)"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 42):
+        generator = np.random.RandomState(seed)
+        # Multiplicadores ímpares de 64 bits; o overflow de uint64 é a redução mod 2^64
+        self.a = generator.randint(0, 1 << 62, size=(num_perm, 1)).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = generator.randint(0, 1 << 62, size=(num_perm, 1)).astype(np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, features: FrozenSet[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+             for feature in features),
+            dtype=np.uint64, count=len(features)
+        )
+        return ((self.a * hashes + self.b) >> np.uint64(32)).min(axis=1)
+
+
+class NearDuplicateEntry:
+    def __init__(self, key: int, features: FrozenSet[str], bands: Tuple[int, ...], expires_at: float):
+        self.key = key
+        self.features = features
+        self.bands = bands
+        self.expires_at = expires_at
+        self.category: Optional[str] = None
+        self.confidence: Optional[float] = None
+        self.response: Optional[str] = None
+        self.response_category: Optional[str] = None
+        self.classify_seconds = 0.0
+        self.generate_seconds = 0.0
+
+
+class NearDuplicateIndex:
+    """Índice LSH com LRU + TTL; `lookup` retorna a entrada mais parecida acima do limite.
+
+    Com `bands` bandas de `rows` linhas, dois textos com Jaccard s viram
+    candidatos com probabilidade 1 - (1 - s^rows)^bands: ~100% acima de 0.8 e
+    quase nula para textos não relacionados.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 20000, ttl_seconds: float = 3600.0,
+                 min_tokens: int = 8, bands: int = 16, rows: int = 4):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.min_tokens = min_tokens
+        self.rows = rows
+        self.hasher = MinHasher(num_perm=bands * rows)
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(bands)]
+        self._entries: "OrderedDict[int, NearDuplicateEntry]" = OrderedDict()
+        self._stats = {"lookups": 0, "matches": 0, "hits": 0, "classify_hits": 0, "response_hits": 0,
+                       "candidates": 0, "similarity_sum": 0.0, "saved_seconds": 0.0, "evictions": 0,
+                       "skipped_short": 0}
+
+    def _prepare(self, text: str):
+        features = shingles(text)
+        # Textos muito curtos coincidem demais para que "quase igual" signifique algo
+        if sum(1 for feature in features if " " not in feature) < self.min_tokens:
+            return None, None
+        signature = self.hasher.signature(features).reshape(len(self._buckets), self.rows)
+        return features, tuple(hash(band.tobytes()) for band in signature)
+
+    def lookup(self, text: str) -> Optional[NearDuplicateEntry]:
+        """Entrada mais parecida com similaridade >= threshold, se houver"""
+        features, bands = self._prepare(text)
+        if features is None:
+            self._stats["skipped_short"] += 1
+            return None
+        self._stats["lookups"] += 1
+
+        candidates = set()
+        for band, bucket in zip(bands, self._buckets):
+            candidates.update(bucket.get(band, ()))
+        self._stats["candidates"] += len(candidates)
+
+        now = time.time()
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.expires_at <= now:
+                self._remove(key)
+                continue
+            similarity = jaccard(features, entry.features)
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+
+        if best is None:
+            return None
+        self._entries.move_to_end(best.key)
+        self._stats["matches"] += 1
+        self._stats["similarity_sum"] += best_similarity
+        return best
+
+    def record_hit(self, stage: str, entry: NearDuplicateEntry):
+        """Contabiliza um resultado reaproveitado ("classify" ou "response")"""
+        saved = entry.classify_seconds if stage == "classify" else entry.generate_seconds
+        self._stats["hits"] += 1
+        self._stats[f"{stage}_hits"] += 1
+        self._stats["saved_seconds"] += saved
+        NEAR_DUPLICATE_HITS.inc(stage)
+        NEAR_DUPLICATE_SAVED_SECONDS.inc(stage, amount=saved)
+
+    def add(self, text: str) -> Optional[NearDuplicateEntry]:
+        """Entrada para os shingles exatos do texto, criada se ainda não existir"""
+        features, bands = self._prepare(text)
+        if features is None:
+            return None
+
+        key = hash(features)
+        entry = self._entries.get(key)
+        if entry is not None and entry.features == features:
+            self._entries.move_to_end(key)
+            return entry
+        if entry is not None:
+            self._remove(key)
+
+        entry = NearDuplicateEntry(key, features, bands, time.time() + self.ttl)
+        self._entries[key] = entry
+        for band, bucket in zip(bands, self._buckets):
+            bucket.setdefault(band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+        return entry
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band, bucket in zip(entry.bands, self._buckets):
+            members = bucket.get(band)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del bucket[band]
+
+    def clear(self):
+        self._entries.clear()
+        for bucket in self._buckets:
+            bucket.clear()
+
+    def stats(self) -> dict:
+        stats = self._stats
+        lookups = stats["lookups"]
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "lookups": lookups,
+            "hits": stats["hits"],
+            "classify_hits": stats["classify_hits"],
+            "response_hits": stats["response_hits"],
+            "reuse_rate": stats["hits"] / lookups if lookups else 0.0,
+            "avg_candidates": stats["candidates"] / lookups if lookups else 0.0,
+            "avg_match_similarity": stats["similarity_sum"] / stats["matches"] if stats["matches"] else None,
+            "latency_saved_seconds": stats["saved_seconds"],
+            "evictions": stats["evictions"],
+            "skipped_short": stats["skipped_short"],
+        }
@@ -0,0 +1,46 @@
+"""Funções executadas nos processos do pool de extração de PDF.
+
+Ficam em um módulo leve para que os processos filhos não importem a aplicação.
+"""
+import io
+import time
+
+
+def _open_pdf(source):
+    import pdfplumber
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return pdfplumber.open(source)
+
+
+def warm_up() -> int:
+    """Importa o pdfplumber no processo do pool antes da primeira requisição"""
+    import pdfplumber  # noqa: F401
+    import os
+
+    return os.getpid()
+
+
+def extract_page_range(source, start: int, end: int, char_budget: int = 0):
+    """Extrai as páginas [start, end) parando ao atingir char_budget.
+
+    Retorna (partes de texto, páginas lidas, total de páginas, início no worker).
+    """
+    started_at = time.time()
+    text_parts = []
+    chars = 0
+    pages_read = 0
+
+    with _open_pdf(source) as pdf:
+        total_pages = len(pdf.pages)
+        for page in pdf.pages[start:min(end, total_pages)]:
+            page_text = page.extract_text()
+            pages_read += 1
+            if page_text and page_text.strip():
+                text_parts.append(page_text.strip())
+                chars += len(page_text)
+            if char_budget and chars >= char_budget:
+                break
+
+    return text_parts, pages_read, total_pages, started_at
@@ -0,0 +1,205 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitRule:
+    """Token bucket: `rate` fichas por segundo, acumulando até `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    @property
+    def refill_seconds(self) -> float:
+        """Tempo para um bucket vazio voltar a ficar cheio"""
+        return self.burst / self.rate
+
+    def consume(self, tokens: float, elapsed: float) -> Tuple[float, float]:
+        """Reabastece e tenta consumir uma ficha. Retorna (fichas restantes, retry_after)"""
+        tokens = min(self.burst, tokens + max(elapsed, 0.0) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+
+class RateLimiter:
+    """Interface dos limitadores: acquire(grupo, cliente) -> segundos até a próxima ficha (0 = liberado)"""
+
+    def __init__(self, rules: Dict[str, RateLimitRule]):
+        self.rules = rules
+        self._stats = {"allowed": 0, "limited": 0}
+
+    def acquire(self, group: str, client: str) -> float:
+        rule = self.rules.get(group)
+        if rule is None:
+            return 0.0
+        retry_after = self._acquire(f"{group}:{client}", rule)
+        self._stats["limited" if retry_after else "allowed"] += 1
+        return retry_after
+
+    def _acquire(self, key: str, rule: RateLimitRule) -> float:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            "rules": {group: {"rate": rule.rate, "burst": rule.burst} for group, rule in self.rules.items()},
+            **self._stats,
+        }
+
+    def close(self):
+        pass
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Buckets em memória do processo, divididos em shards com LRU limitado.
+
+    Um bucket parado por mais tempo que o necessário para encher é equivalente
+    a um bucket inexistente, então pode ser descartado sem mudar o resultado.
+    """
+
+    def __init__(self, rules: Dict[str, RateLimitRule], max_buckets: int = 100000, shards: int = 16):
+        super().__init__(rules)
+        self._shards: List["OrderedDict[str, list]"] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._shard_capacity = max(1, max_buckets // shards)
+        self._max_idle = max((rule.refill_seconds for rule in rules.values()), default=0.0)
+        self._stats.update({"evictions": 0, "expired": 0})
+
+    def _acquire(self, key: str, rule: RateLimitRule) -> float:
+        index = zlib.crc32(key.encode("utf-8")) % len(self._shards)
+        buckets = self._shards[index]
+        now = time.monotonic()
+
+        with self._locks[index]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = [rule.burst, now]
+                buckets[key] = bucket
+                self._evict(buckets, now)
+            else:
+                buckets.move_to_end(key)
+
+            tokens, retry_after = rule.consume(bucket[0], now - bucket[1])
+            bucket[0], bucket[1] = tokens, now
+            return retry_after
+
+    def _evict(self, buckets: "OrderedDict[str, list]", now: float):
+        # Remove do início do LRU os buckets já cheios de novo e, se preciso, os mais antigos
+        while buckets:
+            oldest_key = next(iter(buckets))
+            if now - buckets[oldest_key][1] >= self._max_idle:
+                self._stats["expired"] += 1
+            elif len(buckets) > self._shard_capacity:
+                self._stats["evictions"] += 1
+            else:
+                break
+            del buckets[oldest_key]
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "buckets": sum(len(shard) for shard in self._shards), **super().stats()}
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Buckets em SQLite (WAL) compartilhados pelos workers do mesmo host"""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, rules: Dict[str, RateLimitRule], path: str):
+        super().__init__(rules)
+        self.path = Path(path)
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._operations = 0
+        self._max_idle = max((rule.refill_seconds for rule in rules.values()), default=0.0)
+        self._stats["errors"] = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Conexão aberta por processo (seguro após fork do gunicorn)
+        if self._db is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=2)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._pid = os.getpid()
+            logger.info(f"Rate limiter SQLite em {self.path}")
+        return self._db
+
+    def _acquire(self, key: str, rule: RateLimitRule) -> float:
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = db.execute(
+                        "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                    ).fetchone()
+                    tokens, updated_at = row if row else (rule.burst, now)
+                    tokens, retry_after = rule.consume(tokens, now - updated_at)
+                    db.execute(
+                        "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                        (key, tokens, now)
+                    )
+                    self._operations += 1
+                    if self._operations % self.PURGE_EVERY == 0:
+                        db.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - self._max_idle,))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            return retry_after
+        except sqlite3.Error as e:
+            # Banco indisponível ou travado: não bloqueia o tráfego
+            self._stats["errors"] += 1
+            logger.warning(f"Erro no rate limiter SQLite: {e}")
+            return 0.0
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", **super().stats()}
+
+    def close(self):
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    """Cria o limitador configurado via RATE_LIMIT_BACKEND (memory ou sqlite)"""
+    if os.getenv('RATE_LIMIT_ENABLED', 'true').lower() != 'true':
+        return None
+
+    rules = {
+        "classify": RateLimitRule(
+            rate=float(os.getenv('RATE_LIMIT_CLASSIFY_RATE', '2')),
+            burst=float(os.getenv('RATE_LIMIT_CLASSIFY_BURST', '20'))
+        ),
+        "job_status": RateLimitRule(
+            rate=float(os.getenv('RATE_LIMIT_JOB_STATUS_RATE', '5')),
+            burst=float(os.getenv('RATE_LIMIT_JOB_STATUS_BURST', '30'))
+        ),
+    }
+    if os.getenv('RATE_LIMIT_BACKEND', 'memory').lower() == 'sqlite':
+        return SQLiteRateLimiter(rules, os.getenv('RATE_LIMIT_DB_PATH', 'data/rate_limit.db'))
+    return InMemoryRateLimiter(
+        rules,
+        max_buckets=int(os.getenv('RATE_LIMIT_MAX_BUCKETS', '100000')),
+        shards=int(os.getenv('RATE_LIMIT_SHARDS', '16'))
+    )
+
+
+# Instância global
+rate_limiter = create_rate_limiter()
@@ -1,50 +1,404 @@
+import asyncio
+import json
 import logging
-from typing import Dict
-import google.generativeai as genai
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from app.services.keyword_rules import keyword_rules
+from app.utils.metrics import STAGE_SECONDS, BACKEND_ERRORS, FALLBACKS, metrics
+from app.utils.deadline import has_budget, record_degradation, remaining_budget
+from app.utils.tracing import annotate
 import os
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+BATCH_EMAIL_PATTERN = re.compile(r"^\s*EMAIL (\d+):", re.MULTILINE)
+STREAM_CHUNK_PATTERN = re.compile(r"\S+\s*")
+
+GENERATION_TTFT_SECONDS = metrics.histogram(
+    "email_generation_ttft_seconds", "Tempo até o primeiro trecho da resposta gerada", ("backend",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0)
+)
+
+class GeminiSDKClient:
+    """Cliente Gemini via SDK oficial, executado em um executor limitado"""
+
+    def __init__(self, api_key: str, model_name: str, max_workers: int):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.model = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+
+    def warmup(self):
+        """Importa o SDK e cria o modelo (import pesado, feito fora do caminho de import da app)"""
+        if self.model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=self.api_key)
+            self.model = genai.GenerativeModel(self.model_name)
+
+    async def generate(self, prompt: str) -> str:
+        self.warmup()
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self._executor, self.model.generate_content, prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """generate_content(stream=True) roda no executor; os trechos voltam ao loop por uma fila"""
+        self.warmup()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        def produce():
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        # produce() captura as próprias exceções: a future do executor nunca falha
+        loop.run_in_executor(self._executor, produce)
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+class GeminiRESTClient:
+    """Cliente Gemini via API REST (generateContent) usando o pool HTTP compartilhado"""
+
+    def __init__(self, api_key: str, model_name: str, api_url: str = None, http=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.api_url = (api_url or "https://generativelanguage.googleapis.com").rstrip("/")
+        self.http = http
+
+    def _url(self, method: str) -> str:
+        return f"{self.api_url}/v1beta/models/{self.model_name}:{method}"
+
+    async def generate(self, prompt: str) -> str:
+        if self.http is None:
+            from app.services.http_client import http_client
+            self.http = http_client
+
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        status, data = await self.http.post_json(
+            self._url("generateContent"), payload, headers={"x-goog-api-key": self.api_key}
+        )
+        if status != 200 or not data:
+            raise RuntimeError(f"Gemini REST retornou status {status}")
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """streamGenerateContent em SSE: cada evento traz o próximo trecho do texto"""
+        if self.http is None:
+            from app.services.http_client import http_client
+            self.http = http_client
+
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        events = self.http.post_sse(
+            self._url("streamGenerateContent") + "?alt=sse", payload, headers={"x-goog-api-key": self.api_key}
+        )
+        async for event in events:
+            candidates = event.get("candidates") or [{}]
+            parts = candidates[0].get("content", {}).get("parts", [])
+            text = "".join(part.get("text", "") for part in parts)
+            if text:
+                yield text
+
+class StubGeminiClient:
+    """Cliente local que imita o Gemini para testes e benchmarks"""
+
+    def __init__(self, latency_ms: float = 0.0, chunk_delay_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.chunk_delay = chunk_delay_ms / 1000
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        ids = BATCH_EMAIL_PATTERN.findall(prompt)
+        if ids:
+            return json.dumps([{"id": int(i), "resposta": f"Resposta simulada {i}."} for i in ids], ensure_ascii=False)
+        return "Agradecemos seu contato. Esta é uma resposta simulada."
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """A latência vale até o primeiro trecho; depois, uma palavra a cada chunk_delay"""
+        reply = await self.generate(prompt)
+        for index, chunk in enumerate(STREAM_CHUNK_PATTERN.findall(reply)):
+            if index and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield chunk
+
+class GeminiPromptBatcher:
+    """Agrupa emails curtos da mesma categoria em um único prompt estruturado"""
+
+    def __init__(self, generator, max_batch_size: int, max_wait_ms: float, max_chars: int):
+        self.generator = generator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_chars = max_chars
+        self._pending: Dict[str, list] = {}
+        self._timers = {}
+        self._tasks = set()
+        self._stats = {"batches": 0, "batched_emails": 0, "parse_fallbacks": 0}
+
+    async def submit(self, category: str, text: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        items = self._pending.setdefault(category, [])
+        items.append((text, future))
+        
+        if len(items) >= self.max_batch_size:
+            self._start_flush(category)
+        elif len(items) == 1:
+            self._timers[category] = loop.call_later(self.max_wait, self._start_flush, category)
+        
+        return await future
+
+    def _start_flush(self, category: str):
+        timer = self._timers.pop(category, None)
+        if timer is not None:
+            timer.cancel()
+        
+        items = self._pending.pop(category, [])
+        if items:
+            task = asyncio.create_task(self._run_batch(category, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, category: str, items: list):
+        try:
+            if len(items) == 1:
+                text, future = items[0]
+                reply = await self.generator._call_gemini(self.generator._build_gemini_prompt(category, text))
+                if not future.done():
+                    future.set_result(reply)
+                return
+            
+            prompt = self.generator._build_batch_prompt(category, [text for text, _ in items])
+            replies = self._parse_batch_reply(await self.generator._call_gemini(prompt))
+            self._stats["batches"] += 1
+            self._stats["batched_emails"] += len(items)
+            
+            missing = []
+            for idx, (text, future) in enumerate(items, start=1):
+                reply = replies.get(idx)
+                if not reply:
+                    missing.append((text, future))
+                elif not future.done():
+                    future.set_result(reply)
+            
+            if missing:
+                # Itens que faltaram no JSON do lote: chamadas individuais em paralelo
+                self._stats["parse_fallbacks"] += len(missing)
+                results = await asyncio.gather(*[
+                    self.generator._call_gemini(self.generator._build_gemini_prompt(category, text))
+                    for text, _ in missing
+                ], return_exceptions=True)
+                for (_, future), result in zip(missing, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    @staticmethod
+    def _parse_batch_reply(reply: str) -> Dict[int, str]:
+        """Extrai {id: resposta} da resposta JSON do lote"""
+        start, end = reply.find("["), reply.rfind("]")
+        if start < 0 or end < start:
+            return {}
+        try:
+            entries = json.loads(reply[start:end + 1])
+        except ValueError:
+            return {}
+        
+        replies = {}
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get("resposta"):
+                try:
+                    replies[int(entry.get("id"))] = str(entry["resposta"]).strip()
+                except (TypeError, ValueError):
+                    continue
+        return replies
+
+    def stats(self) -> dict:
+        return {"pending": sum(len(items) for items in self._pending.values()), **self._stats}
+
 class ResponseGenerator:
-    def __init__(self):
+    def __init__(self, gemini_client=None):
         self.gemini_available = False
+        self.gemini_client = gemini_client
+        self.max_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+        self._gemini_slots = None
+        self.batcher = None
+        self.streaming_enabled = os.getenv('GEMINI_STREAMING_ENABLED', 'true').lower() == 'true'
+        self.timeout = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '30')) or None
+        # Abaixo disso do prazo do job, nem tenta o Gemini
+        self.min_budget = float(os.getenv('GEMINI_MIN_BUDGET_SECONDS', '1'))
         self._setup_gemini()
     
     def _setup_gemini(self):
         """Configura Gemini API"""
         try:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if api_key:
-                genai.configure(api_key=api_key)
-                self.gemini_model = genai.GenerativeModel(os.getenv('GEMINI_MODEL'))
+            if self.gemini_client is None:
+                api_key = os.getenv('GEMINI_API_KEY')
+                client_type = os.getenv('GEMINI_CLIENT', 'sdk').lower()
+                if client_type == 'stub':
+                    self.gemini_client = StubGeminiClient(
+                        float(os.getenv('GEMINI_STUB_LATENCY_MS', '0')),
+                        float(os.getenv('GEMINI_STUB_CHUNK_DELAY_MS', '0'))
+                    )
+                elif client_type == 'rest' and api_key:
+                    self.gemini_client = GeminiRESTClient(api_key, os.getenv('GEMINI_MODEL'), os.getenv('GEMINI_API_URL'))
+                elif api_key:
+                    self.gemini_client = GeminiSDKClient(api_key, os.getenv('GEMINI_MODEL'), self.max_concurrency)
+            
+            if self.gemini_client is not None:
                 self.gemini_available = True
+                if os.getenv('GEMINI_BATCH_ENABLED', 'false').lower() == 'true':
+                    self.batcher = GeminiPromptBatcher(
+                        self,
+                        max_batch_size=int(os.getenv('GEMINI_BATCH_MAX_SIZE', '8')),
+                        max_wait_ms=float(os.getenv('GEMINI_BATCH_MAX_WAIT_MS', '50')),
+                        max_chars=int(os.getenv('GEMINI_BATCH_MAX_CHARS', '600'))
+                    )
                 logger.info("Gemini configurado com sucesso")
         except Exception as e:
             logger.warning(f"Gemini não disponível: {e}")
     
-    async def generate_response(self, category: str, original_text: str) -> str:
-        """Gera resposta para o email"""
+    def warmup(self):
+        """Inicializa o cliente Gemini antes da primeira requisição"""
+        warmup = getattr(self.gemini_client, 'warmup', None)
+        if warmup is not None:
+            try:
+                warmup()
+            except Exception as e:
+                logger.warning(f"Gemini não disponível: {e}")
+                self.gemini_available = False
+        self._generate_with_template("Produtivo", "Aquecimento")
+
+    async def generate_response(self, category: str, original_text: str,
+                                on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Gera resposta para o email; on_delta recebe os trechos conforme o Gemini os produz.
+
+        Se o streaming falhar depois de enviar trechos, on_delta(resposta, reset=True) entrega a
+        resposta de fallback, que substitui todo o texto parcial já enviado.
+        """
+        response, _ = await self.generate_with_status(category, original_text, on_delta)
+        return response
+    
+    async def generate_with_status(self, category: str, original_text: str,
+                                   on_delta: Optional[Callable[[str], None]] = None) -> Tuple[str, bool]:
+        """Resposta e se ela veio de um fallback (Gemini falhou ou foi pulado), que não deve ir para cache"""
         try:
             if self.gemini_available:
-                return await self._generate_with_gemini(category, original_text)
+                return await self._generate_with_gemini(category, original_text, on_delta)
             else:
-                return self._generate_with_template(category, original_text)
+                started = time.perf_counter()
+                response = self._generate_with_template(category, original_text)
+                STAGE_SECONDS.observe(time.perf_counter() - started, "generation", "template")
+                annotate(backend="template")
+                return response, False
                 
         except Exception as e:
             logger.error(f"Erro na geração de resposta: {e}")
-            return self._fallback_response(category)
+            FALLBACKS.inc("generation", "template", "fallback")
+            return self._fallback_response(category), True
     
-    async def _generate_with_gemini(self, category: str, text: str) -> str:
+    async def _generate_with_gemini(self, category: str, text: str, on_delta=None) -> Tuple[str, bool]:
         """Gera resposta usando Gemini API"""
+        if not has_budget(self.min_budget):
+            # Prazo do job quase esgotado: o template responde na hora
+            record_degradation("generation", "gemini", "template")
+            return self._template_fallback(category, text, gemini_skipped="deadline"), True
+        
+        timeout = remaining_budget(self.timeout)
+        started = time.perf_counter()
+        streamed = False
+        
+        def forward(chunk: str):
+            nonlocal streamed
+            streamed = True
+            on_delta(chunk)
+        
         try:
-            prompt = self._build_gemini_prompt(category, text)
-            response = self.gemini_model.generate_content(prompt)
-            return response.text.strip()
+            # Lote (opt-in) tem precedência: emails curtos agrupados não recebem deltas, só a resposta final
+            if self.batcher is not None and len(text) <= self.batcher.max_chars:
+                annotate(batched=True)
+                call = self.batcher.submit(category, text)
+            elif on_delta is not None and self.streaming_enabled and hasattr(self.gemini_client, 'stream'):
+                annotate(streamed=True)
+                call = self._stream_gemini(self._build_gemini_prompt(category, text), forward)
+            else:
+                call = self._call_gemini(self._build_gemini_prompt(category, text))
+            response = await asyncio.wait_for(call, timeout) if timeout else await call
+            STAGE_SECONDS.observe(time.perf_counter() - started, "generation", "gemini")
+            annotate(backend="gemini")
+            return response, False
         except Exception as e:
-            logger.error(f"Erro no Gemini: {e}")
-            return self._generate_with_template(category, text)
+            logger.error(f"Erro no Gemini: {e!r}")
+            BACKEND_ERRORS.inc("gemini")
+            FALLBACKS.inc("generation", "gemini", "template")
+            if isinstance(e, asyncio.TimeoutError) and timeout != self.timeout:
+                record_degradation("generation", "gemini", "template")
+            response = self._template_fallback(category, text, gemini_error=type(e).__name__)
+            if streamed:
+                # Os clientes já receberam parte do texto do Gemini: o template substitui tudo
+                on_delta(response, reset=True)
+            return response, True
+    
+    def _template_fallback(self, category: str, text: str, **attrs) -> str:
+        started = time.perf_counter()
+        response = self._generate_with_template(category, text)
+        STAGE_SECONDS.observe(time.perf_counter() - started, "generation", "template")
+        annotate(backend="template", **attrs)
+        return response
+    
+    async def _call_gemini(self, prompt: str) -> str:
+        """Chama o cliente Gemini respeitando o limite de concorrência"""
+        if self._gemini_slots is None:
+            self._gemini_slots = asyncio.Semaphore(self.max_concurrency)
+        
+        async with self._gemini_slots:
+            response = await self.gemini_client.generate(prompt)
+        return response.strip()
+    
+    async def _stream_gemini(self, prompt: str, on_delta: Callable[[str], None]) -> str:
+        """Como _call_gemini, mas repassa cada trecho a on_delta e mede o tempo até o primeiro"""
+        if self._gemini_slots is None:
+            self._gemini_slots = asyncio.Semaphore(self.max_concurrency)
+        
+        chunks = []
+        async with self._gemini_slots:
+            started = time.perf_counter()
+            async for chunk in self.gemini_client.stream(prompt):
+                if not chunk:
+                    continue
+                if not chunks:
+                    ttft = time.perf_counter() - started
+                    GENERATION_TTFT_SECONDS.observe(ttft, "gemini")
+                    annotate(ttft_ms=round(ttft * 1000, 3))
+                chunks.append(chunk)
+                on_delta(chunk)
+        return "".join(chunks).strip()
     
     def _build_gemini_prompt(self, category: str, text: str) -> str:
         """Constrói prompt para Gemini"""
@@ -74,36 +428,36 @@ class ResponseGenerator:
 
             RESPOSTA:"""
     
-    def _generate_with_template(self, category: str, text: str) -> str:
-        """Gera resposta usando templates inteligentes"""
-        text_lower = text.lower()
+    def _build_batch_prompt(self, category: str, texts: List[str]) -> str:
+        """Constrói prompt único para vários emails da mesma categoria"""
+        if category == "Produtivo":
+            guidelines = """- Português formal brasileiro
+            - Demonstrar empatia e compreensão
+            - Oferecer solução ou encaminhamento claro
+            - Incluir prazos realistas
+            - Máximo 100 palavras por resposta"""
+        else:
+            guidelines = """- Português educado
+            - Agradecimento genuíno
+            - Brevidade com elegância
+            - Máximo 50 palavras por resposta"""
         
-        templates = {
-            "Produtivo": self._get_productive_template(text_lower),
-            "Improdutivo": self._get_unproductive_template(text_lower)
-        }
+        emails = "\n\n".join(f"EMAIL {idx}:\n{text[:800]}" for idx, text in enumerate(texts, start=1))
         
-        return templates[category]
-    
-    def _get_productive_template(self, text_lower: str) -> str:
-        """Template para emails produtivos"""
-        if any(kw in text_lower for kw in ['pedido', 'solicitação', 'status']):
-            return "Agradecemos seu contato. Seu pedido está em processamento. Retornaremos com atualizações em breve."
-        elif any(kw in text_lower for kw in ['problema', 'erro', 'bug']):
-            return "Obrigado por relatar o problema. Nossa equipe técnica foi acionada e retornará em breve."
-        elif any(kw in text_lower for kw in ['pagamento', 'fatura', 'cobrança']):
-            return "Agradecemos sua mensagem. Nossa equipe financeira analisará e retornará em até 24h."
-        else:
-            return "Agradecemos seu contato. Nossa equipe analisará sua solicitação e retornará em breve."
+        return f"""Gere uma resposta para cada email abaixo, de forma independente.
+
+            DIRETRIZES:
+            {guidelines}
+
+            Responda SOMENTE com um array JSON no formato [{{"id": <número do email>, "resposta": "<texto>"}}].
+
+{emails}
+
+            RESPOSTAS:"""
     
-    def _get_unproductive_template(self, text_lower: str) -> str:
-        """Template para emails improdutivos"""
-        if any(kw in text_lower for kw in ['natal', 'ano novo']):
-            return "Agradecemos as felicitações! Desejamos um excelente final de ano!"
-        elif any(kw in text_lower for kw in ['obrigado', 'agradeço']):
-            return "Obrigado pelo feedback! Ficamos felizes em ajudar."
-        else:
-            return "Agradecemos suas gentis palavras! Desejamos um ótimo dia."
+    def _generate_with_template(self, category: str, text: str) -> str:
+        """Gera resposta usando templates inteligentes (regras em KEYWORD_RULES_PATH)"""
+        return keyword_rules.template(category, text)
     
     def _fallback_response(self, category: str) -> str:
         """Resposta fallback"""
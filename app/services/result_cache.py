@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class ResultCache:
+    """Cache LRU + TTL em memória com camada opcional em SQLite compartilhada entre workers.
+
+    Com o SQLite, cada namespace tem uma época gravada no banco; invalidar incrementa
+    a época e as entradas em memória de todos os workers gravadas na época anterior
+    deixam de valer (a época é relida a cada epoch_check_interval segundos).
+    """
+
+    ALL_NAMESPACES = "*"
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 50_000_000,
+                 ttl_seconds: float = 3600.0, db_path: Optional[str] = None,
+                 epoch_check_interval: float = 1.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+        self._db_lock = threading.Lock()
+        self.epoch_check_interval = epoch_check_interval
+        self._epochs: Dict[str, int] = {}
+        self._epochs_checked_at = None
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # Conexão aberta sob demanda em cada processo (seguro com preload do gunicorn)
+        if self.db_path and self._db_pid != os.getpid():
+            self._db_pid = os.getpid()
+            self._open_db(self.db_path)
+        return self._db
+
+    def _open_db(self, db_path: str):
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_namespace ON result_cache(namespace)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache_epochs (namespace TEXT PRIMARY KEY, epoch INTEGER NOT NULL)"
+            )
+            self._db.execute("DELETE FROM result_cache WHERE expires_at < ?", (time.time(),))
+            logger.info(f"Cache de resultados em disco: {db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Cache em disco indisponível: {e}")
+            self._db = None
+
+    @staticmethod
+    def make_key(namespace: str, version: str, *parts: str) -> str:
+        """Chave por conteúdo: hash do texto normalizado + namespace + versão"""
+        digest = hashlib.sha256()
+        digest.update(f"{namespace}\0{version}".encode("utf-8"))
+        for part in parts:
+            normalized = WHITESPACE_PATTERN.sub(" ", part or "").strip().casefold()
+            digest.update(b"\0" + normalized.encode("utf-8"))
+        return f"{namespace}:{digest.hexdigest()}"
+
+    def epochs(self) -> Dict[str, int]:
+        """Épocas de invalidação compartilhadas (vazio sem a camada em disco)"""
+        if self._connection() is None:
+            return {}
+        now = time.monotonic()
+        if self._epochs_checked_at is None or now - self._epochs_checked_at >= self.epoch_check_interval:
+            try:
+                with self._db_lock:
+                    self._epochs = dict(self._db.execute("SELECT namespace, epoch FROM result_cache_epochs").fetchall())
+                self._epochs_checked_at = now
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao ler épocas do cache: {e}")
+        return self._epochs
+
+    def _epoch(self, key: str) -> Tuple[int, int]:
+        epochs = self.epochs()
+        return epochs.get(key.split(":", 1)[0], 0), epochs.get(self.ALL_NAMESPACES, 0)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, size, epoch = entry
+            if epoch != self._epoch(key):
+                # Invalidado por outro worker depois de gravado aqui
+                self._remove(key)
+            elif expires_at > now:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            else:
+                self._remove(key)
+                self._stats["expired"] += 1
+
+        if self._connection() is not None:
+            value = self._db_get(key, now)
+            if value is not None:
+                self._stats["disk_hits"] += 1
+                self._store(key, value, now + self.ttl)
+                return value
+
+        self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        self._store(key, value, expires_at)
+
+        if self._connection() is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO result_cache (key, namespace, value, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, key.split(":", 1)[0], json.dumps(value, ensure_ascii=False), expires_at)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao gravar cache em disco: {e}")
+
+    def invalidate(self, namespace: Optional[str] = None) -> int:
+        """Remove entradas de um namespace (ou todas), p.ex. após retreinar o modelo"""
+        prefix = f"{namespace}:" if namespace else ""
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            self._remove(key)
+
+        if self._connection() is not None:
+            try:
+                with self._db_lock:
+                    if namespace:
+                        self._db.execute("DELETE FROM result_cache WHERE namespace = ?", (namespace,))
+                    else:
+                        self._db.execute("DELETE FROM result_cache")
+                    self._db.execute(
+                        "INSERT INTO result_cache_epochs (namespace, epoch) VALUES (?, 1) "
+                        "ON CONFLICT(namespace) DO UPDATE SET epoch = epoch + 1",
+                        (namespace or self.ALL_NAMESPACES,)
+                    )
+                self._epochs_checked_at = None
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao invalidar cache em disco: {e}")
+
+        self._stats["invalidations"] += 1
+        logger.info(f"🧹 Cache invalidado ({namespace or 'todos'}): {len(keys)} entradas em memória")
+        return len(keys)
+
+    def _db_get(self, key: str, now: float):
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value FROM result_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Erro ao ler cache em disco: {e}")
+            return None
+
+    def _store(self, key: str, value: Any, expires_at: float):
+        if key in self._entries:
+            self._remove(key)
+
+        size = len(json.dumps(value, ensure_ascii=False)) + len(key)
+        self._entries[key] = (expires_at, value, size, self._epoch(key))
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "disk_enabled": bool(self.db_path),
+            "hit_rate": (self._stats["hits"] + self._stats["disk_hits"]) / lookups if lookups else 0.0,
+            **self._stats,
+        }
@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '1500'))
+HEAVY_MODULES = ("google.generativeai", "nltk", "pdfplumber", "sklearn", "scipy")
+
+def measure_import_time(module: str = "app.main") -> dict:
+    """Importa o módulo em um processo limpo com -X importtime e agrega os tempos (ms)"""
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # cabeçalho
+        name = fields[2].strip()
+        modules[name] = {"self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000}
+
+    return {
+        "module": module,
+        "total_ms": modules.get(module, {}).get("cumulative_ms", 0.0),
+        "budget_ms": IMPORT_TIME_BUDGET_MS,
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in modules],
+        "modules": modules,
+    }
+
+def main():
+    """Mostra os módulos mais lentos e falha se o import exceder o orçamento"""
+    report = measure_import_time(sys.argv[1] if len(sys.argv) > 1 else "app.main")
+
+    print(f"⏱️ Import de {report['module']}: {report['total_ms']:.0f} ms (orçamento {IMPORT_TIME_BUDGET_MS:.0f} ms)")
+    print("=" * 60)
+    app_modules = sorted(
+        ((name, times) for name, times in report["modules"].items() if name.startswith("app.")),
+        key=lambda item: item[1]["cumulative_ms"], reverse=True
+    )
+    for name, times in app_modules[:15]:
+        print(f"🔹 {name:<40} {times['cumulative_ms']:>8.1f} ms")
+    print("=" * 60)
+    slowest = sorted(report["modules"].items(), key=lambda item: item[1]["self_ms"], reverse=True)
+    for name, times in slowest[:10]:
+        print(f"   {name:<40} {times['self_ms']:>8.1f} ms (próprio)")
+
+    if report["heavy_modules_loaded"]:
+        print(f"⚠️ Dependências pesadas importadas na inicialização: {', '.join(report['heavy_modules_loaded'])}")
+
+    output = os.getenv('IMPORT_TIME_REPORT')
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if report["total_ms"] > IMPORT_TIME_BUDGET_MS:
+        print(f"❌ Orçamento de import excedido")
+        sys.exit(1)
+    print("✅ Dentro do orçamento")
+
+if __name__ == "__main__":
+    main()
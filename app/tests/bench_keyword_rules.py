@@ -0,0 +1,143 @@
+import json
+import os
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from app.services.keyword_rules import CompiledRules, KeywordRuleEngine
+
+KEYWORD_BENCH_ITERATIONS = int(os.getenv('KEYWORD_BENCH_ITERATIONS', '2000'))
+RULE_COUNTS = (20, 100, 500)
+
+SAMPLES = {
+    "curto": "Olá, estou com um problema no sistema e preciso de suporte urgente. Obrigado!",
+    "medio": (
+        "Prezados, gostaria de saber o status do meu pedido 4821. "
+        "A fatura veio com valor diferente do combinado e preciso de ajuda. "
+    ) * 20,
+    "grande": (
+        "Segue em anexo o relatório completo do trimestre com todos os indicadores operacionais, "
+        "observações da equipe comercial e o detalhamento dos contratos renovados no período. "
+    ) * 400 + "Aguardo retorno sobre o erro na cobrança.",
+    # Substring dentro de outra palavra: "erro" em "terror" tornava o email produtivo
+    "falso_positivo": "Que filme de terror incrível, assisti com a família no feriado!",
+}
+
+
+class LegacyKeywordRules:
+    """Implementação anterior (varreduras `word in text_lower`), mantida só para comparação"""
+
+    def classify(self, text: str) -> str:
+        text_lower = text.lower()
+        productive_words = ['problema', 'erro', 'solicitação', 'pedido', 'status', 'suporte', 'urgente']
+        unproductive_words = ['obrigado', 'agradeço', 'parabéns', 'feliz', 'natal', 'cumprimentos']
+        productive_count = sum(1 for word in productive_words if word in text_lower)
+        unproductive_count = sum(1 for word in unproductive_words if word in text_lower)
+        return "Produtivo" if productive_count > unproductive_count else "Improdutivo"
+
+    def template(self, category: str, text: str) -> str:
+        text_lower = text.lower()
+        if category == "Produtivo":
+            if any(kw in text_lower for kw in ['pedido', 'solicitação', 'status']):
+                return "pedido"
+            elif any(kw in text_lower for kw in ['problema', 'erro', 'bug']):
+                return "problema"
+            elif any(kw in text_lower for kw in ['pagamento', 'fatura', 'cobrança']):
+                return "financeiro"
+            return "padrão"
+        if any(kw in text_lower for kw in ['natal', 'ano novo']):
+            return "festas"
+        elif any(kw in text_lower for kw in ['obrigado', 'agradeço']):
+            return "agradecimento"
+        return "padrão"
+
+
+def timed(function, text: str, iterations: int) -> float:
+    """Tempo médio por chamada em microssegundos"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function(text)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run_benchmark(iterations: int = KEYWORD_BENCH_ITERATIONS) -> dict:
+    legacy = LegacyKeywordRules()
+    rules = KeywordRuleEngine(reload_interval=0).rules
+
+    def legacy_fallback(text):
+        return legacy.template(legacy.classify(text), text)
+
+    def engine_fallback(text):
+        # Sem reaproveitar varreduras de iterações anteriores: só a do próprio email
+        rules.scan.cache_clear()
+        return rules.template(rules.classify(text), text)
+
+    results = {}
+    for name, text in SAMPLES.items():
+        runs = max(10, iterations * 100 // max(len(text), 100))
+        results[name] = {
+            "chars": len(text),
+            "legacy_us": timed(legacy_fallback, text, runs),
+            "engine_us": timed(engine_fallback, text, runs),
+            "legacy_category": legacy.classify(text),
+            "engine_category": rules.classify(text),
+        }
+    return results
+
+
+def run_scaling_benchmark(text: str, iterations: int = KEYWORD_BENCH_ITERATIONS) -> dict:
+    """Custo de uma varredura conforme o número de palavras-chave cresce"""
+    generator = random.Random(42)
+    results = {}
+    for count in RULE_COUNTS:
+        words = ["".join(generator.choice(string.ascii_lowercase) for _ in range(generator.randint(5, 10)))
+                 for _ in range(count)]
+        rules = CompiledRules({"classification": {"categories": {"Produtivo": words}}})
+
+        def legacy_scan(text):
+            text_lower = text.lower()
+            return sum(1 for word in words if word in text_lower)
+
+        def engine_scan(text):
+            rules.scan.cache_clear()
+            return len(rules.scan(text))
+
+        runs = max(5, iterations * 20 // max(len(text), 100))
+        results[count] = {"legacy_us": timed(legacy_scan, text, runs), "engine_us": timed(engine_scan, text, runs)}
+    return results
+
+
+def main():
+    """Compara o motor compilado com a implementação anterior em textos de vários tamanhos"""
+    results = run_benchmark()
+
+    print("🔎 Classificação + template por palavras-chave: motor compilado vs. varredura por substring")
+    print("=" * 78)
+    print(f"{'amostra':<16}{'chars':>8}{'antes (µs)':>14}{'depois (µs)':>14}{'categoria antes/depois':>26}")
+    for name, result in results.items():
+        print(
+            f"{name:<16}{result['chars']:>8}"
+            f"{result['legacy_us']:>14.1f}"
+            f"{result['engine_us']:>14.1f}"
+            f"{result['legacy_category'] + ' / ' + result['engine_category']:>26}"
+        )
+    print("=" * 78)
+
+    scaling = run_scaling_benchmark(SAMPLES["medio"])
+    print(f"📈 Varredura de {len(SAMPLES['medio'])} caracteres por número de palavras-chave")
+    for count, result in scaling.items():
+        print(f"{count:>6} palavras-chave {result['legacy_us']:>12.1f} µs {result['engine_us']:>12.1f} µs")
+    print("=" * 78)
+
+    output = os.getenv('KEYWORD_BENCH_REPORT')
+    if output:
+        with open(output, 'w') as f:
+            json.dump({"samples": results, "scaling": scaling}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""Benchmark de carga ponta a ponta.
+
+Sobe os backends falsos (HF e Gemini) e a API com uvicorn, dispara uma carga
+mista de textos e PDFs em /classify-email, acompanha cada job por polling ou
+WebSocket e grava throughput e p50/p95/p99 por endpoint e por etapa em JSON.
+
+Uso:
+    python -m app.tests.bench_load --requests 200 --concurrency 20 --pdf-ratio 0.2 --output bench.json
+    python -m app.tests.bench_load --target http://127.0.0.1:8000   # API já em execução
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parents[2]
+TERMINAL_STATUSES = ("completed", "failed")
+
+SAMPLE_TEXTS = [
+    "Olá, estou com um erro no sistema ao gerar o relatório mensal, podem verificar?",
+    "Preciso de suporte para atualizar meu cadastro, o formulário não salva.",
+    "Qual o status da minha solicitação de reembolso aberta semana passada?",
+    "Feliz natal a toda a equipe! Obrigado pela parceria neste ano.",
+    "Parabéns pelo excelente trabalho na apresentação de ontem.",
+    "Bom dia, segue em anexo o comprovante solicitado para análise do chamado.",
+]
+
+
+def make_pdf(pages: int = 2, lines_per_page: int = 40) -> bytes:
+    """Gera um PDF simples com texto (sem dependências externas)"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>")
+    font = 3 + 2 * pages
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>"
+        )
+        stream = "".join(
+            f"BT /F1 10 Tf 40 {760 - j * 18} Td (Pagina {i} linha {j}: preciso de suporte com erro no sistema) Tj ET\n"
+            for j in range(lines_per_page)
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}endstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF"
+    return out.encode("latin-1")
+
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples: List[float], errors: int = 0) -> dict:
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else None,
+        "p50_ms": _ms(percentile(samples, 50)),
+        "p95_ms": _ms(percentile(samples, 95)),
+        "p99_ms": _ms(percentile(samples, 99)),
+    }
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return value * 1000 if value is not None else None
+
+
+def parse_histograms(text: str, name: str) -> Dict[tuple, dict]:
+    """Lê buckets/sum/count de um histograma do /metrics, agrupados pelos labels (sem `le`)"""
+    series = defaultdict(lambda: {"buckets": [], "sum": 0.0, "count": 0})
+    for line in text.splitlines():
+        if not line.startswith(name):
+            continue
+        metric, _, value = line.rpartition(" ")
+        base, _, label_text = metric.partition("{")
+        labels = {}
+        for pair in label_text.rstrip("}").split(","):
+            if "=" in pair:
+                key, _, raw = pair.partition("=")
+                labels[key] = raw.strip('"')
+        le = labels.pop("le", None)
+        key = tuple(sorted(labels.items()))
+        if base == f"{name}_bucket":
+            bound = math.inf if le == "+Inf" else float(le)
+            series[key]["buckets"].append((bound, float(value)))
+        elif base == f"{name}_sum":
+            series[key]["sum"] = float(value)
+        elif base == f"{name}_count":
+            series[key]["count"] = float(value)
+    return dict(series)
+
+
+def histogram_quantile(buckets: List[tuple], q: float) -> Optional[float]:
+    """Mesma interpolação linear do histogram_quantile do Prometheus"""
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == math.inf:
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def stage_report(before: str, after: str) -> dict:
+    """Diferença dos histogramas do servidor entre o início e o fim da carga"""
+    report = {}
+    for name in ("email_pipeline_stage_seconds", "email_job_queue_wait_seconds", "email_job_duration_seconds"):
+        start = parse_histograms(before, name)
+        for key, end in parse_histograms(after, name).items():
+            base = start.get(key, {"buckets": [], "sum": 0.0, "count": 0})
+            base_buckets = dict(base["buckets"])
+            buckets = [(bound, count - base_buckets.get(bound, 0.0)) for bound, count in end["buckets"]]
+            count = end["count"] - base["count"]
+            if count <= 0:
+                continue
+            label = ",".join(f"{k}={v}" for k, v in key) or "all"
+            report[f"{name}[{label}]"] = {
+                "count": int(count),
+                "mean_ms": (end["sum"] - base["sum"]) / count * 1000,
+                "p50_ms": _ms(histogram_quantile(buckets, 0.50)),
+                "p95_ms": _ms(histogram_quantile(buckets, 0.95)),
+                "p99_ms": _ms(histogram_quantile(buckets, 0.99)),
+            }
+    return report
+
+
+class LoadRunner:
+    def __init__(self, base_url: str, args):
+        self.base_url = base_url.rstrip("/")
+        self.args = args
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.pdf_payload = make_pdf(args.pdf_pages)
+
+    def _record(self, name: str, elapsed: float, ok: bool = True):
+        if ok:
+            self.latencies[name].append(elapsed)
+        else:
+            self.errors[name] += 1
+
+    async def run(self) -> dict:
+        connector = aiohttp.TCPConnector(limit=self.args.concurrency * 2)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            metrics_before = await self._metrics(session)
+            queue = asyncio.Queue()
+            for number in range(self.args.requests):
+                queue.put_nowait(number)
+
+            started = time.perf_counter()
+            await asyncio.gather(*[self._user(session, queue) for _ in range(self.args.concurrency)])
+            duration = time.perf_counter() - started
+
+            metrics_after = await self._metrics(session)
+            async with session.get(f"{self.base_url}/health") as response:
+                health = await response.json()
+
+        completed = self.statuses.get("completed", 0)
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key != "output"},
+            "duration_seconds": duration,
+            "throughput_jobs_per_second": completed / duration if duration else 0.0,
+            "job_statuses": dict(self.statuses),
+            "endpoints": {name: summarize(self.latencies.get(name, []), self.errors.get(name, 0))
+                          for name in sorted(set(self.latencies) | set(self.errors))},
+            "server_stages": stage_report(metrics_before, metrics_after),
+            "server": {key: health.get(key) for key in ("job_queue", "ml_batching", "hf_circuit", "pdf_extraction", "startup")},
+        }
+
+    async def _metrics(self, session: aiohttp.ClientSession) -> str:
+        try:
+            async with session.get(f"{self.base_url}/metrics") as response:
+                return await response.text()
+        except aiohttp.ClientError:
+            return ""
+
+    async def _user(self, session: aiohttp.ClientSession, queue: asyncio.Queue):
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            is_pdf = random.random() < self.args.pdf_ratio
+            watch = "ws" if random.random() < self.args.ws_ratio else "poll"
+            kind = "pdf" if is_pdf else "text"
+            try:
+                await self._job(session, kind, watch)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.errors[f"job {kind}"] += 1
+                print(f"❌ Erro no job ({kind}/{watch}): {e}", file=sys.stderr)
+
+    async def _job(self, session: aiohttp.ClientSession, kind: str, watch: str):
+        form = aiohttp.FormData()
+        if kind == "pdf":
+            form.add_field("file", self.pdf_payload, filename="bench.pdf", content_type="application/pdf")
+        else:
+            form.add_field("text", f"{random.choice(SAMPLE_TEXTS)} #{random.randint(0, 10 ** 6)}")
+
+        started = time.perf_counter()
+        async with session.post(f"{self.base_url}/classify-email", data=form) as response:
+            body = await response.json(content_type=None)
+            elapsed = time.perf_counter() - started
+            ok = response.status in (200, 202)
+            self._record(f"POST /classify-email ({kind})", elapsed, ok)
+            if not ok:
+                self.statuses[f"http_{response.status}"] += 1
+                return
+
+        if "job_id" not in body:
+            # Resposta síncrona (mode=sync) já traz o resultado
+            self.statuses["completed"] += 1
+            self._record(f"job {kind} (sync)", elapsed)
+            return
+
+        job_id = body["job_id"]
+        if watch == "ws":
+            status = await self._watch_ws(session, job_id, kind, started)
+        else:
+            status = await self._watch_poll(session, job_id)
+        self.statuses[status] += 1
+        self._record(f"job {kind} ({watch})", time.perf_counter() - started, status == "completed")
+
+    async def _watch_poll(self, session: aiohttp.ClientSession, job_id: str) -> str:
+        deadline = time.monotonic() + self.args.job_timeout
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            async with session.get(f"{self.base_url}/job-status/{job_id}") as response:
+                data = await response.json(content_type=None)
+                self._record("GET /job-status", time.perf_counter() - started, response.status == 200)
+            if data.get("status") in TERMINAL_STATUSES:
+                return data["status"]
+            await asyncio.sleep(self.args.poll_interval)
+        return "timeout"
+
+    async def _watch_ws(self, session: aiohttp.ClientSession, job_id: str, kind: str, job_started: float) -> str:
+        ws_url = self.base_url.replace("http", "ws", 1) + f"/ws/job-status/{job_id}"
+        started = time.perf_counter()
+        first_delta = True
+        async with session.ws_connect(ws_url) as ws:
+            self._record("WS connect", time.perf_counter() - started)
+            try:
+                while True:
+                    message = await ws.receive_json(timeout=self.args.job_timeout)
+                    if message.get("type") == "delta":
+                        if first_delta:
+                            # Tempo percebido até o primeiro trecho da resposta sugerida
+                            self._record(f"job {kind} (ws first delta)", time.perf_counter() - job_started)
+                            first_delta = False
+                        continue
+                    if message.get("status") in TERMINAL_STATUSES:
+                        return message["status"]
+            except (TypeError, asyncio.TimeoutError):
+                return "timeout"
+
+
+def _start_process(command: List[str], env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Servidor não respondeu em {url}")
+
+
+async def main_async(args) -> dict:
+    processes = []
+    base_url = args.target
+    try:
+        if not base_url:
+            env = {**os.environ, "PYTHONPATH": str(ROOT), "RATE_LIMIT_ENABLED": "false"}
+            fake_url = f"http://127.0.0.1:{args.fake_port}"
+            processes.append(_start_process([
+                sys.executable, "-m", "app.tests.fake_backends", "--port", str(args.fake_port),
+                "--hf-latency-ms", str(args.hf_latency_ms), "--gemini-latency-ms", str(args.gemini_latency_ms),
+                "--gemini-chunk-ms", str(args.gemini_chunk_ms), "--error-rate", str(args.error_rate),
+            ], env, Path(args.log_dir) / "bench_fake_backends.log"))
+            await _wait_ready(f"{fake_url}/stats")
+
+            env.update({
+                "HF_API_KEY": "fake", "HF_API_URL": f"{fake_url}/hf",
+                "GEMINI_CLIENT": "rest", "GEMINI_API_KEY": "fake", "GEMINI_API_URL": fake_url,
+                "GEMINI_MODEL": env.get("GEMINI_MODEL") or "gemini-bench",
+            })
+            if not args.with_cache:
+                # O sufixo aleatório não escapa do índice de quase duplicatas (números viram 0)
+                env.update({"RESULT_CACHE_ENABLED": "false", "NEAR_DUP_ENABLED": "false"})
+            processes.append(_start_process([
+                sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning",
+            ], env, Path(args.log_dir) / "bench_api.log"))
+            base_url = f"http://127.0.0.1:{args.port}"
+            await _wait_ready(f"{base_url}/health")
+
+        return await LoadRunner(base_url, args).run()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga da API de classificação")
+    parser.add_argument("--target", help="URL de uma API já em execução (não sobe servidores)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--pdf-ratio", type=float, default=0.2)
+    parser.add_argument("--pdf-pages", type=int, default=3)
+    parser.add_argument("--ws-ratio", type=float, default=0.5, help="Fração dos jobs acompanhados por WebSocket")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--job-timeout", type=float, default=60)
+    parser.add_argument("--hf-latency-ms", type=float, default=80)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300)
+    parser.add_argument("--gemini-chunk-ms", type=float, default=20, help="Intervalo entre trechos no streaming do Gemini falso")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--log-dir", default=os.getenv('TMPDIR', '/tmp'))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="Mantém o cache de resultados e o de quase duplicatas na API iniciada pelo bench")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"📊 {report['job_statuses']} em {report['duration_seconds']:.1f}s "
+          f"({report['throughput_jobs_per_second']:.1f} jobs/s)")
+    print("=" * 70)
+    for name, stats in {**report["endpoints"], **report["server_stages"]}.items():
+        if stats["p50_ms"] is None:
+            continue
+        print(f"🔹 {name:<60} n={stats['count']:<5} p50={stats['p50_ms']:.0f}ms "
+              f"p95={stats['p95_ms']:.0f}ms p99={stats['p99_ms']:.0f}ms")
+    print(f"💾 Resultados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
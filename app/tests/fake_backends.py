@@ -0,0 +1,117 @@
+"""Servidor local que imita a Inference API do Hugging Face e a API REST do Gemini.
+
+Uso: python -m app.tests.fake_backends --port 8900 --hf-latency-ms 80 --gemini-latency-ms 300 --error-rate 0.05
+
+No streaming (streamGenerateContent?alt=sse) a latência do Gemini vale até o
+primeiro trecho; os demais chegam a cada --gemini-chunk-ms.
+
+Aponte a aplicação para ele com:
+    HF_API_KEY=fake HF_API_URL=http://127.0.0.1:8900/hf
+    GEMINI_CLIENT=rest GEMINI_API_KEY=fake GEMINI_API_URL=http://127.0.0.1:8900
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+from app.services.response_generator import StubGeminiClient
+
+CONFIG = web.AppKey("config", dict)
+STATS = web.AppKey("stats", dict)
+
+
+def _jitter(latency_ms: float) -> float:
+    # Latência com variação de ±25% para não gerar filas em degraus
+    return max(0.0, latency_ms * random.uniform(0.75, 1.25)) / 1000
+
+
+def create_app(hf_latency_ms: float = 50, gemini_latency_ms: float = 200, error_rate: float = 0.0,
+               gemini_chunk_ms: float = 20) -> web.Application:
+    gemini = StubGeminiClient(chunk_delay_ms=gemini_chunk_ms)
+    stats = {"hf": 0, "gemini": 0, "errors": 0, "hf_connections": 0}
+    # Ajustável em tempo de execução pelos testes (app[CONFIG]["error_rate"])
+    config = {"error_rate": error_rate}
+    hf_peers = set()
+
+    def should_fail() -> bool:
+        if config["error_rate"] and random.random() < config["error_rate"]:
+            stats["errors"] += 1
+            return True
+        return False
+
+    async def hf_classify(request: web.Request):
+        stats["hf"] += 1
+        # Conexões TCP distintas vistas pelo servidor, para verificar o pool do cliente
+        hf_peers.add(request.transport.get_extra_info("peername") if request.transport else None)
+        stats["hf_connections"] = len(hf_peers)
+        payload = await request.json()
+        await asyncio.sleep(_jitter(hf_latency_ms))
+        if should_fail():
+            return web.json_response({"error": "Model is overloaded"}, status=503)
+
+        text = str(payload.get("inputs", "")).lower()
+        productive = any(word in text for word in ("suporte", "erro", "problema", "ajuda", "solicit", "status"))
+        score = random.uniform(0.7, 0.99)
+        return web.json_response([[
+            {"label": "LABEL_1" if productive else "LABEL_2", "score": score},
+            {"label": "LABEL_2" if productive else "LABEL_1", "score": 1 - score},
+        ]])
+
+    async def gemini_generate(request: web.Request):
+        stats["gemini"] += 1
+        payload = await request.json()
+        await asyncio.sleep(_jitter(gemini_latency_ms))
+        if should_fail():
+            return web.json_response({"error": {"code": 503, "message": "The model is overloaded."}}, status=503)
+
+        prompt = "".join(part.get("text", "") for part in payload["contents"][0]["parts"])
+        text = await gemini.generate(prompt)
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+    async def gemini_stream(request: web.Request):
+        stats["gemini"] += 1
+        payload = await request.json()
+        await asyncio.sleep(_jitter(gemini_latency_ms))
+        if should_fail():
+            return web.json_response({"error": {"code": 503, "message": "The model is overloaded."}}, status=503)
+
+        prompt = "".join(part.get("text", "") for part in payload["contents"][0]["parts"])
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        async for chunk in gemini.stream(prompt):
+            event = {"candidates": [{"content": {"parts": [{"text": chunk}], "role": "model"}}]}
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def get_stats(request: web.Request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app[CONFIG] = config
+    app[STATS] = stats
+    app.router.add_post("/hf", hf_classify)
+    app.router.add_post(r"/v1beta/models/{model}:generateContent", gemini_generate)
+    app.router.add_post(r"/v1beta/models/{model}:streamGenerateContent", gemini_stream)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backends falsos de HF e Gemini para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--hf-latency-ms", type=float, default=50)
+    parser.add_argument("--gemini-latency-ms", type=float, default=200)
+    parser.add_argument("--gemini-chunk-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(args.hf_latency_ms, args.gemini_latency_ms, args.error_rate, args.gemini_chunk_ms)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
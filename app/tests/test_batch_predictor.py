@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.ml_model import BatchPredictor
+
+
+class EchoModel:
+    def predict_batch(self, texts):
+        time.sleep(0.01)
+        return [("Produtivo", float(len(text))) for text in texts]
+
+
+def test_items_left_by_a_dead_worker_move_to_the_new_one():
+    predictor = BatchPredictor(EchoModel(), max_wait_ms=1)
+
+    async def scenario():
+        assert await predictor.predict("a") == ("Produtivo", 1.0)
+        predictor._worker.cancel()
+        await asyncio.sleep(0)
+        # Item que ficou na fila do worker cancelado
+        orphan = asyncio.get_running_loop().create_future()
+        predictor._queue.put_nowait(("abc", orphan, time.perf_counter()))
+
+        result = await asyncio.wait_for(predictor.predict("ab"), timeout=1)
+        return result, await asyncio.wait_for(orphan, timeout=1)
+
+    assert asyncio.run(scenario()) == (("Produtivo", 2.0), ("Produtivo", 3.0))
+
+
+def test_batch_in_hand_fails_when_worker_is_cancelled():
+    predictor = BatchPredictor(EchoModel(), max_wait_ms=1000)
+
+    async def scenario():
+        pending = asyncio.create_task(predictor.predict("a"))
+        await asyncio.sleep(0.05)
+        # O worker está juntando o lote: cancelar não pode deixar o chamador esperando para sempre
+        predictor._worker.cancel()
+        return await asyncio.wait_for(pending, timeout=1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+
+
+def test_worker_is_recreated_on_a_new_event_loop():
+    predictor = BatchPredictor(EchoModel(), max_wait_ms=1)
+
+    async def predict(text):
+        return await asyncio.wait_for(predictor.predict(text), timeout=1)
+
+    assert asyncio.run(predict("a")) == ("Produtivo", 1.0)
+    assert asyncio.run(predict("ab")) == ("Produtivo", 2.0)
@@ -0,0 +1,46 @@
+import asyncio
+from app.services.classifier import EmailClassifier
+from app.services.http_client import CircuitBreaker
+
+
+class SlowHTTPClient:
+    async def post_json(self, url, payload, headers=None):
+        await asyncio.sleep(10)
+
+
+def test_cancelled_half_open_probe_releases_breaker():
+    classifier = EmailClassifier()
+    classifier.hf_api_key = "fake"
+    classifier.http_client = SlowHTTPClient()
+    classifier.hf_breaker = CircuitBreaker("huggingface", failure_threshold=1, recovery_timeout=0)
+    classifier.hf_breaker.record_failure()
+
+    async def cancelled_probe():
+        try:
+            await asyncio.wait_for(classifier._classify_with_hf("texto qualquer"), timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(cancelled_probe())
+
+    # A sonda cancelada não conta como falha, mas libera a próxima
+    assert classifier.hf_breaker.stats()["failures"] == 1
+    assert classifier.hf_breaker.allow_request()
+
+
+def test_cancelled_calls_do_not_open_breaker():
+    classifier = EmailClassifier()
+    classifier.hf_api_key = "fake"
+    classifier.http_client = SlowHTTPClient()
+    classifier.hf_breaker = CircuitBreaker("huggingface", failure_threshold=2, recovery_timeout=30)
+
+    async def cancelled_calls():
+        for _ in range(5):
+            try:
+                await asyncio.wait_for(classifier._classify_with_hf("texto qualquer"), timeout=0.01)
+            except asyncio.TimeoutError:
+                pass
+
+    asyncio.run(cancelled_calls())
+
+    assert classifier.hf_breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,105 @@
+import asyncio
+from aiohttp import web
+
+from app.services.classifier import EmailClassifier
+from app.services.http_client import AsyncHTTPClient, CircuitBreaker
+from app.tests.fake_backends import CONFIG, STATS, create_app
+
+
+async def _start_fake_hf(error_rate: float = 0.0):
+    app = create_app(hf_latency_ms=1, error_rate=error_rate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return app, runner, f"http://127.0.0.1:{port}/hf"
+
+
+def _classifier(url: str, client: AsyncHTTPClient, breaker: CircuitBreaker) -> EmailClassifier:
+    classifier = EmailClassifier()
+    classifier.hf_api_key = "fake"
+    classifier.hf_api_url = url
+    classifier.http_client = client
+    classifier.hf_breaker = breaker
+    return classifier
+
+
+def test_breaker_opens_after_consecutive_failures():
+    async def scenario():
+        app, runner, url = await _start_fake_hf(error_rate=1.0)
+        client = AsyncHTTPClient()
+        breaker = CircuitBreaker("huggingface", failure_threshold=3, recovery_timeout=30)
+        classifier = _classifier(url, client, breaker)
+        try:
+            results = [await classifier._classify_with_hf("preciso de suporte") for _ in range(5)]
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return results, app[STATS], breaker.stats()
+
+    results, server, breaker = asyncio.run(scenario())
+
+    assert results == [None] * 5
+    # Após 3 falhas o circuito abre e as chamadas seguintes nem chegam ao servidor
+    assert server["hf"] == 3
+    assert breaker["state"] == CircuitBreaker.OPEN
+    assert breaker["rejected"] == 2
+
+
+def test_half_open_probe_closes_breaker_when_backend_recovers():
+    async def scenario():
+        app, runner, url = await _start_fake_hf(error_rate=1.0)
+        client = AsyncHTTPClient()
+        breaker = CircuitBreaker("huggingface", failure_threshold=1, recovery_timeout=0.05)
+        classifier = _classifier(url, client, breaker)
+        try:
+            assert await classifier._classify_with_hf("preciso de suporte") is None
+            assert breaker.state == CircuitBreaker.OPEN
+
+            # Sonda falha: volta a abrir
+            await asyncio.sleep(0.06)
+            assert await classifier._classify_with_hf("preciso de suporte") is None
+            assert breaker.state == CircuitBreaker.OPEN
+
+            # Backend recuperado: uma única sonda passa e fecha o circuito
+            app[CONFIG]["error_rate"] = 0.0
+            await asyncio.sleep(0.06)
+            probe, concurrent = await asyncio.gather(
+                classifier._classify_with_hf("preciso de suporte"),
+                classifier._classify_with_hf("preciso de suporte"),
+            )
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return probe, concurrent, app[STATS], breaker.stats()
+
+    probe, concurrent, server, breaker = asyncio.run(scenario())
+
+    assert probe[0] == "Produtivo"
+    assert concurrent is None
+    assert server["hf"] == 3
+    assert breaker["state"] == CircuitBreaker.CLOSED
+    assert breaker["opened"] == 2
+
+
+def test_client_reuses_pooled_connections():
+    async def scenario():
+        app, runner, url = await _start_fake_hf()
+        client = AsyncHTTPClient(limit=4, limit_per_host=2)
+        try:
+            for _ in range(3):
+                statuses = await asyncio.gather(*(
+                    client.post_json(url, {"inputs": "preciso de suporte"}) for _ in range(10)
+                ))
+                assert all(status == 200 for status, _ in statuses)
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return app[STATS]
+
+    server = asyncio.run(scenario())
+
+    # 30 requisições sobre no máximo limit_per_host conexões mantidas vivas
+    assert server["hf"] == 30
+    assert 1 <= server["hf_connections"] <= 2
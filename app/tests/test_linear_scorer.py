@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from app.models.linear_scorer import CompiledLinearScorer
+from app.models.ml_model import MLModel
+
+# Cobre vocabulário, bigramas, termos repetidos (tf bruto), maiúsculas/acentos e texto sem termos conhecidos
+EMAILS = [
+    "Preciso de suporte técnico urgente, o sistema está com erro no login",
+    "Qual o status da minha solicitação de reembolso? Aguardo retorno",
+    "Feliz Natal e um próspero Ano Novo para toda a equipe!",
+    "Obrigado pela ajuda de ontem, muito obrigado mesmo, obrigado!",
+    "ERRO ERRO ERRO: problema problema no sistema de pagamento",
+    "Parabéns pelo excelente trabalho no projeto",
+    "xyzzy qwerty zzzz",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def trained(tmp_path_factory):
+    model = MLModel(model_path=str(tmp_path_factory.mktemp("models") / "classifier.pkl"))
+    model.train()
+    return model
+
+
+def test_compiled_scorer_matches_sklearn_predict_proba(trained, tmp_path):
+    scorer = CompiledLinearScorer.from_pipeline(trained.model)
+    scorer.save(tmp_path / "scorer.npz")
+    expected = trained.model.predict_proba(EMAILS)
+    classes = list(trained.model.classes_)
+
+    # O artefato salvo em .npz precisa dar o mesmo resultado que o scorer em memória
+    for compiled in (scorer, CompiledLinearScorer.load(tmp_path / "scorer.npz")):
+        assert compiled.classes == classes
+        actual = np.array([compiled.predict_proba_one(text) for text in EMAILS])
+        np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-12)
+        assert [label for label, _ in compiled.predict_batch(EMAILS)] == list(trained.model.predict(EMAILS))
+
+
+def test_compiled_scorer_rejects_unsupported_vectorizer_options(trained):
+    tfidf = trained.model.named_steps['tfidf']
+    tfidf.set_params(sublinear_tf=True)
+    try:
+        with pytest.raises(ValueError):
+            CompiledLinearScorer.from_pipeline(trained.model)
+    finally:
+        tfidf.set_params(sublinear_tf=False)
@@ -0,0 +1,63 @@
+import asyncio
+
+from app.models.online_model import OnlineLearner
+
+
+def _learner(tmp_path, monkeypatch):
+    monkeypatch.setenv("ML_ONLINE_BOOTSTRAP_EPOCHS", "1")
+    return OnlineLearner(max_delay_seconds=0.05, feedback_log=str(tmp_path / "feedback.jsonl"),
+                         shared_dir=str(tmp_path / "online-model"))
+
+
+def test_feedback_is_trained_by_one_worker_and_reloaded_by_the_others(tmp_path, monkeypatch):
+    trainer = _learner(tmp_path, monkeypatch)
+    follower = _learner(tmp_path, monkeypatch)
+
+    async def scenario():
+        trainer.ensure_ready()
+        follower.ensure_ready()
+        trainer.start()
+        await asyncio.sleep(0.1)
+        follower.start()
+        # O feedback chega ao worker que não treina; o dono lê do log compartilhado
+        pending = await follower.submit_feedback("preciso do status do chamado aberto ontem", "Produtivo")
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if follower.active.number > 1:
+                break
+        stats = trainer.stats(), follower.stats()
+        await follower.stop()
+        await trainer.stop()
+        return pending, stats
+
+    pending, (trainer_stats, follower_stats) = asyncio.run(scenario())
+
+    assert pending is None
+    assert trainer_stats["trainer"] and not follower_stats["trainer"]
+    assert trainer_stats["updates"] == 1 and follower_stats["updates"] == 0
+    assert follower_stats["active_version"] == trainer_stats["active_version"] == 2
+    # v1 (bootstrap gravado pelo primeiro worker) e v2 (treinada pelo dono)
+    assert follower_stats["reloads"] == 2
+
+
+def test_rollback_in_any_worker_reaches_the_trainer(tmp_path, monkeypatch):
+    trainer = _learner(tmp_path, monkeypatch)
+    follower = _learner(tmp_path, monkeypatch)
+
+    async def scenario():
+        trainer.ensure_ready()
+        trainer.start()
+        await trainer.submit_feedback("obrigado pela ajuda, feliz natal a todos", "Improdutivo")
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if trainer.active.number > 1:
+                break
+        follower.ensure_ready()
+        follower.rollback(1)
+        await asyncio.sleep(0.2)
+        await trainer.stop()
+
+    asyncio.run(scenario())
+
+    assert follower.active.number == 1
+    assert trainer.active.number == 1
@@ -1,22 +1,30 @@
 import asyncio
-from app.services.ai_service import ProfessionalAIService
+from app.services.ai_service import AIService
 
-async def test_ml():
-    ai = ProfessionalAIService()
-    
-    # Teste com emails que NÃO ESTÃO no treinamento
-    test_emails = [
-        "Oi, preciso resetar minha senha porque esqueci",
-        "Parabéns pelo aniversário da empresa!",
-        "O sistema está dando erro 404 na página de login",
-        "Só passando para agradecer a ajuda de vocês",
-        "Como faço para solicitar um reembolso?"
-    ]
-    
-    for email in test_emails:
+# Teste com emails que NÃO ESTÃO no treinamento
+TEST_EMAILS = [
+    "Oi, preciso resetar minha senha porque esqueci",
+    "Parabéns pelo aniversário da empresa!",
+    "O sistema está dando erro 404 na página de login",
+    "Só passando para agradecer a ajuda de vocês",
+    "Como faço para solicitar um reembolso?"
+]
+
+async def classify_samples():
+    ai = AIService()
+    results = []
+    for email in TEST_EMAILS:
         category, confidence = await ai.classify_email(email)
+        results.append((email, category, confidence))
+    return results
+
+def test_ml():
+    for email, category, confidence in asyncio.run(classify_samples()):
+        assert category in ("Produtivo", "Improdutivo")
+        assert 0.0 <= confidence <= 1.0
+
+if __name__ == "__main__":
+    for email, category, confidence in asyncio.run(classify_samples()):
         print(f"📧 '{email}'")
         print(f"   → {category} ({confidence:.2f} de confiança)")
         print()
-
-asyncio.run(test_ml())
\ No newline at end of file
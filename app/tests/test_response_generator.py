@@ -0,0 +1,55 @@
+import asyncio
+from app.services.response_generator import GENERATION_TTFT_SECONDS, ResponseGenerator, StubGeminiClient
+
+
+class FailingStreamClient(StubGeminiClient):
+    """Envia alguns trechos e cai no meio do streaming"""
+
+    async def stream(self, prompt: str):
+        yield "Olá, "
+        yield "recebemos "
+        raise ConnectionError("stream interrompido")
+
+
+def collect(generator: ResponseGenerator, text: str):
+    events = []
+
+    def on_delta(delta: str, reset: bool = False):
+        events.append((delta, reset))
+
+    response, fell_back = asyncio.run(generator.generate_with_status("Produtivo", text, on_delta=on_delta))
+    return response, fell_back, events
+
+
+def test_stream_delivers_deltas_and_ttft():
+    generator = ResponseGenerator(gemini_client=StubGeminiClient(latency_ms=20, chunk_delay_ms=1))
+    before = GENERATION_TTFT_SECONDS.count("gemini")
+
+    response, fell_back, events = collect(generator, "Preciso de ajuda com o pedido 123")
+
+    assert not fell_back
+    assert len(events) > 1 and not any(reset for _, reset in events)
+    assert "".join(delta for delta, _ in events).strip() == response
+    assert GENERATION_TTFT_SECONDS.count("gemini") == before + 1
+
+
+def test_stream_failure_after_deltas_replaces_partial_text():
+    generator = ResponseGenerator(gemini_client=FailingStreamClient())
+
+    response, fell_back, events = collect(generator, "Preciso de ajuda com o pedido 123")
+
+    assert fell_back
+    assert events[:2] == [("Olá, ", False), ("recebemos ", False)]
+    # O último evento substitui o texto parcial pela resposta de fallback
+    assert events[-1] == (response, True)
+
+
+def test_stream_timeout_after_deltas_replaces_partial_text():
+    generator = ResponseGenerator(gemini_client=StubGeminiClient(chunk_delay_ms=200))
+    generator.timeout = 0.1
+
+    response, fell_back, events = collect(generator, "Preciso de ajuda com o pedido 123")
+
+    assert fell_back
+    assert events[0][1] is False
+    assert events[-1] == (response, True)
@@ -0,0 +1,27 @@
+from app.services.result_cache import ResultCache
+
+
+def test_invalidation_reaches_other_workers(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    # Duas instâncias sobre o mesmo SQLite fazem o papel de dois workers do gunicorn
+    worker_a = ResultCache(db_path=db_path, epoch_check_interval=0)
+    worker_b = ResultCache(db_path=db_path, epoch_check_interval=0)
+    key = ResultCache.make_key("classify", "1", "texto do email")
+
+    worker_a.set(key, ["Produtivo", 0.9])
+    assert worker_b.get(key) == ["Produtivo", 0.9]
+
+    worker_a.invalidate("classify")
+    assert worker_b.get(key) is None
+    assert worker_a.get(key) is None
+
+
+def test_invalidating_all_namespaces_reaches_other_workers(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    worker_a = ResultCache(db_path=db_path, epoch_check_interval=0)
+    worker_b = ResultCache(db_path=db_path, epoch_check_interval=0)
+    key = ResultCache.make_key("response", "1", "Produtivo", "texto do email")
+
+    worker_b.set(key, "resposta")
+    worker_a.invalidate()
+    assert worker_b.get(key) is None
@@ -0,0 +1,94 @@
+"""Prazo fim a fim por job, com registro das degradações aplicadas para cumpri-lo.
+
+Como o trace, o prazo ativo fica em um ContextVar: extração, classificação e
+geração consultam o orçamento restante sem recebê-lo como parâmetro. Sem prazo
+ativo, remaining_budget() devolve só o limite do próprio estágio e
+record_degradation() não faz nada.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+
+from app.utils.metrics import metrics
+from app.utils.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+DEGRADATIONS = metrics.counter(
+    "email_deadline_degradations_total", "Backends trocados por um mais rápido para cumprir o prazo do job",
+    ("stage", "from_backend", "to_backend")
+)
+
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("job_deadline", default=None)
+
+
+class Deadline:
+    def __init__(self, seconds: float, started_at: Optional[float] = None):
+        self.budget = seconds
+        # started_at em tempo de parede (criação do job): a espera na fila consome o prazo
+        waited = max(0.0, time.time() - started_at) if started_at else 0.0
+        self.expires_at = time.monotonic() + seconds - waited
+        self.degradations: List[dict] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def degrade(self, stage: str, from_backend: str, to_backend: str, reason: str):
+        self.degradations.append({
+            "stage": stage,
+            "from": from_backend,
+            "to": to_backend,
+            "reason": reason,
+            "remaining_ms": round(self.remaining() * 1000, 1),
+        })
+        DEGRADATIONS.inc(stage, from_backend, to_backend)
+        annotate(degraded_to=to_backend, degraded_reason=reason)
+        logger.info(f"⏳ {stage}: {from_backend} → {to_backend} ({reason}, {self.remaining() * 1000:.0f} ms restantes)")
+
+
+def start_deadline(seconds: float, started_at: Optional[float] = None) -> Deadline:
+    """Cria um prazo e o torna ativo no contexto atual (task do job)"""
+    deadline = Deadline(seconds, started_at)
+    _current_deadline.set(deadline)
+    return deadline
+
+
+def end_deadline():
+    """Desativa o prazo (as tasks do scheduler são reaproveitadas entre jobs)"""
+    _current_deadline.set(None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining_budget(limit: Optional[float] = None) -> Optional[float]:
+    """Tempo disponível para um estágio: o menor entre o limite dele e o que resta do prazo"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return limit
+    remaining = deadline.remaining()
+    return min(limit, remaining) if limit else remaining
+
+
+def has_budget(min_seconds: float) -> bool:
+    """Se ainda resta pelo menos min_seconds (sempre True sem prazo ativo)"""
+    deadline = _current_deadline.get()
+    return deadline is None or deadline.remaining() >= min_seconds
+
+
+def degradation_count() -> int:
+    """Degradações já registradas no prazo ativo (para saber se um resultado saiu degradado)"""
+    deadline = _current_deadline.get()
+    return len(deadline.degradations) if deadline is not None else 0
+
+
+def record_degradation(stage: str, from_backend: str, to_backend: str, reason: str = "deadline"):
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.degrade(stage, from_backend, to_backend, reason)
@@ -0,0 +1,151 @@
+import io
+import logging
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Optional, Union
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv('UPLOAD_SPOOL_MEMORY_BYTES', str(1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Upload excedeu o limite configurado"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Arquivo excede o limite de {limit} bytes")
+        self.limit = limit
+
+
+class SpooledUpload:
+    """Upload mantido em memória até um limite e depois em arquivo temporário nomeado.
+
+    O caminho em disco permite que o pool de PDF abra o arquivo diretamente,
+    sem copiar os bytes entre processos.
+    """
+
+    def __init__(self, memory_limit: int = UPLOAD_SPOOL_MEMORY_BYTES):
+        self.memory_limit = memory_limit
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer: Optional[io.BytesIO] = io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+
+    def write(self, chunk: bytes):
+        if self._file is None and self.size + len(chunk) > self.memory_limit:
+            self._rollover()
+
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer.write(chunk)
+        self.size += len(chunk)
+
+    def _rollover(self):
+        self._file = tempfile.NamedTemporaryFile(prefix="upload-", delete=False, dir=os.getenv('UPLOAD_TMP_DIR'))
+        self.path = self._file.name
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def finish(self):
+        """Finaliza a escrita; o conteúdo passa a ser só leitura"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def open(self) -> BinaryIO:
+        """Abre um handle de leitura (arquivo em disco ou buffer pequeno em memória)"""
+        if self.path is not None:
+            return open(self.path, 'rb')
+        return io.BytesIO(self._buffer.getbuffer())
+
+    def source(self) -> Union[str, bytes]:
+        """Caminho do arquivo em disco, ou os bytes quando o upload é pequeno"""
+        return self.path if self.path is not None else self._buffer.getvalue()
+
+    def close(self):
+        self.finish()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._buffer = None
+
+
+async def spool_upload(upload_file, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """Copia o UploadFile em blocos, aplicando o limite durante a leitura"""
+    spooled = SpooledUpload()
+    try:
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if spooled.size + len(chunk) > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            spooled.write(chunk)
+        spooled.finish()
+        return spooled
+    except BaseException:
+        spooled.close()
+        raise
+
+
+class UploadLimitMiddleware:
+    """Middleware ASGI que conta os bytes do corpo enquanto ele é recebido.
+
+    O Starlette lê o multipart inteiro antes do endpoint rodar, então o limite
+    do spool_upload só vale depois do upload completo. Aqui o corpo é cortado
+    assim que passa do limite, inclusive em uploads chunked sem Content-Length.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # Content-Length acima do limite: recusa antes de ler o corpo
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLargeError(self.max_bytes)
+            return message
+
+        async def guarded_send(message):
+            # O FastAPI converte o erro de leitura em 400; a resposta dele é descartada
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLargeError:
+            if not exceeded:
+                raise
+        if exceeded:
+            logger.warning(f"⚠️ Upload recusado durante a leitura: mais de {self.max_bytes} bytes")
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": f"Arquivo excede o limite de {MAX_UPLOAD_BYTES} bytes"})
+        await response(scope, receive, send)
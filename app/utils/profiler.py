@@ -0,0 +1,142 @@
+"""Profiler por amostragem e monitor de lag do event loop.
+
+Ambos usam sys._current_frames() a partir de uma thread separada: não instrumentam
+chamadas (ao contrário do cProfile), então o custo é proporcional à taxa de amostragem.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    "email_event_loop_lag_seconds", "Atraso do event loop medido pelo heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Amostra as pilhas de todas as threads e agrega no formato "collapsed" (flamegraph.pl / speedscope)"""
+
+    def __init__(self, interval_ms: float = 5.0):
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float) -> str:
+        """Bloqueia a thread chamadora por `seconds`; chame via executor"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Já existe um profiling em andamento")
+        try:
+            stacks = Counter()
+            own_thread = threading.get_ident()
+            names = {}
+            deadline = time.monotonic() + seconds
+            samples = 0
+
+            while time.monotonic() < deadline:
+                names.update({thread.ident: thread.name for thread in threading.enumerate()})
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(self.interval)
+
+            logger.info(f"🔬 Profiling concluído: {samples} amostras, {len(stacks)} pilhas distintas")
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+
+class LoopLagMonitor:
+    """Detecta o event loop bloqueado e registra a pilha da chamada que o bloqueou.
+
+    Uma task no loop atualiza um heartbeat a cada `interval`; uma thread watchdog
+    verifica o heartbeat e, se ele atrasar mais que `threshold`, loga a pilha
+    atual da thread do loop (uma vez por bloqueio).
+    """
+
+    def __init__(self, threshold_ms: float = 200, interval_ms: float = 50):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._stats = {"stalls": 0, "max_lag_ms": 0.0}
+
+    def start(self):
+        if self._task is not None or not self.threshold:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"🐢 Monitor de lag do event loop ativo (limite {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            self._stats["max_lag_ms"] = max(self._stats["max_lag_ms"], lag * 1000)
+            self._last_beat = now
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or beat == reported_beat:
+                continue
+
+            reported_beat = beat
+            self._stats["stalls"] += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)[-12:]) if frame is not None else "(pilha indisponível)"
+            logger.warning(f"🐢 Event loop bloqueado há {blocked * 1000:.0f} ms em:\n{stack}")
+
+    def stats(self) -> dict:
+        return {"threshold_ms": self.threshold * 1000, **self._stats}
+
+
+# Instâncias globais
+sampling_profiler = SamplingProfiler(float(os.getenv('PROFILER_INTERVAL_MS', '5')))
+loop_lag_monitor = LoopLagMonitor(
+    threshold_ms=float(os.getenv('LOOP_LAG_THRESHOLD_MS', '200')),
+    interval_ms=float(os.getenv('LOOP_LAG_INTERVAL_MS', '50'))
+)
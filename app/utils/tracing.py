@@ -0,0 +1,90 @@
+"""Linha do tempo leve por job (spans com início, duração e atributos).
+
+O trace ativo fica em um ContextVar, então serviços chamados pelo job podem
+anotar o span corrente (p.ex. qual backend respondeu) sem receber o trace como
+parâmetro. Sem trace ativo, span() e annotate() não fazem nada.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+_current_trace: ContextVar[Optional["JobTrace"]] = ContextVar("job_trace", default=None)
+_current_span: ContextVar[Optional[dict]] = ContextVar("job_span", default=None)
+
+
+class JobTrace:
+    def __init__(self, job_id: str, started_at: Optional[float] = None):
+        self.job_id = job_id
+        # Referência em tempo de parede para incluir a espera na fila (criação do job)
+        self.started_wall = started_at or time.time()
+        self._offset = time.perf_counter() - (time.time() - self.started_wall)
+        self.spans: List[dict] = []
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self._offset) * 1000
+
+    def add_span(self, name: str, start_ms: float, end_ms: float, **attrs) -> dict:
+        span = {"name": name, "start_ms": round(start_ms, 3), "duration_ms": round(end_ms - start_ms, 3)}
+        if attrs:
+            span["attrs"] = attrs
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        span = {"name": name, "start_ms": round(self._now_ms(), 3), "duration_ms": None, "attrs": attrs}
+        self.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["attrs"]["error"] = type(e).__name__
+            raise
+        finally:
+            span["duration_ms"] = round(self._now_ms() - span["start_ms"], 3)
+            if not span["attrs"]:
+                del span["attrs"]
+            _current_span.reset(token)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "started_at": self.started_wall,
+            "total_ms": round(self._now_ms(), 3),
+            "spans": self.spans,
+        }
+
+
+def start_trace(job_id: str, started_at: Optional[float] = None) -> JobTrace:
+    """Cria um trace e o torna ativo no contexto atual (task do job)"""
+    trace = JobTrace(job_id, started_at)
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Desativa o trace (as tasks do scheduler são reaproveitadas entre jobs)"""
+    _current_trace.set(None)
+    _current_span.set(None)
+
+
+def current_trace() -> Optional[JobTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attrs) as current:
+        yield current
+
+
+def annotate(**attrs):
+    """Adiciona atributos ao span corrente, se houver"""
+    current = _current_span.get()
+    if current is not None:
+        current.setdefault("attrs", {}).update(attrs)
@@ -0,0 +1,20 @@
+"""Configuração do gunicorn (lida automaticamente a partir do diretório de trabalho)"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# PRELOAD_MODELS=true carrega a aplicação (e o modelo) no master antes do fork,
+# para que os workers compartilhem essas páginas via copy-on-write
+preload_app = os.getenv('PRELOAD_MODELS', 'false').lower() == 'true'
+
+
+def when_ready(server):
+    if preload_app:
+        # Move os objetos já carregados para a geração permanente: o GC dos workers
+        # não toca nesses objetos e as páginas continuam compartilhadas
+        gc.freeze()
+        server.log.info("Aplicação pré-carregada no master; objetos congelados para o GC")